@@ -0,0 +1,208 @@
+"""
+Deterministic offline stand-in for the Gemini models used by the knowledge agents.
+
+FakeLlm replays canned responses with configurable artificial latency, so the
+whole /api/agent/query pipeline can be exercised and benchmarked without
+network access. Enable it with AGENT_MODEL_BACKEND=fake. It can also inject
+faults (transient errors and latency spikes) to exercise the resilience layer.
+"""
+from typing import Any, AsyncGenerator, Dict, List, Optional
+import asyncio
+import json
+import random
+import re
+
+from google.adk.models import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+# Model name reported to ADK. It must look like a Gemini 2 model, otherwise the
+# google_search tool refuses to attach itself to the finder agent's requests.
+FAKE_MODEL_NAME = "gemini-2.0-fake"
+
+# Tools the content agent calls, in order, before giving its final answer
+CONTENT_AGENT_STEPS = ["finder_agent", "get_fact_sources", "organizer_agent"]
+
+_HEADING_PATTERN = re.compile(r"^#+\s*(.+?)\s*$")
+_BULLET_PATTERN = re.compile(r"^\s*[-*]\s+(.+)$")
+
+
+class FakeModelError(Exception):
+    """
+    Transient error injected by FakeLlm, shaped like a Gemini 503 response
+    """
+    code = 503
+
+
+def _request_text(llm_request: LlmRequest) -> str:
+    """Text of the most recent user message in a request"""
+    for content in reversed(llm_request.contents):
+        if content.role != "user":
+            continue
+        texts = [part.text for part in content.parts or [] if part.text]
+        if texts:
+            return "\n".join(texts)
+    return ""
+
+
+def default_finder_response(query: str) -> str:
+    """
+    Canned finder_agent answer for a query, in the format the real prompt asks for
+    """
+    slug = re.sub(r"[^a-z0-9]+", "-", query.lower()).strip("-") or "topic"
+    return (
+        f"## Overview\n"
+        f"{query} is summarized here from several trusted sources. "
+        f"This section gives the background needed to understand {query}.\n\n"
+        f"## Key Points\n"
+        f"- The **first** key point about {query}.\n"
+        f"- The second key point about {query}.\n"
+        f"- The third key point about {query}.\n\n"
+        f"## Recent Developments\n"
+        f"Recent work on {query} continues to evolve.\n\n"
+        f"References:\n"
+        f"Title: Understanding {query} | Source: Nature | Link: https://www.nature.com/articles/{slug} | Year: 2024\n"
+        f"Title: A practical guide to {query} | Source: MIT Technology Review | Link: https://www.technologyreview.com/{slug}/ | Year: 2023\n"
+        f"Title: {query} explained | Source: BBC News | Link: https://www.bbc.com/news/{slug} | Year: 2024\n"
+    )
+
+
+def default_organizer_response(content: str) -> str:
+    """
+    Canned organizer_agent answer: headings end with a colon and lists use bullets
+    """
+    lines = []
+    for line in content.splitlines():
+        heading = _HEADING_PATTERN.match(line)
+        bullet = _BULLET_PATTERN.match(line)
+        if heading:
+            lines.append(f"{heading.group(1).rstrip(':')}:")
+        elif bullet:
+            lines.append(f"• {bullet.group(1)}")
+        else:
+            lines.append(line)
+    return "\n".join(lines).replace("*", "").replace("#", "")
+
+
+class FakeLlm(BaseLlm):
+    """
+    Offline model that plays the part of one of the knowledge agents
+
+    Attributes:
+        role: Name of the agent this model backs ("finder_agent",
+            "organizer_agent" or "sources_agent")
+        latency: Seconds to wait before each response
+        jitter: Maximum extra seconds added to the latency, drawn from a seeded RNG
+        responses: Canned finder answers keyed by lowercased query
+        failure_rate: Fraction of calls failing with FakeModelError
+        slow_rate: Fraction of calls taking slow_latency extra seconds
+        slow_latency: Extra seconds of a slow call
+    """
+    model: str = FAKE_MODEL_NAME
+    role: str = "sources_agent"
+    latency: float = 0.0
+    jitter: float = 0.0
+    seed: int = 0
+    responses: Dict[str, str] = {}
+    failure_rate: float = 0.0
+    slow_rate: float = 0.0
+    slow_latency: float = 0.0
+    calls: int = 0
+
+    def _rng(self) -> random.Random:
+        # Seeding on the call count keeps the delay and fault sequences reproducible
+        return random.Random(self.seed * 1_000_003 + self.calls)
+
+    def _delay(self) -> float:
+        rng = self._rng()
+        delay = self.latency + (rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if self.slow_rate and rng.random() < self.slow_rate:
+            delay += self.slow_latency
+        return delay
+
+    def _fails(self) -> bool:
+        # A separate stream so injecting faults doesn't change the latencies
+        return bool(self.failure_rate) and random.Random(f"fault-{self.seed}-{self.calls}").random() < self.failure_rate
+
+    def _content_agent_step(self, llm_request: LlmRequest) -> types.Part:
+        """Call the next tool in the content agent's sequence, then finish"""
+        responses = [
+            part.function_response
+            for content in llm_request.contents
+            for part in content.parts or []
+            if part.function_response
+        ]
+        if len(responses) >= len(CONTENT_AGENT_STEPS):
+            return types.Part(text="Done.")
+
+        step = CONTENT_AGENT_STEPS[len(responses)]
+        if step == "get_fact_sources":
+            args: Dict[str, Any] = {}
+        elif step == "organizer_agent":
+            previous = (responses[-1].response or {}).get("result", "") if responses else ""
+            args = {"request": previous if isinstance(previous, str) else json.dumps(previous)}
+        else:
+            args = {"request": _request_text(llm_request)}
+        return types.Part(function_call=types.FunctionCall(name=step, args=args))
+
+    def _answer(self, llm_request: LlmRequest) -> types.Part:
+        text = _request_text(llm_request)
+        if self.role == "finder_agent":
+            return types.Part(text=self.responses.get(text.strip().lower()) or default_finder_response(text.strip()))
+        if self.role == "organizer_agent":
+            return types.Part(text=default_organizer_response(text))
+        return self._content_agent_step(llm_request)
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        delay = self._delay()
+        fails = self._fails()
+        self.calls += 1
+        if delay:
+            await asyncio.sleep(delay)
+        if fails:
+            raise FakeModelError(f"Injected failure from the fake {self.role} model")
+        yield LlmResponse(content=types.Content(role="model", parts=[self._answer(llm_request)]))
+
+
+def load_canned_responses(path: Optional[str]) -> Dict[str, str]:
+    """
+    Load canned finder answers from a JSON file mapping queries to answers
+    """
+    if not path:
+        return {}
+    with open(path, encoding="utf-8") as responses_file:
+        return {query.strip().lower(): answer for query, answer in json.load(responses_file).items()}
+
+
+def build_fake_models(
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    seed: int = 0,
+    responses: Optional[Dict[str, str]] = None,
+    failure_rate: float = 0.0,
+    slow_rate: float = 0.0,
+    slow_latency: float = 0.0
+) -> Dict[str, FakeLlm]:
+    """
+    Build fake models for every knowledge agent, for use with build_knowledge_agent(models=...)
+
+    Args:
+        latency: Seconds each model call takes
+        jitter: Maximum extra seconds added to each call
+        seed: Seed for the jitter RNG
+        responses: Canned finder answers keyed by query
+        failure_rate: Fraction of calls failing with a transient error
+        slow_rate: Fraction of calls taking slow_latency extra seconds
+        slow_latency: Extra seconds of a slow call
+    """
+    roles: List[str] = ["finder_agent", "organizer_agent", "sources_agent"]
+    return {
+        role: FakeLlm(
+            role=role, latency=latency, jitter=jitter, seed=seed + index, responses=responses or {},
+            failure_rate=failure_rate, slow_rate=slow_rate, slow_latency=slow_latency
+        )
+        for index, role in enumerate(roles)
+    }
@@ -3,165 +3,194 @@ from google.adk.tools import google_search, agent_tool
 from google.adk.models.lite_llm import LiteLlm
 from google.adk.sessions import InMemorySessionService
 from dotenv import load_dotenv
-from google.adk.runners import Runner
+from google.adk.models import BaseLlm
 from google.genai import types
+from loguru import logger
 from app.utils.content_processor import process_content
-from typing import Dict, Any, List, Optional, Union
+from app.utils.answer_cache import answer_cache, cache_key
+from app.utils.single_flight import SingleFlight
+from app.utils.admission import AdmissionRejected, admission_controller
+from app.utils.metrics import metrics
+from app.utils.tracing import traced, tracer
+from app.utils.log import log_payload, truncate
+from app.utils.source_dedup import SourceIndex
+from app.utils.sources import Source
+from app.utils.config import settings
+from app.agents.runner_pool import RunnerPool
+from app.agents.resilient_llm import CircuitOpenError, open_circuit_retry_after, resilient
+from app.agents.retrieval import past_answers
+from app.agents.research import AgentResearchBackend, FakeResearchBackend, ResearchBackend, run_research, split_finder_output
+from typing import AsyncGenerator, Callable, Dict, Any, List, Optional, Tuple, Union
+from contextlib import aclosing, suppress
+from contextvars import ContextVar
 from datetime import datetime
+import asyncio
+import time
+import uuid
 
 load_dotenv()
 
-# Global state for testing and development
+# Default identifiers used when a query is not tied to a specific user
 APP_NAME = "app-01"
 USER_ID = "hitesh-01"
-SESSION_ID = "session-01"
 
-# Global state for testing and development
+# Every pipeline run gets its own ADK session so that concurrent queries never
+# share state. The (user_id, session_id) pair of the run in progress is kept in a
+# context variable: tools like get_fact_sources execute inside the caller's task,
+# so they resolve to the right session without any module-level shared state.
+# stream_knowledge_pipeline runs each pipeline in its own task, so the binding
+# never leaks into the context of whoever consumes the pipeline's events.
+_current_session: ContextVar[Optional[Tuple[str, str]]] = ContextVar("current_session", default=None)
 
-_global_state = {
-    "topic": "",
-    "content": "",
-    "formatted_content": "",
-    "organized_content": "",
-    "sources": []
-}
+# Per-session mirror of the state values, used as a fallback when the ADK
+# session cannot be reached. Entries are removed together with the session.
+_session_state: Dict[str, Dict[str, Any]] = {}
 
 # Initialize the session service for compatibility with ADK
 session_service = InMemorySessionService()
 
-# Initialize _session as None - we'll create it when first needed via get_global_session()
-_session = None
 
-# Define a function to create a fresh session with current state
-async def create_fresh_session():
-    """Create a fresh session with the current global state"""
-    global _session
+def _initial_state() -> Dict[str, Any]:
+    """Build the initial state for a new pipeline session"""
+    return {
+        "topic": "",
+        "content": "",
+        "formatted_content": "",
+        "organized_content": "",
+        "sources": []
+    }
+
+
+def _get_session_scope() -> Tuple[str, str]:
+    """Get the (user_id, session_id) pair of the pipeline run in progress"""
+    scope = _current_session.get()
+    if scope is None:
+        raise RuntimeError("No agent session is active. Use create_fresh_session() before accessing state.")
+    return scope
+
+
+async def create_fresh_session(user_id: Optional[str] = None) -> Tuple[str, str]:
+    """
+    Create a new, isolated session for a single pipeline run and bind it to the
+    current task.
+
+    Args:
+        user_id: The user the session belongs to, defaults to USER_ID
+
+    Returns:
+        The (user_id, session_id) pair of the new session
+    """
+    user_id = user_id or USER_ID
+    session_id = f"session-{uuid.uuid4().hex}"
+    state = _initial_state()
+
+    await session_service.create_session(
+        app_name=APP_NAME,
+        user_id=user_id,
+        session_id=session_id,
+        state=dict(state)  # Use a copy to avoid mutation issues
+    )
+    _session_state[session_id] = state
+    _current_session.set((user_id, session_id))
+    logger.debug(f"Fresh session {session_id} created for user {user_id}")
+    return user_id, session_id
+
+
+async def close_session(user_id: str, session_id: str) -> None:
+    """
+    Remove a pipeline session and its fallback state once the run is complete.
+
+    Args:
+        user_id: The user the session belongs to
+        session_id: The session to remove
+    """
+    _session_state.pop(session_id, None)
     try:
-        # Create a fresh session with current global state
-        _session = await session_service.create_session(
-            app_name=APP_NAME,
-            user_id=USER_ID,
-            session_id=SESSION_ID,
-            state=dict(_global_state)  # Use a copy to avoid mutation issues
-        )
-        print("Fresh session created successfully")
-        print(f"freshly created session is: {_session}")
-        return None
+        await session_service.delete_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+        # Drop the per-user bucket as well so long-running workers don't accumulate empty entries
+        user_sessions = session_service.sessions.get(APP_NAME, {})
+        if not user_sessions.get(user_id):
+            user_sessions.pop(user_id, None)
     except Exception as e:
-        print(f"Error creating fresh session: {e}")
-        return None
+        logger.warning(f"Error deleting session {session_id}: {e}")
 
-# Ensure session is created or recreated when needed
-async def get_global_session():
-    """Get or recreate the global session if needed"""
-    print("get global session request received successfully!")
-    session = session_service.sessions[APP_NAME][USER_ID][SESSION_ID]
-    print(f"retrieved session is: {session}")
 
-    if not session:
-        print("Using memory-only fallback")
-        return _session
-    
-    return session  # Return the global session reference
+async def get_current_session():
+    """Get the storage session of the pipeline run in progress"""
+    user_id, session_id = _get_session_scope()
+    return session_service.sessions.get(APP_NAME, {}).get(user_id, {}).get(session_id)
+
 
 async def set_state_value(key: str, value: Any):
-    """Set a value in session state"""
-    # Declare global _session at the beginning of the function
-    global _session
-    
-    print(f"Setting state value for key '{key}': {value}")
-    
-    # Always update our global state first for reliability
-    _global_state[key] = value
-    
+    """Set a value in the current session state"""
+    user_id, session_id = _get_session_scope()
+
+    # Always update the fallback state first for reliability
+    _session_state.setdefault(session_id, _initial_state())[key] = value
+
     # Then try to update the session state
     try:
-        # If no session exists or we can't access it, create a new one
-        session = await get_global_session()
+        session = await get_current_session()
 
         # Update the state value in the session
         if session is not None:
             session.state[key] = value
-            _session.state[key] = value
-            print(f"Successfully updated state in session for key: {key}")
         else:
-            print(f"Warning: Failed to access session, using global state only for key: {key}")
-            
+            logger.warning(f"Failed to access session {session_id}, using fallback state only for key: {key}")
+
     except Exception as e:
-        print(f"Error updating session state: {e}")
-        print(f"Using global state fallback for key: {key}")
+        logger.warning(f"Error updating session state, using fallback state for key {key}: {e}")
 
 async def get_state_value(key: str):
-    """Get a value from session state"""
-    # Declare global _session at the beginning of the function
-    global _session
-    
+    """Get a value from the current session state"""
+    user_id, session_id = _get_session_scope()
+    fallback_state = _session_state.setdefault(session_id, _initial_state())
+
     # First try to get from session
     try:
-        session = await get_global_session()
-        
+        session = await get_current_session()
+
         # Try to get the value from the session
         if session is not None and key in session.state:
             value = session.state.get(key)
-            print(f"Retrieved value for key '{key}' from session")
-            
-            # Always sync with global state for consistency and fallback
-            _global_state[key] = value
+
+            # Always sync with the fallback state for consistency
+            fallback_state[key] = value
             return value
     except Exception as e:
-        print(f"Error getting value from session state: {e}")
-    
+        logger.warning(f"Error getting value from session state: {e}")
 
+    return fallback_state.get(key)
 
-async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
+
+async def get_fact_sources() -> Dict[str, str]:
     """
     Process search results into formatted sources with enhanced four-part reference support.
     
     This function accesses the search_results directly from the session state,
-    extracts four-part citations (Title, Source, Link, Year) and formats them as sources.
+    extracts four-part citations (Title, Source, Link, Year) and stores them in the
+    session state as a list of Source.
     
     Returns:
-        Dictionary with "result" key containing formatted sources list
+        Dictionary with "result" key containing the extracted content
     """
     
     # Get search_results from session state
     search_results = await get_state_value("search_results")
     
-    print(f"Processing search_results from state: {search_results}")
+    logger.debug(f"Processing {len(search_results) if search_results else 0} chars of search results")
+    log_payload("search_results", search_results)
     
     sourceList = []
     content_text = ""
     seen_urls = set()  # Track URLs to prevent duplicates
-    seen_titles = set()  # Track titles to prevent duplicates
-    
-    def is_duplicate_source(new_source, existing_sources):
-        """Check if a source is duplicate based on URL or title similarity."""
-        new_url = new_source.get("link", "").lower().strip()
-        new_title = new_source.get("title", "").lower().strip()
-        
-        for existing in existing_sources:
-            existing_url = existing.get("link", "").lower().strip()
-            existing_title = existing.get("title", "").lower().strip()
-            
-            # Check URL match
-            if new_url and existing_url and new_url == existing_url:
-                return True
-            
-            # Check title similarity (allowing for minor differences)
-            if new_title and existing_title and len(new_title) > 10:
-                # Simple similarity check - if 80% of words match
-                new_words = set(new_title.split())
-                existing_words = set(existing_title.split())
-                if len(new_words & existing_words) / max(len(new_words), len(existing_words)) > 0.8:
-                    return True
-        
-        return False
+    source_index = SourceIndex(title_similarity=settings.SOURCE_TITLE_SIMILARITY)  # Accepted sources, by URL and title
     
-    def validate_source(source):
+    def validate_source(source: Source):
         """Validate that a source has meaningful content and valid URL."""
-        title = source.get("title", "").strip()
-        link = source.get("link", "").strip()
-        source_name = source.get("source", "").strip()
+        title = source.title.strip()
+        link = source.link.strip()
+        source_name = source.source.strip()
         
         # Must have title and either a valid URL or source name
         if not title:
@@ -191,41 +220,22 @@ async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
         if isinstance(search_results, str):
             # Process the search results
             result = ContentProcessor.extract_content_and_references(search_results)
-            print(f"The result from ContentProcessor is: {result}")
+            log_payload("ContentProcessor result", result)
             content_text = result["content"]
             
             # Store the content in state for later use
             if content_text:
                 await set_state_value("content", content_text)
-                stored_content = await get_state_value("content")
-                print(f"Stored {len(stored_content)} characters of content in session state")
+                logger.debug(f"Stored {len(content_text)} characters of content in session state")
             
-            # Convert references to source list format with validation and deduplication
+            # Keep the references that are valid and not duplicates
             for ref in result["references"]:
-                # Extract the four essential fields only
-                title = ref.get("title", "") or "Referenced Source"
-                link = ref.get("link", "") 
-                source = ref.get("source", "") or "Source"
-                year = ref.get("year", "") or str(datetime.now().year)
-                
-                # Create snippet for display purposes
-                snippet = f"Title: {title} | Source: {source} | Published: {year}"
-                
-                new_source = {
-                    "title": title,
-                    "source": source,
-                    "link": link,
-                    "year": year
-                }
-                
-                # Validate and check for duplicates
-                if validate_source(new_source) and not is_duplicate_source(new_source, sourceList):
-                    sourceList.append(new_source)
-                    print(f"Added valid source: {title} from {source}")
+                if validate_source(ref) and source_index.add_source_if_new(ref):
+                    sourceList.append(ref)
                 else:
-                    print(f"Skipped invalid or duplicate source: {title}")
+                    logger.debug(f"Skipped invalid or duplicate source: {truncate(ref.title, 120)}")
             
-            print(f"sources list after validation and deduplication: {sourceList}")
+            log_payload("sources after validation and deduplication", sourceList)
                 
             # If no references were extracted but we found URLs in the content, create sources from them
             if not sourceList and content_text:
@@ -243,20 +253,10 @@ async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
                     
                     for i, url in enumerate(unique_urls, 1):
                         domain = url.split("//")[-1].split("/")[0]
-                        sourceList.append({
-                            "title": f"Source {i} - {domain}",
-                            "source": domain,
-                            "link": url,
-                            "year": "2025"
-                        })
+                        sourceList.append(Source(f"Source {i} - {domain}", domain, url, "2025"))
                 else:
                     # No references found but we have content, create a generic source
-                    sourceList.append({
-                        "title": "Information Source",
-                        "source": "Knowledge Base",
-                        "link": "",
-                        "year": str(datetime.now().year)
-                    })
+                    sourceList.append(Source("Information Source", "Knowledge Base", "", str(datetime.now().year)))
                 
         elif isinstance(search_results, dict) and "organic_results" in search_results:
             # Case: Direct search results from google_search tool
@@ -271,15 +271,10 @@ async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
                 # Generate domain name as author
                 domain = link.split("//")[-1].split("/")[0] if link else "Unknown Source"
                 
-                new_source = {
-                    "title": title,
-                    "source": domain,
-                    "link": link,
-                    "year": "2025"
-                }
+                new_source = Source(title, domain, link, "2025")
                 
                 # Validate and check for duplicates
-                if validate_source(new_source) and not is_duplicate_source(new_source, sourceList):
+                if validate_source(new_source) and source_index.add_source_if_new(new_source):
                     sourceList.append(new_source)
                 
         elif isinstance(search_results, dict) and "finder_agent_response" in search_results:
@@ -289,22 +284,17 @@ async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
                 result = search_results["finder_agent_response"]["result"]
                 await set_state_value("search_results", result)
 
-                return get_fact_sources()
+                return await get_fact_sources()
         
         else:
             # Fallback for unexpected formats
-            print(f"Unexpected search_results format: {type(search_results)}")
+            logger.warning(f"Unexpected search_results format: {type(search_results)}")
             
             # If we have any content in the state, use that to generate a source
             existing_content = await get_state_value("content") 
             if existing_content:
                 content_text = existing_content
-                sourceList.append({
-                    "title": "Information Source",
-                    "source": "Knowledge Base",
-                    "link": "",
-                    "year": str(datetime.now().year)
-                })
+                sourceList.append(Source("Information Source", "Knowledge Base", "", str(datetime.now().year)))
             else:
                 # Try to extract any string content to use as content
                 if isinstance(search_results, dict):
@@ -318,27 +308,15 @@ async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
                     content_text = "Information on the requested topic"
                 
                 # Create a generic source
-                sourceList.append({
-                    "title": "Information Source",
-                    "source": "Knowledge Base",
-                    "link": "",
-                    "year": str(datetime.now().year)
-                })
+                sourceList.append(Source("Information Source", "Knowledge Base", "", str(datetime.now().year)))
                 
                 await set_state_value("content", content_text)
                 
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error processing sources: {e}\n{error_trace}")
+        logger.exception(f"Error processing sources: {e}")
         
         # Return a dummy source in case of errors
-        sourceList.append({
-            "title": "Error processing sources",
-            "source": "System",
-            "link": "",
-            "year": str(datetime.now().year)
-        })
+        sourceList.append(Source("Error processing sources", "System", "", str(datetime.now().year)))
     
     # If we still have no sources, create a default source
     if len(sourceList) == 0:
@@ -346,20 +324,12 @@ async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
         topic = await get_state_value("topic") or "this topic"
         
         # Create a more informative default source
-        sourceList.append({
-            "title": f"Information about {topic}",
-            "source": "ArtiCube",
-            "link": "",
-            "year": "2025"
-        })
+        sourceList.append(Source(f"Information about {topic}", "ArtiCube", "", "2025"))
     
-    print(f"Extracted {len(sourceList)} unique, validated sources")
+    logger.debug(f"Extracted {len(sourceList)} unique, validated sources")
     
     # Store the sources in global state
     await set_state_value("sources", sourceList)
-    sources_list = await get_state_value("sources")
-    print(f"Stored {len(sourceList)} sources in global state")
-    print(f"retrieved sources list after state update: {sources_list}")
     
     # Always return a properly formatted result
     return {
@@ -367,13 +337,9 @@ async def get_fact_sources() -> Dict[str, List[Dict[str, str]]]:
     }
 
 
-# Agents
+# Agent instructions
 
-finder_agent = LlmAgent(
-    name="finder_agent",
-    model="gemini-2.0-flash-exp",
-    description="Agent for fetching true, accurate and comprehensive information for a given query.",
-    instruction="""
+FINDER_INSTRUCTION = """
     You are an expert researcher who finds true and accurate information on any topic from the most trusted and respected sources.
     
     1. Always use the google_search tool to search for true, accurate and comprehensive information on the given topic.
@@ -407,16 +373,9 @@ finder_agent = LlmAgent(
     - Prioritize authoritative sources (academic institutions, government sites, reputable news organizations)
     
     Output the search results into the state. Your output is used by downstream agents, so proper formatting is critical.
-    """,
-    tools=[google_search],
-    output_key="search_results"  # This will store both content and references in state
-)
+    """
 
-organizer_agent = LlmAgent(
-    name="organizer_agent",
-    model="gemini-2.0-flash-exp",
-    description="Agent that organizes content into a user friendly readable structure.",
-    instruction="""
+ORGANIZER_INSTRUCTION = """
     You are an expert content organizer who structures information for maximum readability and comprehension.
     
     CORE OBJECTIVES:
@@ -473,15 +432,9 @@ organizer_agent = LlmAgent(
     • Maintains all factual content from the source
     • Flows logically from section to section
     • Is easily scannable and readable
-    """,
-    output_key="organized_content"
-)
+    """
 
-content_agent = LlmAgent(
-    name="sources_agent",
-    model="gemini-2.0-flash-exp",
-    description="Agent for fetching the content for the given query",
-    instruction="""You are an expert at organizing the content for a given topic.
+CONTENT_INSTRUCTION = """You are an expert at organizing the content for a given topic.
     
     1. Call the 'finder_agent' tool to get search results for that topic.
     2. Call the 'get_fact_sources' function WITHOUT ANY ARGUMENTS. 
@@ -489,20 +442,502 @@ content_agent = LlmAgent(
     3. The 'get_fact_sources' function will return a dictionary with a 'result' value.
     4. Take that 'result' value and call the 'organizer_agent' tool with the value. This 'organizer_agent' will organize the content and stores it in state.
     
-    DO NOT modify the content or add any commentary.""",
-    tools=[agent_tool.AgentTool(agent=finder_agent), get_fact_sources, agent_tool.AgentTool(agent=organizer_agent)]
-)
+    DO NOT modify the content or add any commentary."""
+
+
+# Agents
 
-knowledge_agent = SequentialAgent(
-    name="knowledge_agent",
-    sub_agents=[content_agent],
-    description="An agent to extract the true and accurate knowledge for a given topic."
+def build_finder_agent(model: Union[str, BaseLlm, None] = None) -> LlmAgent:
+    """
+    Build a finder agent, which searches the web and writes an answer with references
+    
+    Args:
+        model: Model override, defaults to settings.AGENT_MODEL
+    """
+    return LlmAgent(
+        name="finder_agent",
+        model=resilient(model or settings.AGENT_MODEL, "finder_agent"),
+        description="Agent for fetching true, accurate and comprehensive information for a given query.",
+        instruction=FINDER_INSTRUCTION,
+        tools=[google_search],
+        output_key="search_results"  # This will store both content and references in state
+    )
+
+
+async def _retrieval_before_tool(tool, args: Dict[str, Any], tool_context) -> Optional[Dict[str, Any]]:
+    """
+    Hand finder_agent the closest passages of past answers, or answer for it
+    
+    When skipping is enabled (RAG_SKIP_SEARCH_SCORE at most 1) and the passages
+    cover the query well, they are stored as search_results in the finder's
+    output format and the search is skipped.
+    """
+    if tool.name != "finder_agent" or not settings.RAG_ENABLED:
+        return None
+    
+    query = tool_context.state.get("topic") or args.get("request", "")
+    passages = past_answers.retrieve(query)
+    if not passages:
+        return None
+    
+    skipped_search = past_answers.covers(passages)
+    past_answers.record(skipped_search)
+    tool_context.state["retrieval"] = {
+        "passages": len(passages),
+        "best_score": passages[0]["score"],
+        "skipped_search": skipped_search
+    }
+    if skipped_search:
+        search_results = past_answers.finder_output(passages)
+        tool_context.state["search_results"] = search_results
+        return {"result": search_results}
+    
+    context = past_answers.finder_context(passages)
+    if context:
+        args["request"] = f"{args.get('request', query)}\n\n{context}"
+    return None
+
+
+async def _research_before_tool(tool, args: Dict[str, Any], tool_context) -> Optional[Dict[str, Any]]:
+    """
+    In research mode, answer the finder_agent call with a concurrent multi-query search
+    
+    The merged answer is stored as search_results, exactly where the finder
+    agent would have put it, so get_fact_sources works unchanged.
+    """
+    if tool.name != "finder_agent" or not tool_context.state.get("research_mode"):
+        return None
+    
+    query = tool_context.state.get("topic") or args.get("request", "")
+    merged, research_metadata = await run_research(
+        query,
+        research_backend,
+        sub_query_count=settings.RESEARCH_SUBQUERIES,
+        concurrency=settings.RESEARCH_CONCURRENCY,
+        branch_timeout=settings.RESEARCH_BRANCH_TIMEOUT,
+        title_similarity=settings.SOURCE_TITLE_SIMILARITY
+    )
+    logger.info(f"Research for '{truncate(query, 200)}' merged {len(research_metadata['branches'])} branches in {research_metadata['elapsed_ms']} ms")
+    tool_context.state["search_results"] = merged
+    tool_context.state["research"] = research_metadata
+    return {"result": merged}
+
+
+async def _local_formatter_before_tool(tool, args: Dict[str, Any], tool_context) -> Optional[Dict[str, Any]]:
+    """
+    Format short or well structured content locally instead of calling organizer_agent
+    
+    The finder's raw answer is formatted when available, since ContentProcessor
+    has already stripped the markdown that marks its headings and lists.
+    """
+    if tool.name != "organizer_agent":
+        return None
+    
+    from app.utils.local_formatter import LOCAL_ROUTE, format_content, local_formatter
+    
+    search_results = tool_context.state.get("search_results")
+    if isinstance(search_results, str) and search_results.strip():
+        text = split_finder_output(search_results)[0]
+    else:
+        text = tool_context.state.get("content") or args.get("request", "")
+    
+    route, reason = local_formatter.choose_route(text)
+    local_formatter.record(route, reason)
+    tool_context.state["formatter"] = {"route": route, "reason": reason}
+    if route != LOCAL_ROUTE:
+        return None
+    
+    organized_content = format_content(text)
+    tool_context.state["organized_content"] = organized_content
+    return {"result": organized_content}
+
+
+def build_knowledge_agent(models: Optional[Dict[str, Union[str, BaseLlm]]] = None) -> SequentialAgent:
+    """
+    Build a new knowledge agent tree
+    
+    ADK agents can only belong to a single parent, so every runner needs its own tree.
+    
+    Args:
+        models: Optional model overrides keyed by agent name ("finder_agent",
+            "organizer_agent", "sources_agent"). Defaults to settings.AGENT_MODEL.
+        
+    Returns:
+        The root sequential agent
+    """
+    models = models or {}
+    
+    finder_agent = build_finder_agent(models.get("finder_agent"))
+    
+    organizer_agent = LlmAgent(
+        name="organizer_agent",
+        model=resilient(models.get("organizer_agent", settings.AGENT_MODEL), "organizer_agent"),
+        description="Agent that organizes content into a user friendly readable structure.",
+        instruction=ORGANIZER_INSTRUCTION,
+        output_key="organized_content"
+    )
+    
+    content_agent = LlmAgent(
+        name="sources_agent",
+        model=models.get("sources_agent", settings.AGENT_MODEL),
+        description="Agent for fetching the content for the given query",
+        instruction=CONTENT_INSTRUCTION,
+        tools=[agent_tool.AgentTool(agent=finder_agent), get_fact_sources, agent_tool.AgentTool(agent=organizer_agent)],
+        before_tool_callback=[_retrieval_before_tool, _research_before_tool, _local_formatter_before_tool]
+    )
+    
+    return SequentialAgent(
+        name="knowledge_agent",
+        sub_agents=[content_agent],
+        description="An agent to extract the true and accurate knowledge for a given topic."
+    )
+
+
+def _configured_models() -> Optional[Dict[str, Union[str, BaseLlm]]]:
+    """
+    Model overrides for the configured model backend
+    
+    AGENT_MODEL_BACKEND=fake swaps every model for the offline FakeLlm.
+    """
+    if settings.AGENT_MODEL_BACKEND == "fake":
+        from app.agents.fake_llm import build_fake_models, load_canned_responses
+        return build_fake_models(
+            latency=settings.FAKE_LLM_LATENCY_MS / 1000,
+            jitter=settings.FAKE_LLM_JITTER_MS / 1000,
+            responses=load_canned_responses(settings.FAKE_LLM_RESPONSES_PATH),
+            failure_rate=settings.FAKE_LLM_FAILURE_RATE,
+            slow_rate=settings.FAKE_LLM_SLOW_RATE,
+            slow_latency=settings.FAKE_LLM_SLOW_MS / 1000
+        )
+    return None
+
+
+def build_configured_agent() -> SequentialAgent:
+    """
+    Build a knowledge agent tree backed by the configured model backend
+    """
+    return build_knowledge_agent(models=_configured_models())
+
+
+def build_configured_finder_agent() -> LlmAgent:
+    """
+    Build a finder agent backed by the configured model backend
+    """
+    return build_finder_agent((_configured_models() or {}).get("finder_agent"))
+
+
+def build_research_backend() -> ResearchBackend:
+    """
+    Build the backend running research mode branches
+    
+    RESEARCH_BACKEND=fake answers every branch offline with canned results.
+    """
+    if settings.RESEARCH_BACKEND == "fake":
+        return FakeResearchBackend(
+            latency=settings.FAKE_LLM_LATENCY_MS / 1000,
+            jitter=settings.FAKE_LLM_JITTER_MS / 1000
+        )
+    return AgentResearchBackend(
+        agent_factory=build_configured_finder_agent,
+        size=settings.RESEARCH_RUNNER_POOL_SIZE,
+        acquire_timeout=settings.AGENT_RUNNER_ACQUIRE_TIMEOUT
+    )
+
+
+# Default agent tree, kept for tooling that loads the module-level agent
+knowledge_agent = build_knowledge_agent()
+
+# Long-lived runners used to serve queries, started from the app lifespan
+runner_pool = RunnerPool(
+    size=settings.AGENT_RUNNER_POOL_SIZE,
+    agent_factory=build_configured_agent,
+    app_name=APP_NAME,
+    session_service=session_service,
+    acquire_timeout=settings.AGENT_RUNNER_ACQUIRE_TIMEOUT
 )
 
+# Runs the concurrent sub-query branches of research mode
+research_backend = build_research_backend()
+
+# Answer cache namespace of research mode answers
+RESEARCH_CACHE_NAMESPACE = "research"
 
-async def get_information(query: str):
+# Coalesces identical queries while their pipeline is still running
+query_flight = SingleFlight(timeout=settings.SINGLE_FLIGHT_TIMEOUT_SECONDS)
+metrics.gauge("single_flight_in_flight", "Agent queries being computed for coalesced callers", lambda: query_flight.stats()["in_flight"])
+
+
+@traced("get_information")
+async def get_information(query: str, user_id: Optional[str] = None, use_cache: bool = True, research: bool = False):
     """
-    Run the information agent to get a response for a given query
+    Get a response for a given query, serving it from the answer cache when possible
+    
+    Args:
+        query: The user's query string
+        user_id: The user the query is run for, defaults to USER_ID
+        use_cache: Whether cached answers may be returned and new answers stored
+        research: Whether to research the query through several concurrent sub-queries
+        
+    Returns:
+        Dict containing response, sources and metadata. metadata["cache"] tells
+        whether the answer came from the cache and how old it is, and
+        metadata["coalesced"] is set when the answer was shared from an
+        identical query that was already running.
+        
+    Raises:
+        AdmissionRejected: The pipeline run was refused by admission control for this caller
+        CircuitOpenError: The models are failing and no stale answer is cached
+        SingleFlightTimeout: The identical query being waited on didn't finish in time
+    """
+    use_cache = use_cache and settings.ANSWER_CACHE_ENABLED
+    namespace = RESEARCH_CACHE_NAMESPACE if research else ""
+    
+    if use_cache:
+        cached = await answer_cache.get(query, namespace)
+        if cached is not None:
+            logger.debug(f"Answer cache hit ({cached['metadata']['cache']['tier']}) for query: {truncate(query, 200)}")
+            return cached
+    
+    if open_circuit_retry_after():
+        return await _degraded_result(query, namespace)
+    
+    started = False
+    
+    async def compute() -> Dict[str, Any]:
+        nonlocal started
+        started = True
+        async with admission_controller.slot(user_id):
+            result = await run_knowledge_pipeline(query, user_id=user_id, research=research)
+        await _finish_uncached_result(query, result, use_cache, namespace)
+        return result
+    
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await compute()
+    
+    key = cache_key(query, namespace)
+    while True:
+        try:
+            result, shared = await query_flight.do(key, compute)
+            break
+        except AdmissionRejected:
+            if started:
+                raise
+            # Admission refused the caller that started the run, for limits this
+            # caller may not have hit: run the query again, as its own caller
+            logger.debug(f"Retrying a query whose shared run was not admitted: {truncate(query, 200)}")
+    if shared:
+        logger.debug(f"Shared the in-flight answer for query: {truncate(query, 200)}")
+        result.setdefault("metadata", {})["coalesced"] = True
+    if "error" in result.get("metadata", {}) and open_circuit_retry_after():
+        # The run failed because the models are down, a stale answer beats an error
+        return await _degraded_result(query, namespace, fallback=result)
+    return result
+
+
+async def _degraded_result(query: str, namespace: str, fallback: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Answer a query while a model circuit is open
+    
+    Serves the cached answer even if it has expired, or fails fast.
+    
+    Args:
+        query: The user's query string
+        namespace: Answer cache namespace of the query
+        fallback: Result returned when nothing is cached, instead of raising
+        
+    Raises:
+        CircuitOpenError: Nothing is cached and there is no fallback
+    """
+    retry_after = open_circuit_retry_after()
+    if settings.ANSWER_CACHE_ENABLED:
+        cached = await answer_cache.get(query, namespace, allow_stale=True)
+        if cached is not None:
+            logger.warning(f"Models unavailable, serving a cached answer for query: {truncate(query, 200)}")
+            cached["metadata"]["degraded"] = True
+            return cached
+    if fallback is not None:
+        return fallback
+    raise CircuitOpenError("agent models", retry_after)
+
+
+async def _finish_uncached_result(query: str, result: Dict[str, Any], use_cache: bool, namespace: str = "") -> None:
+    """Store a freshly computed result in the answer cache and tag it as a cache miss"""
+    metadata = result.setdefault("metadata", {})
+    
+    # Failed runs are never cached so the next request retries the pipeline
+    if use_cache and "error" not in metadata:
+        await answer_cache.set(query, result, namespace)
+    
+    # Answers built from past answers are already indexed
+    if settings.RAG_ENABLED and "error" not in metadata and not metadata.get("retrieval", {}).get("skipped_search"):
+        past_answers.add_answer_in_background(query, result.get("response", ""), result.get("sources"))
+    
+    metadata["cache"] = {"hit": False}
+
+
+async def stream_information(query: str, user_id: Optional[str] = None, use_cache: bool = True, research: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Streaming counterpart of get_information
+    
+    Yields the events of stream_knowledge_pipeline. A cached answer is
+    yielded straight away as the final event. When get_information is already
+    running the same query, its answer is awaited and yielded as the final event.
+    
+    Args:
+        query: The user's query string
+        user_id: The user the query is run for, defaults to USER_ID
+        use_cache: Whether cached answers may be returned and new answers stored
+        research: Whether to research the query through several concurrent sub-queries
+        
+    Raises:
+        AdmissionRejected: The pipeline run was refused by admission control
+        CircuitOpenError: The models are failing and no stale answer is cached
+    """
+    use_cache = use_cache and settings.ANSWER_CACHE_ENABLED
+    namespace = RESEARCH_CACHE_NAMESPACE if research else ""
+    
+    if use_cache:
+        cached = await answer_cache.get(query, namespace)
+        if cached is not None:
+            yield _pipeline_event("final", **cached)
+            return
+    
+    if open_circuit_retry_after():
+        yield _pipeline_event("final", **await _degraded_result(query, namespace))
+        return
+    
+    if settings.SINGLE_FLIGHT_ENABLED:
+        try:
+            shared = await query_flight.wait(cache_key(query, namespace))
+        except AdmissionRejected:
+            # The run being waited on was refused for another caller's limits
+            shared = None
+        if shared is not None:
+            shared.setdefault("metadata", {})["coalesced"] = True
+            yield _pipeline_event("final", **shared)
+            return
+    
+    async with admission_controller.slot(user_id):
+        async with aclosing(stream_knowledge_pipeline(query, user_id=user_id, research=research)) as pipeline_events:
+            async for pipeline_event in pipeline_events:
+                if pipeline_event["event"] == "final":
+                    await _finish_uncached_result(query, pipeline_event["data"], use_cache, namespace)
+                yield pipeline_event
+
+
+# Runner events that mark the start of a pipeline phase
+_PHASE_TOOLS = {
+    "finder_agent": "searching",
+    "get_fact_sources": "extracting_sources",
+    "organizer_agent": "organizing"
+}
+
+
+class PhaseTimer:
+    """
+    Record how long each phase of a pipeline run takes, and trace each phase as a span
+    """
+    
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        self._phase = None
+        self._phase_started = 0.0
+        self._span = None
+    
+    def start(self, phase: str) -> None:
+        """End the current phase, if any, and start a new one"""
+        self.stop()
+        self._phase = phase
+        self._phase_started = time.perf_counter()
+        self._span = tracer.start_span(f"phase {phase}")
+    
+    def stop(self) -> None:
+        """End the current phase"""
+        if self._phase is not None:
+            elapsed = time.perf_counter() - self._phase_started
+            self.durations[self._phase] = self.durations.get(self._phase, 0.0) + elapsed
+            self._phase = None
+            self._span.end()
+            self._span = None
+    
+    def as_metadata(self) -> Dict[str, float]:
+        """Phase durations in milliseconds, plus the total"""
+        self.stop()
+        timings = {phase: round(seconds * 1000, 3) for phase, seconds in self.durations.items()}
+        timings["total"] = round((time.perf_counter() - self.started_at) * 1000, 3)
+        return timings
+
+
+# ADK runner events by the agent that emitted them and what they carry
+adk_events = metrics.counter("adk_events_total", "ADK runner events", ("author", "kind"))
+
+
+def _trace_runner_event(event, since_ns: int) -> int:
+    """
+    Count a runner event and trace the time the runner took to produce it
+    
+    Args:
+        event: The ADK event
+        since_ns: When the previous event arrived, in nanoseconds since the epoch
+        
+    Returns:
+        When this event arrived
+    """
+    if event.get_function_calls():
+        kind = "function_call"
+    elif event.get_function_responses():
+        kind = "function_response"
+    else:
+        kind = "final" if event.is_final_response() else "content"
+    author = event.author or "unknown"
+    adk_events.inc(author=author, kind=kind)
+    
+    now_ns = time.time_ns()
+    span = tracer.start_span("adk event", start_time=since_ns, attributes={"adk.author": author, "adk.kind": kind})
+    span.end(end_time=now_ns)
+    return now_ns
+
+
+def _pipeline_event(event: str, **data) -> Dict[str, Any]:
+    """Build an event emitted by stream_knowledge_pipeline"""
+    return {"event": event, "data": data}
+
+
+async def _translate_runner_event(event) -> List[Dict[str, Any]]:
+    """
+    Convert an ADK runner event into pipeline events
+    
+    Tool calls made by the content agent mark phase changes, and tool responses
+    carry the intermediate results (extracted content, sources, organized text).
+    """
+    pipeline_events = []
+    
+    for function_call in event.get_function_calls():
+        phase = _PHASE_TOOLS.get(function_call.name)
+        if phase:
+            pipeline_events.append(_pipeline_event("phase", phase=phase))
+    
+    for function_response in event.get_function_responses():
+        if function_response.name == "get_fact_sources":
+            content_text = await get_state_value("content")
+            if content_text:
+                pipeline_events.append(_pipeline_event("content", stage="extracted", text=content_text))
+            sources_list = await get_state_value("sources")
+            if sources_list:
+                from app.utils.json_helpers import format_sources_list
+                pipeline_events.append(_pipeline_event("sources", sources=format_sources_list(sources_list)))
+        elif function_response.name == "organizer_agent":
+            organized_content = (function_response.response or {}).get("result")
+            if organized_content:
+                pipeline_events.append(_pipeline_event("content", stage="organized", text=organized_content))
+    
+    return pipeline_events
+
+
+async def _collect_result(query: str) -> Dict[str, Any]:
+    """
+    Build the final response for the pipeline run in progress from its session state
     
     Args:
         query: The user's query string
@@ -510,136 +945,191 @@ async def get_information(query: str):
     Returns:
         Dict containing response and sources
     """
+    # Fetch final state values after agent execution complete
+    organized_content = await get_state_value('organized_content')
+
+    # Clean up any remaining special characters that might have been added
+    if organized_content:
+        final_response = organized_content.replace("#", "").replace("*", "").replace("_", "").replace("`", "")
+    else:
+        final_response = None
+
+    sources_list = await get_state_value('sources')
+    content_text = await get_state_value('content')
+
+    logger.debug(
+        f"State after agent execution: {len(sources_list) if sources_list else 0} sources, "
+        f"{len(content_text) if content_text else 0} chars of content, "
+        f"{len(final_response) if final_response else 0} chars of organized content"
+    )
+
+    # If still no response, use fallback options
+    if final_response is None or not final_response:
+        if content_text:
+            final_response = f"{content_text}"
+            logger.info("No organized content, using the extracted content as the response")
+
+        # Last resort: generate a simple response with the query and sources
+        else:
+            final_response = f"Information about {query}:\n\nI've gathered several sources on this topic, but couldn't generate a complete response. Please check the sources below for detailed information."
+            logger.warning("No organized or extracted content, answering with the sources only")
+
+    # Process the sources before returning using our helper functions
+    from app.utils.json_helpers import format_sources_list
+
+    try:
+        formatted_sources = format_sources_list(sources_list)
+    except Exception as e:
+        logger.exception(f"Error formatting sources: {e}")
+        formatted_sources = [Source("Error processing sources", "System", "", "2025")]
+
+    # Perform one final state refresh to ensure we have the latest values
+    final_response = await get_state_value('organized_content') or final_response
+    log_payload("final response", final_response)
+    log_payload("final sources", sources_list)
+
+
+    # Return a clean response with validated data
+    return {
+        "response": final_response if final_response else f"I searched for information about '{query}' but couldn't generate a complete response. Please try again or rephrase your query.",
+        "sources": formatted_sources
+    }
+
+
+async def stream_knowledge_pipeline(query: str, user_id: Optional[str] = None, research: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Run the information agent for a query, yielding progress events as they happen
     
+    Each call runs in its own ADK session, so any number of queries can be
+    processed concurrently by the same worker. The run itself happens in a
+    separate task: the session it binds stays in that task's context instead of
+    the consumer's, and the generator can be closed from any task. Closing the
+    generator early (for example when a streaming client disconnects) cancels
+    the agent run and releases its session.
+    
+    Args:
+        query: The user's query string
+        user_id: The user the query is run for, defaults to USER_ID
+        research: Whether the finder step fans out into concurrent sub-queries
+        
+    Yields:
+        Dicts with "event" and "data" keys:
+        - phase: a pipeline phase started (searching, extracting_sources, organizing)
+        - content: intermediate text, stage is "extracted" or "organized"
+        - sources: the validated sources list
+        - final: the complete result, same shape as run_knowledge_pipeline's
+    """
+    pipeline_events: asyncio.Queue = asyncio.Queue()
+    run = asyncio.create_task(_run_pipeline(query, user_id, research, pipeline_events.put_nowait))
+    # Wake the consumer up when the run ends without a final event
+    run.add_done_callback(lambda _: pipeline_events.put_nowait(None))
     try:
-        await create_fresh_session()
+        while (pipeline_event := await pipeline_events.get()) is not None:
+            yield pipeline_event
+            if pipeline_event["event"] == "final":
+                break
+        await run
+    finally:
+        if not run.done():
+            run.cancel()
+            with suppress(asyncio.CancelledError):
+                await run
+
+
+async def _run_pipeline(query: str, user_id: Optional[str], research: bool, emit: Callable[[Dict[str, Any]], None]) -> None:
+    """
+    Run the information agent for a query in the current task
+    
+    Args:
+        query: The user's query string
+        user_id: The user the query is run for, defaults to USER_ID
+        research: Whether the finder step fans out into concurrent sub-queries
+        emit: Called with every pipeline event, the last one is the final event
+    """
+    session_scope = None
+    timer = PhaseTimer()
+    timer.start("setup")
+    try:
+        session_scope = await create_fresh_session(user_id)
+        session_user_id, session_id = session_scope
         # Reset state for this query to ensure clean execution
-        print(f"Processing new query: {query}")
+        logger.debug(f"Processing new query in session {session_id}: {truncate(query, 200)}")
         
         # Set the topic in the session state
         await set_state_value("topic", query)
-        set_topic = await get_state_value("topic")
-        print(f"Successfully set topic in state: {set_topic}")
+        if research:
+            await set_state_value("research_mode", True)
         
-        # Make sure we have a valid session before creating the runner
-        print("Ensuring valid session exists before creating runner")
-        
-        # Create the runner with our sequential agent, using the same session service
-        runner = Runner(
-            agent=knowledge_agent, 
-            app_name=APP_NAME,
-            session_service=session_service
-        )
-
         # Create the content object for the runner
         content = types.Content(role='user', parts=[types.Part(text=query)])
 
-        # Process events from the runner
-        final_response = None
-        sources_list = None
-        # extracted_info = None
-        content_text = None
-
-        # Run the agent and synchronize state at each step
+        # Lease a runner from the pool and forward the agent's progress as it happens
         try:
-            async for event in runner.run_async(user_id=USER_ID, session_id=SESSION_ID, new_message=content):
-                
-                # After each event, refresh our state values
-                if event.is_final_response():
-                    print("Final response event received")
-                    break
+            timer.start("waiting_for_runner")
+            async with runner_pool.lease() as runner:
+                timer.start("planning")
+                async with aclosing(runner.run_async(user_id=session_user_id, session_id=session_id, new_message=content)) as events:
+                    last_event_ns = time.time_ns()
+                    async for event in events:
+                        last_event_ns = _trace_runner_event(event, last_event_ns)
+                        for pipeline_event in await _translate_runner_event(event):
+                            if pipeline_event["event"] == "phase":
+                                timer.start(pipeline_event["data"]["phase"])
+                            emit(pipeline_event)
+                        
+                        # Drain the event stream instead of breaking out of it: the final
+                        # response is the last event anyway, and abandoning the generator
+                        # leaves ADK's nested generators to be finalized from another task
                 
         except ValueError as ve:
             if "Session not found" in str(ve):
-                print("Session error during run_async, falling back to direct tool calls")
-                # Skip the agent execution and move to direct tool calls below
+                logger.warning("Session error during run_async, building the response from the current state")
             else:
                 raise  # Re-raise if it's a different ValueError
-            
-            # Explicitly fetch state values after each event
-            organized_content = await get_state_value('organized_content')
-            print(f"seeing organized content: {organized_content}")
-            
-            # Clean up any remaining special characters that might have been added
-            if organized_content:
-                final_response = organized_content.replace("#", "").replace("*", "").replace("_", "").replace("`", "")
-            else:
-                final_response = None
-                
-            print(f"seeing final response: {final_response}")
-            sources_list = await get_state_value('sources')
-            content_text = await get_state_value('content')
-        
-        # Fetch final state values after agent execution complete
-        organized_content = await get_state_value('organized_content')
-        
-        # Clean up any remaining special characters that might have been added
-        if organized_content:
-            final_response = organized_content.replace("#", "").replace("*", "").replace("_", "").replace("`", "")
-        else:
-            final_response = None
-            
-        sources_list = await get_state_value('sources')
-        content_text = await get_state_value('content')
         
-        # Comprehensive debug output to verify state
-        print("\n=== DEBUG: State values after agent execution ===")
-        print(f"sources_list: {type(sources_list)} with {len(sources_list) if sources_list else 0} items")
-        print(f"content_text: {content_text[:50] if content_text else None}")
-        # print(f"extracted_info: {extracted_info[:50] if extracted_info else None}")
-        print(f"final_response: {final_response[:50] if final_response else None}")
-            
-        # If still no response, use fallback options
-        print(f"Checking final_response: {final_response}, type: {type(final_response)}")
-        if final_response is None or not final_response:
-            print("Building fallback response")
-
-            if content_text:
-                final_response = f"{content_text}"
-                print("Using content as fallback response")
-                
-            # Last resort: generate a simple response with the query and sources
-            else:
-                final_response = f"Information about {query}:\n\nI've gathered several sources on this topic, but couldn't generate a complete response. Please check the sources below for detailed information."
-                print("Using generic fallback response with sources only")
-            
-        # Process the sources before returning using our helper functions
-        from app.utils.json_helpers import format_sources_list
-        
-        try:
-            formatted_sources = format_sources_list(sources_list)
-            print(f"Processed sources: {len(formatted_sources)} sources formatted")
-        except Exception as e:
-            import traceback
-            print(f"Error formatting sources: {e}")
-            print(traceback.format_exc())
-            formatted_sources = [{
-                "title": "Error processing sources",
-                "source": "System",
-                "link": "",
-                "year": "2025"
-            }]
-        
-        # Perform one final state refresh to ensure we have the latest values
-        final_response = await get_state_value('organized_content') or final_response
-        print(f"final response from the state after agent execution: {final_response}")
-        sources_list = await get_state_value('sources') or sources_list
-        print(f"final source list from the state after agent execution: {sources_list}")
-
-        
-        # Return a clean response with validated data
-        return {
-            "response": final_response if final_response else f"I searched for information about '{query}' but couldn't generate a complete response. Please try again or rephrase your query.",
-            "sources": formatted_sources
-        }
+        timer.start("finalizing")
+        result = await _collect_result(query)
+        research_metadata = await get_state_value("research")
+        if research_metadata:
+            result.setdefault("metadata", {})["research"] = research_metadata
+        retrieval_metadata = await get_state_value("retrieval")
+        if retrieval_metadata:
+            result.setdefault("metadata", {})["retrieval"] = retrieval_metadata
+        formatter_metadata = await get_state_value("formatter")
+        if formatter_metadata:
+            result.setdefault("metadata", {})["formatter"] = formatter_metadata
                 
     except Exception as e:
-        import logging
-        import traceback
-        error_trace = traceback.format_exc()
-        logging.error(f"Error running information agent: {str(e)}\n{error_trace}")
-        print(f"error while running the app: {e}\n{error_trace}")
-        return {
+        logger.exception(f"Error running information agent: {e}")
+        result = {
             "response": f"Error: {str(e)}",
-            "sources": []
+            "sources": [],
+            "metadata": {"error": str(e)}
         }
+    finally:
+        # Release the session so the in-memory service doesn't grow with every query
+        if session_scope is not None:
+            await close_session(*session_scope)
+    
+    result.setdefault("metadata", {})["timings_ms"] = timer.as_metadata()
+    emit(_pipeline_event("final", **result))
+
+
+async def run_knowledge_pipeline(query: str, user_id: Optional[str] = None, research: bool = False) -> Dict[str, Any]:
+    """
+    Run the information agent to get a response for a given query
+    
+    Args:
+        query: The user's query string
+        user_id: The user the query is run for, defaults to USER_ID
+        research: Whether the finder step fans out into concurrent sub-queries
+        
+    Returns:
+        Dict containing response and sources
+    """
+    result = None
+    async with aclosing(stream_knowledge_pipeline(query, user_id=user_id, research=research)) as pipeline_events:
+        async for pipeline_event in pipeline_events:
+            if pipeline_event["event"] == "final":
+                result = pipeline_event["data"]
+    return result
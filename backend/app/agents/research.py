@@ -0,0 +1,255 @@
+"""
+Research mode for broad queries.
+
+The query is split into several sub-queries. Each one is searched and
+summarized by its own branch, and the branches run concurrently with a bound on
+how many run at once. Their answers are then merged into one finder-style
+output (content followed by a References: section) for get_fact_sources, so a
+research run takes about as long as its slowest branch.
+
+Branches go through a ResearchBackend: AgentResearchBackend runs a finder agent
+per branch. FakeResearchBackend returns canned answers after a configurable
+delay, for benchmarks and offline runs.
+"""
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from abc import ABC, abstractmethod
+from contextlib import aclosing
+import asyncio
+import random
+import re
+import time
+import uuid
+
+from google.adk.agents import BaseAgent
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from app.agents.runner_pool import RunnerPool
+from app.utils.content_processor import REFERENCES_MARKER, ContentProcessor
+from app.utils.source_dedup import SourceIndex
+
+# Angles used to widen a query that can't be split into distinct topics
+RESEARCH_FACETS = [
+    "overview and background",
+    "key facts and figures",
+    "recent developments",
+    "applications and impact",
+    "challenges and open questions",
+    "history",
+]
+
+# Separators between distinct topics of a comparison query ("solar vs wind power")
+_TOPIC_SEPARATORS = re.compile(r"\s*(?:;|\bvs\.?(?=\s)|\bversus\b)\s*", re.IGNORECASE)
+
+
+def decompose_query(query: str, count: int) -> List[str]:
+    """
+    Split a query into up to count sub-queries
+
+    Queries comparing several topics ("solar vs wind power") get one sub-query
+    per topic. The remaining slots are filled with facets of the whole query.
+    """
+    query = query.strip()
+    if count <= 1:
+        return [query]
+
+    sub_queries: List[str] = []
+    topics = [topic for topic in _TOPIC_SEPARATORS.split(query) if topic]
+    if len(topics) > 1:
+        sub_queries.extend(topics)
+    for facet in RESEARCH_FACETS:
+        sub_queries.append(f"{query}: {facet}")
+
+    unique: List[str] = []
+    for sub_query in sub_queries:
+        if sub_query.lower() not in (existing.lower() for existing in unique):
+            unique.append(sub_query)
+    return unique[:count]
+
+
+class BranchResult(NamedTuple):
+    """
+    Outcome of one research branch
+    """
+    query: str
+    text: str
+    elapsed: float
+    error: Optional[str] = None
+
+
+class ResearchBackend(ABC):
+    """
+    Searches and summarizes one sub-query, in the finder_agent output format
+    """
+
+    @abstractmethod
+    async def search(self, query: str) -> str:
+        """The finder output for a sub-query"""
+
+    async def close(self) -> None:
+        """Release the backend's resources"""
+
+
+class AgentResearchBackend(ResearchBackend):
+    """
+    Runs a standalone finder agent for each branch
+    """
+
+    def __init__(self, agent_factory: Callable[[], BaseAgent], size: int = 8, acquire_timeout: Optional[float] = None):
+        """
+        Args:
+            agent_factory: Builds the finder agent run by each branch
+            size: Maximum number of branches running at once, across all queries
+            acquire_timeout: Seconds a branch waits for a free runner
+        """
+        self.app_name = "research"
+        self.session_service = InMemorySessionService()
+        self.pool = RunnerPool(
+            size=size,
+            agent_factory=agent_factory,
+            app_name=self.app_name,
+            session_service=self.session_service,
+            acquire_timeout=acquire_timeout
+        )
+
+    async def search(self, query: str) -> str:
+        user_id = "research"
+        session_id = f"research-{uuid.uuid4().hex}"
+        await self.session_service.create_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+        content = types.Content(role="user", parts=[types.Part(text=query)])
+
+        answer = ""
+        try:
+            async with self.pool.lease() as runner:
+                async with aclosing(runner.run_async(user_id=user_id, session_id=session_id, new_message=content)) as events:
+                    async for event in events:
+                        if event.is_final_response() and event.content and event.content.parts:
+                            answer = "".join(part.text for part in event.content.parts if part.text)
+        finally:
+            await self.session_service.delete_session(app_name=self.app_name, user_id=user_id, session_id=session_id)
+        return answer
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+
+class FakeResearchBackend(ResearchBackend):
+    """
+    Offline backend returning canned finder answers after a delay
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        """
+        Args:
+            latency: Seconds each branch takes
+            jitter: Maximum extra seconds added to each branch, drawn from a seeded RNG
+            seed: Seed for the jitter RNG
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+
+    async def search(self, query: str) -> str:
+        from app.agents.fake_llm import default_finder_response
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+        return default_finder_response(query)
+
+
+def split_finder_output(text: str) -> Tuple[str, List[str]]:
+    """Split a finder answer into its content and its reference lines"""
+    marker = text.find(REFERENCES_MARKER)
+    if marker == -1:
+        return text.strip(), []
+    references = text[marker + len(REFERENCES_MARKER):].split("\n")
+    return text[:marker].strip(), [line.strip() for line in references if line.strip()]
+
+
+def merge_branch_results(branches: List[BranchResult], title_similarity: Optional[float] = 0.8) -> str:
+    """
+    Merge branch answers into a single finder answer
+
+    Each branch's content becomes a section headed by its sub-query. References
+    are concatenated in branch order without duplicates.
+    """
+    sections = []
+    references = []
+    seen = SourceIndex(title_similarity=title_similarity)
+    for branch in branches:
+        if not branch.text:
+            continue
+        content, reference_lines = split_finder_output(branch.text)
+        if content:
+            sections.append(f"## {branch.query}\n{content}")
+        for line in reference_lines:
+            title, _, link, _ = ContentProcessor._extract_four_part_reference(line)
+            if not title and not link:
+                title, _, link, _ = ContentProcessor._extract_traditional_reference(line)
+            if seen.add_if_new(link, title):
+                references.append(line)
+
+    merged = "\n\n".join(sections)
+    if references:
+        merged += f"\n\n{REFERENCES_MARKER}\n" + "\n".join(references)
+    return merged
+
+
+async def run_research(
+    query: str,
+    backend: ResearchBackend,
+    sub_query_count: int = 4,
+    concurrency: int = 4,
+    branch_timeout: Optional[float] = None,
+    title_similarity: Optional[float] = 0.8
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Research a query through concurrent sub-query branches
+
+    Args:
+        query: The user's query
+        backend: Backend running each branch
+        sub_query_count: Number of sub-queries to split the query into
+        concurrency: Maximum number of this query's branches running at once
+        branch_timeout: Seconds after which a branch is abandoned, None waits indefinitely
+        title_similarity: Title overlap above which two references are duplicates
+
+    Returns:
+        The merged finder answer, and metadata describing each branch
+
+    Raises:
+        RuntimeError: Every branch failed
+    """
+    started_at = time.perf_counter()
+    sub_queries = decompose_query(query, sub_query_count)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_branch(sub_query: str) -> BranchResult:
+        async with semaphore:
+            branch_started = time.perf_counter()
+            try:
+                text = await asyncio.wait_for(backend.search(sub_query), timeout=branch_timeout)
+                return BranchResult(sub_query, text or "", time.perf_counter() - branch_started)
+            except Exception as e:
+                error = f"timed out after {branch_timeout}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+                return BranchResult(sub_query, "", time.perf_counter() - branch_started, error)
+
+    branches = await asyncio.gather(*(run_branch(sub_query) for sub_query in sub_queries))
+    if not any(branch.text for branch in branches):
+        errors = "; ".join(f"{branch.query}: {branch.error or 'empty answer'}" for branch in branches)
+        raise RuntimeError(f"Every research branch failed ({errors})")
+
+    merged = merge_branch_results(branches, title_similarity)
+    metadata = {
+        "branches": [
+            {
+                "query": branch.query,
+                "ok": bool(branch.text),
+                "elapsed_ms": round(branch.elapsed * 1000, 3),
+                **({"error": branch.error} if branch.error else {})
+            }
+            for branch in branches
+        ],
+        "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 3)
+    }
+    return merged, metadata
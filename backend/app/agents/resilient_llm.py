@@ -0,0 +1,378 @@
+"""
+Resilience layer around the model calls of the knowledge agents.
+
+ResilientLlm wraps another ADK model and gives every call:
+- a deadline, after which the attempt is abandoned
+- retries with full jitter exponential backoff for retryable errors
+  (deadlines, rate limits, 5xx responses, connection errors)
+- an optional hedged request, started when an attempt runs longer than the
+  recent latency quantile, with the first answer winning
+- a circuit breaker shared by every model of the same agent role, which fails
+  calls fast once consecutive failures pile up, and lets a single trial call
+  through after a cool-down
+
+Streaming calls get the deadline, retries and hedging until their first
+response arrives. The rest of the stream is then passed through as it comes:
+once part of an answer has been yielded, a failure can no longer be retried
+and is raised as is.
+
+Models are wrapped by build_knowledge_agent when MODEL_RESILIENCE_ENABLED is set.
+"""
+from typing import AsyncGenerator, AsyncIterator, Deque, Dict, List, Optional, Tuple, Union
+from collections import deque
+from contextlib import aclosing
+import asyncio
+import random
+import time
+
+from google.adk.models import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.models.registry import LLMRegistry
+from loguru import logger
+
+from app.utils.config import settings
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class ModelDeadlineExceeded(Exception):
+    """Raised when a model call attempt runs past its deadline"""
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a model whose circuit breaker is open
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Model circuit for {name} is open, retry after {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed model call may succeed if tried again"""
+    if isinstance(error, (ModelDeadlineExceeded, asyncio.TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return code in RETRYABLE_STATUS_CODES
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive failures, then lets one trial call through after a cool-down
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            name: Name reported in errors and stats
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+        # Metrics
+        self._opened = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit lets a call through, 0 when it does now"""
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def rejects_calls(self) -> bool:
+        """Whether a call made now would fail fast: the circuit is open, or its trial call is running"""
+        state = self.state
+        return state == "open" or (state == "half_open" and self._trial_in_flight)
+
+    def before_call(self) -> None:
+        """
+        Raises:
+            CircuitOpenError: The circuit is open, or its trial call is already running
+        """
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        self._rejected += 1
+        raise CircuitOpenError(self.name, max(1.0, self.retry_after()))
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info(f"Model circuit for {self.name} closed")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._trial_in_flight or (self._opened_at is None and self._failures >= self.failure_threshold):
+            if self._opened_at is None:
+                self._opened += 1
+            logger.warning(f"Model circuit for {self.name} opened after {self._failures} consecutive failures")
+            self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def record_abandoned(self) -> None:
+        """A call was cancelled before it succeeded or failed"""
+        self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "retry_after_seconds": round(self.retry_after(), 3),
+            "opened": self._opened,
+            "rejected": self._rejected
+        }
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies, used to time hedged requests
+    """
+
+    def __init__(self, window: int = 200):
+        self._latencies: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._latencies.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._latencies)
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# Breakers and latencies are shared by every runner's model of the same role
+model_breakers: Dict[str, CircuitBreaker] = {}
+model_latencies: Dict[str, LatencyTracker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """The circuit breaker of an agent role, created on first use"""
+    if name not in model_breakers:
+        model_breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=settings.MODEL_BREAKER_FAILURE_THRESHOLD,
+            reset_timeout=settings.MODEL_BREAKER_RESET_SECONDS
+        )
+    return model_breakers[name]
+
+
+def open_circuit_retry_after() -> float:
+    """
+    Seconds until every model circuit rejecting calls lets them through again, 0 if none does
+
+    A half-open circuit whose trial call is running rejects the other calls
+    too; it counts for at least a second, like the CircuitOpenError it raises.
+    """
+    return max(
+        (max(1.0, breaker.retry_after()) for breaker in model_breakers.values() if breaker.rejects_calls()),
+        default=0.0
+    )
+
+
+def resilience_stats() -> Dict[str, Dict[str, object]]:
+    """Breaker state and latency quantiles of every wrapped agent role"""
+    stats = {}
+    for name, breaker in model_breakers.items():
+        latencies = model_latencies.get(name)
+        stats[name] = {
+            **breaker.stats(),
+            "latency_samples": len(latencies) if latencies else 0,
+            "p50_ms": round((latencies.quantile(0.5) or 0.0) * 1000, 3) if latencies else 0.0,
+            "p95_ms": round((latencies.quantile(0.95) or 0.0) * 1000, 3) if latencies else 0.0
+        }
+    return stats
+
+
+class ResilientLlm(BaseLlm):
+    """
+    Wraps a model with deadlines, retries, hedging and a circuit breaker
+
+    Attributes:
+        inner: The wrapped model
+        name: Agent role sharing the circuit breaker and latency statistics
+        deadline: Seconds an attempt may take, 0 disables the deadline
+        max_retries: Retries after the first attempt for retryable errors
+        retry_base_delay: Backoff before the first retry, doubled on every retry
+        retry_max_delay: Upper bound of the backoff
+        hedge: Whether slow attempts get a hedged duplicate request
+        hedge_quantile: Latency quantile after which the hedged request starts
+        hedge_min_samples: Latencies needed before hedging starts
+    """
+    inner: BaseLlm
+    name: str
+    deadline: float = 60.0
+    max_retries: int = 2
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
+    hedge: bool = False
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return get_breaker(self.name)
+
+    @property
+    def latencies(self) -> LatencyTracker:
+        return model_latencies.setdefault(self.name, LatencyTracker())
+
+    async def _call(self, llm_request: LlmRequest, stream: bool) -> Tuple[List[LlmResponse], Optional[AsyncIterator[LlmResponse]]]:
+        """
+        One call to the wrapped model
+
+        Returns:
+            Every response of a call, or the first response of a streaming call
+            and the rest of its stream. The latency recorded is the time to the
+            last, or for streams the first, response.
+        """
+        started_at = time.perf_counter()
+        responses = self.inner.generate_content_async(llm_request, stream=stream)
+        if not stream:
+            collected = [response async for response in responses]
+            self.latencies.record(time.perf_counter() - started_at)
+            return collected, None
+        try:
+            first = await anext(responses)
+        except StopAsyncIteration:
+            return [], None
+        except BaseException:
+            await responses.aclose()
+            raise
+        self.latencies.record(time.perf_counter() - started_at)
+        return [first], responses
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge or len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.quantile(self.hedge_quantile)
+
+    async def _attempt(self, llm_request: LlmRequest, stream: bool) -> Tuple[List[LlmResponse], Optional[AsyncIterator[LlmResponse]]]:
+        """A call, hedged with a duplicate once it runs slower than usual"""
+        hedge_delay = self._hedge_delay()
+        primary = asyncio.create_task(self._call(llm_request, stream))
+        if hedge_delay is None:
+            return await primary
+
+        tasks = {primary}
+        losers: List[asyncio.Task] = []
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                logger.debug(f"Hedging a {self.name} call after {hedge_delay:.3f}s")
+                tasks.add(asyncio.create_task(self._call(llm_request, stream)))
+
+            first_error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                successes = [task for task in done if task.exception() is None]
+                if successes:
+                    losers = successes[1:]
+                    return successes[0].result()
+                first_error = first_error or next(iter(done)).exception()
+            raise first_error
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Close the stream of a duplicate that answered at the same time as the winner
+            for task in losers:
+                _, rest = task.result()
+                if rest is not None:
+                    await rest.aclose()
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        breaker = self.breaker
+        breaker.before_call()
+
+        attempt = 0
+        while True:
+            try:
+                responses, rest = await asyncio.wait_for(self._attempt(llm_request, stream), timeout=self.deadline or None)
+                break
+            except asyncio.TimeoutError:
+                error: BaseException = ModelDeadlineExceeded(f"{self.name} call exceeded its {self.deadline}s deadline")
+            except asyncio.CancelledError:
+                breaker.record_abandoned()
+                raise
+            except Exception as e:
+                error = e
+
+            if not is_retryable(error):
+                # Bad requests say nothing about the model's health
+                breaker.record_abandoned()
+                raise error
+            breaker.record_failure()
+            if attempt >= self.max_retries or breaker.state != "closed":
+                raise error
+            attempt += 1
+            # Full jitter keeps retries from many queries from arriving together
+            backoff = random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** (attempt - 1)))
+            logger.warning(f"Retrying {self.name} call in {backoff:.2f}s (attempt {attempt + 1}): {error}")
+            await asyncio.sleep(backoff)
+
+        breaker.record_success()
+        for response in responses:
+            yield response
+        if rest is None:
+            return
+        async with aclosing(rest):
+            try:
+                async for response in rest:
+                    yield response
+            except Exception as e:
+                if is_retryable(e):
+                    breaker.record_failure()
+                raise
+
+
+def resilient(model: Union[str, BaseLlm], name: str) -> BaseLlm:
+    """
+    Wrap a model, or a model name, in the configured resilience policy
+
+    Args:
+        model: Model instance or Gemini model name
+        name: Agent role the model backs
+    """
+    if not settings.MODEL_RESILIENCE_ENABLED:
+        return model
+    inner = LLMRegistry.new_llm(model) if isinstance(model, str) else model
+    return ResilientLlm(
+        model=inner.model,
+        inner=inner,
+        name=name,
+        deadline=settings.MODEL_DEADLINE_SECONDS,
+        max_retries=settings.MODEL_MAX_RETRIES,
+        retry_base_delay=settings.MODEL_RETRY_BASE_DELAY_SECONDS,
+        retry_max_delay=settings.MODEL_RETRY_MAX_DELAY_SECONDS,
+        hedge=settings.MODEL_HEDGE_ENABLED,
+        hedge_quantile=settings.MODEL_HEDGE_QUANTILE,
+        hedge_min_samples=settings.MODEL_HEDGE_MIN_SAMPLES
+    )
@@ -0,0 +1,346 @@
+"""
+Retrieval over past answers.
+
+Every answer computed by the knowledge pipeline is split into passages of a
+few sentences and embedded, together with the question it answered, into a
+local vector index. When a new query comes in:
+- the closest passages are handed to finder_agent as context for its search
+- optionally, when they cover the query well (a close match, with sources),
+  they replace the search entirely: the finder call is answered with the
+  passages and their references, in the finder's own output format
+
+Replacing the search is off by default (skip_search_score above 1). The
+hashed bag-of-words embedding measures word overlap, not meaning: "capital of
+France population" scores as close to "What is the capital of France?" as a
+rephrasing of it does, and would get the other question's answer.
+
+At startup an empty index is filled from the most recent query_history
+entries. Past answers are shared across users, like the answer cache, but
+the questions they answered are not: only the passages and their sources are
+ever handed to another query.
+
+New answers are indexed in a worker thread, off the event loop, and a
+memory-mapped index is written to disk every flush_interval seconds rather
+than after every answer.
+"""
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import os
+import threading
+
+import numpy as np
+from loguru import logger
+
+from app.utils.config import settings
+from app.utils.content_processor import REFERENCES_MARKER
+from app.utils.json_helpers import json_default
+from app.utils.source_dedup import SourceIndex
+from app.utils.sources import sources_from
+from app.utils.vector_index import HashingEmbedder, IvfFlatIndex
+
+# Share of a passage embedding given to the question it answered
+QUESTION_WEIGHT = 0.6
+
+# skip_search_score disabling the skip: cosine similarities never exceed 1
+SKIP_SEARCH_NEVER = 1.1
+
+
+def chunk_text(text: str, max_words: int = 120, overlap: int = 20) -> List[str]:
+    """
+    Split text into passages of about max_words words
+
+    Paragraphs are kept together when they fit. Longer paragraphs are cut into
+    windows that overlap by a few words, so no sentence loses all its context.
+    """
+    passages: List[str] = []
+    current: List[str] = []
+    for paragraph in (part.strip() for part in text.split("\n\n")):
+        if not paragraph:
+            continue
+        words = paragraph.split()
+        if len(current) + len(words) <= max_words:
+            current.extend(words)
+            continue
+        if current:
+            passages.append(" ".join(current))
+            current = []
+        step = max(1, max_words - overlap)
+        while len(words) > max_words:
+            passages.append(" ".join(words[:max_words]))
+            words = words[step:]
+        current = list(words)
+    if current:
+        passages.append(" ".join(current))
+    return passages
+
+
+def _normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class PastAnswerIndex:
+    """
+    Passages of past answers in a vector index
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        dim: int = 256,
+        top_k: int = 4,
+        min_score: float = 0.3,
+        skip_search_score: float = SKIP_SEARCH_NEVER,
+        skip_min_passages: int = 1,
+        context_chars: int = 2000,
+        nprobe: int = 8,
+        flush_interval: float = 30.0
+    ):
+        """
+        Args:
+            path: Directory of the memory-mapped index, None keeps it in memory
+            dim: Embedding dimensions
+            top_k: Passages retrieved per query
+            min_score: Cosine similarity below which passages are ignored
+            skip_search_score: Similarity of the best passage needed to skip the
+                search, above 1 never skips it
+            skip_min_passages: Passages needed to skip the search
+            context_chars: Maximum length of the context handed to the finder
+            nprobe: Index partitions searched per query
+            flush_interval: Seconds between two writes of a memory-mapped index to disk
+        """
+        self.path = path or None
+        self.top_k = top_k
+        self.min_score = min_score
+        self.skip_search_score = skip_search_score
+        self.skip_min_passages = skip_min_passages
+        self.context_chars = context_chars
+        self.flush_interval = flush_interval
+        self.embedder = HashingEmbedder(dim)
+        self.index = IvfFlatIndex(dim, path=self.path, nprobe=nprobe)
+        self.passages: List[Dict[str, Any]] = []
+        self._queries = set()  # Normalized questions already indexed
+        self._lock = threading.Lock()
+        self._bootstrap_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._pending_adds: set = set()
+        self._dirty = False
+
+        # Metrics
+        self._retrievals = 0
+        self._skipped_searches = 0
+        self._context_injections = 0
+
+        if self.path:
+            self._load_passages()
+
+    def _passages_file(self) -> str:
+        return os.path.join(self.path, "passages.jsonl")
+
+    def _load_passages(self) -> None:
+        if not os.path.exists(self._passages_file()):
+            return
+        with open(self._passages_file(), encoding="utf-8") as passages_file:
+            self.passages = [json.loads(line) for line in passages_file if line.strip()]
+        for passage in self.passages:
+            passage["sources"] = sources_from(passage.get("sources"))
+        # Keep the passages and the vectors in step after an interrupted write
+        count = min(len(self.passages), self.index.count)
+        if count < len(self.passages):
+            del self.passages[count:]
+            with open(self._passages_file(), "w", encoding="utf-8") as passages_file:
+                passages_file.write("".join(json.dumps(passage, default=json_default) + "\n" for passage in self.passages))
+        self.index.count = count
+        self._queries = {_normalize_query(passage["query"]) for passage in self.passages}
+
+    def _embed_passage(self, query: str, text: str) -> np.ndarray:
+        vector = QUESTION_WEIGHT * self.embedder.embed(query) + (1 - QUESTION_WEIGHT) * self.embedder.embed(text)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+    def add_answer(self, query: str, response: str, sources: Optional[List[Any]] = None) -> int:
+        """
+        Index the passages of an answer
+
+        Blocking: embeds the passages and may retrain the index partitions.
+        Call it from a worker thread, or use add_answer_in_background.
+
+        Returns:
+            The number of passages added, 0 for a question already indexed
+        """
+        normalized = _normalize_query(query)
+        if not response or not normalized or normalized in self._queries:
+            return 0
+        chunks = chunk_text(response)
+        if not chunks:
+            return 0
+        sources = sources_from(sources)
+        vectors = np.stack([self._embed_passage(query, chunk) for chunk in chunks])
+        with self._lock:
+            if normalized in self._queries:
+                return 0
+            self._queries.add(normalized)
+            self.index.add(vectors)
+            new_passages = [{"query": query, "text": chunk, "sources": sources} for chunk in chunks]
+            self.passages.extend(new_passages)
+            if self.path:
+                with open(self._passages_file(), "a", encoding="utf-8") as passages_file:
+                    passages_file.write("".join(json.dumps(passage, default=json_default) + "\n" for passage in new_passages))
+                self._dirty = True
+        return len(chunks)
+
+    def add_answer_in_background(self, query: str, response: str, sources: Optional[List[Any]] = None) -> None:
+        """Index the passages of an answer in a worker thread, without waiting for it"""
+        task = asyncio.create_task(asyncio.to_thread(self.add_answer, query, response, sources))
+        self._pending_adds.add(task)
+        task.add_done_callback(self._added)
+
+    def _added(self, task: asyncio.Task) -> None:
+        self._pending_adds.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Could not index a past answer: {task.exception()}")
+
+    def flush(self) -> None:
+        """Write a memory-mapped index to disk, if answers were added since the last write"""
+        if self._dirty:
+            self._dirty = False
+            self.index.flush()
+
+    def retrieve(self, query: str) -> List[Dict[str, Any]]:
+        """
+        The passages closest to a query, most similar first
+
+        Returns:
+            Passages with their query, text, sources and score
+        """
+        self._retrievals += 1
+        vector = self.embedder.embed(query)
+        if not vector.any():
+            return []
+        passages = []
+        seen_texts = set()
+        for row, score in self.index.search(vector, self.top_k * 2):
+            if score < self.min_score or row >= len(self.passages):
+                continue
+            passage = self.passages[row]
+            if passage["text"] in seen_texts:
+                continue
+            seen_texts.add(passage["text"])
+            passages.append({**passage, "score": round(score, 4)})
+            if len(passages) == self.top_k:
+                break
+        return passages
+
+    def covers(self, passages: List[Dict[str, Any]]) -> bool:
+        """Whether passages answer their query well enough to skip the search"""
+        if self.skip_search_score > 1.0:
+            return False
+        return (
+            len(passages) >= self.skip_min_passages
+            and passages[0]["score"] >= self.skip_search_score
+            and any(passage["sources"] for passage in passages)
+        )
+
+    def finder_output(self, passages: List[Dict[str, Any]]) -> str:
+        """Passages and their references, formatted like a finder_agent answer"""
+        # The passages may answer other users' questions, which are never shown
+        sections = [passage["text"] for passage in passages]
+        references = []
+        seen = SourceIndex(title_similarity=settings.SOURCE_TITLE_SIMILARITY)
+        for passage in passages:
+            for source in passage["sources"]:
+                if source.title and seen.add_source_if_new(source):
+                    references.append(source.reference_line())
+        output = "\n\n".join(sections)
+        if references:
+            output += f"\n\n{REFERENCES_MARKER}\n" + "\n".join(references)
+        return output
+
+    def finder_context(self, passages: List[Dict[str, Any]]) -> str:
+        """Passages as context for a finder request, cut to context_chars"""
+        lines = ["Context from earlier answers (check it, and search for anything missing or outdated):"]
+        length = len(lines[0])
+        for passage in passages:
+            line = f"- {passage['text']}"
+            if length + len(line) > self.context_chars:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        return "\n".join(lines) if len(lines) > 1 else ""
+
+    def record(self, skipped_search: bool) -> None:
+        if skipped_search:
+            self._skipped_searches += 1
+        else:
+            self._context_injections += 1
+
+    async def start(self, db, bootstrap_limit: int = 2000) -> None:
+        """Fill an empty index from recent query history, and write the index to disk periodically, in the background"""
+        if self.path and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_periodically())
+        if self.passages or bootstrap_limit <= 0:
+            return
+        self._bootstrap_task = asyncio.create_task(self._bootstrap(db, bootstrap_limit))
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                logger.warning(f"Could not write the past answer index: {e}")
+
+    async def _bootstrap(self, db, limit: int) -> None:
+        try:
+            documents = await db.query_history.find(
+                {"response": {"$exists": True}}, {"query": 1, "response": 1, "sources": 1}
+            ).sort([("timestamp", -1)]).limit(limit).to_list(length=limit)
+
+            def index_documents() -> int:
+                return sum(
+                    self.add_answer(document.get("query", ""), document.get("response", ""), document.get("sources"))
+                    for document in documents
+                )
+
+            added = await asyncio.to_thread(index_documents)
+            logger.info(f"Indexed {added} passages from {len(documents)} past answers")
+        except Exception as e:
+            logger.warning(f"Could not index past answers: {e}")
+
+    async def close(self) -> None:
+        """Stop indexing, finish the answers being indexed and write the index to disk"""
+        for task in (self._bootstrap_task, self._flush_task):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._flush_task = None
+        if self._pending_adds:
+            await asyncio.gather(*self._pending_adds, return_exceptions=True)
+        self._dirty = True
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.index.stats(),
+            "passages": len(self.passages),
+            "answers": len(self._queries),
+            "retrievals": self._retrievals,
+            "skipped_searches": self._skipped_searches,
+            "context_injections": self._context_injections
+        }
+
+
+past_answers = PastAnswerIndex(
+    path=settings.RAG_INDEX_PATH,
+    dim=settings.RAG_EMBEDDING_DIM,
+    top_k=settings.RAG_TOP_K,
+    min_score=settings.RAG_MIN_SCORE,
+    skip_search_score=settings.RAG_SKIP_SEARCH_SCORE,
+    skip_min_passages=settings.RAG_SKIP_MIN_PASSAGES,
+    context_chars=settings.RAG_CONTEXT_CHARS,
+    nprobe=settings.RAG_NPROBE,
+    flush_interval=settings.RAG_FLUSH_INTERVAL_SECONDS
+)
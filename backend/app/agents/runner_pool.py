@@ -0,0 +1,201 @@
+"""
+Pool of long-lived ADK runners for the knowledge pipeline.
+
+Building the agent tree, the outer Runner and the model clients is done once
+at startup instead of on every query. Requests lease a runner for the duration
+of their pipeline run, which also bounds how many pipelines run at once.
+
+Sub-agents called through an AgentTool (the finder and the organizer) still get
+a short-lived Runner from ADK on every tool call; the pool only makes sure the
+model clients behind them are shared, including the ones wrapped in ResilientLlm.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import time
+
+from google.adk.agents import BaseAgent, LlmAgent
+from google.adk.models.registry import LLMRegistry
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService
+from google.adk.tools.agent_tool import AgentTool
+from loguru import logger
+
+from app.agents.resilient_llm import ResilientLlm
+
+
+class RunnerPoolTimeout(Exception):
+    """
+    Raised when no runner becomes available within the acquire timeout
+    """
+
+
+def iter_llm_agents(agent: BaseAgent) -> List[LlmAgent]:
+    """
+    Collect every LlmAgent of an agent tree, including agents wrapped in AgentTools
+    """
+    found = []
+    pending = [agent]
+    while pending:
+        current = pending.pop()
+        if isinstance(current, LlmAgent):
+            found.append(current)
+            pending.extend(tool.agent for tool in current.tools if isinstance(tool, AgentTool))
+        pending.extend(current.sub_agents)
+    return found
+
+
+class RunnerPool:
+    """
+    A fixed-size pool of runners, each with its own agent tree
+    """
+
+    def __init__(
+        self,
+        size: int,
+        agent_factory: Callable[[], BaseAgent],
+        app_name: str,
+        session_service: BaseSessionService,
+        acquire_timeout: Optional[float] = None
+    ):
+        """
+        Args:
+            size: Number of runners, i.e. the maximum number of concurrent pipeline runs
+            agent_factory: Builds a new root agent tree for each runner
+            app_name: ADK app name the runners are registered under
+            session_service: Session service shared by all runners
+            acquire_timeout: Seconds to wait for a free runner, None waits indefinitely
+        """
+        self.size = size
+        self.agent_factory = agent_factory
+        self.app_name = app_name
+        self.session_service = session_service
+        self.acquire_timeout = acquire_timeout
+
+        self._available: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+        self._models: Dict[str, Any] = {}
+
+        # Metrics
+        self._waiting = 0
+        self._leases = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+
+    @property
+    def started(self) -> bool:
+        return self._available is not None
+
+    def _shared_model(self, name: str) -> Any:
+        """Shared model instance for a model name, created on first use"""
+        model = self._models.get(name)
+        if model is None:
+            model = LLMRegistry.new_llm(name)
+            try:
+                # Create the API client up front rather than on the first query
+                getattr(model, "api_client", None)
+            except Exception as e:
+                logger.warning(f"Could not warm up the client for model {name}: {e}")
+            self._models[name] = model
+        return model
+
+    def _resolve_models(self, agent: BaseAgent) -> None:
+        """
+        Replace model names with shared model instances
+
+        LlmAgent resolves a string model into a new client on every LLM call,
+        so pinning the resolved instance removes that cost from the hot path.
+        Models wrapped in a ResilientLlm were resolved from their name when the
+        tree was built; those are swapped for the shared instance as well so
+        every runner reuses one client per model. Model instances that were
+        passed in directly (e.g. FakeLlm) are left alone.
+        """
+        for llm_agent in iter_llm_agents(agent):
+            model = llm_agent.model
+            if isinstance(model, str):
+                if model:
+                    llm_agent.model = self._shared_model(model)
+            elif isinstance(model, ResilientLlm) and self._is_registry_model(model.inner):
+                model.inner = self._shared_model(model.inner.model)
+
+    @staticmethod
+    def _is_registry_model(model: Any) -> bool:
+        """Whether a model instance is the registry's default class for its name"""
+        try:
+            return type(model) is LLMRegistry.resolve(model.model)
+        except ValueError:
+            return False
+
+    def build_runner(self) -> Runner:
+        """Build and warm up a new runner"""
+        agent = self.agent_factory()
+        self._resolve_models(agent)
+        return Runner(
+            agent=agent,
+            app_name=self.app_name,
+            session_service=self.session_service
+        )
+
+    async def start(self) -> None:
+        """Build and warm up all runners. Safe to call more than once."""
+        async with self._start_lock:
+            if self.started:
+                return
+
+            started_at = time.perf_counter()
+            available = asyncio.Queue(maxsize=self.size)
+            for _ in range(self.size):
+                available.put_nowait(self.build_runner())
+
+            self._available = available
+            logger.info(f"Runner pool started with {self.size} runners in {time.perf_counter() - started_at:.3f}s")
+
+    async def close(self) -> None:
+        """Release all runners"""
+        async with self._start_lock:
+            self._available = None
+            self._models.clear()
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Lease a runner for one pipeline run
+
+        Waits for a free runner when all of them are in use.
+
+        Raises:
+            RunnerPoolTimeout: No runner became available within acquire_timeout
+        """
+        if not self.started:
+            await self.start()
+        available = self._available
+
+        self._waiting += 1
+        wait_started = time.perf_counter()
+        try:
+            runner = await asyncio.wait_for(available.get(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise RunnerPoolTimeout(f"No agent runner available after {self.acquire_timeout}s")
+        finally:
+            self._waiting -= 1
+            self._total_wait += time.perf_counter() - wait_started
+
+        self._leases += 1
+        try:
+            yield runner
+        finally:
+            available.put_nowait(runner)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current pool usage"""
+        available = self._available.qsize() if self._available is not None else 0
+        return {
+            "size": self.size,
+            "available": available,
+            "in_use": self.size - available if self.started else 0,
+            "waiting": self._waiting,
+            "leases": self._leases,
+            "timeouts": self._timeouts,
+            "total_wait_seconds": round(self._total_wait, 6)
+        }
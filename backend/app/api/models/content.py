@@ -7,6 +7,7 @@ from pydantic import BaseModel, Field, ConfigDict
 from bson import ObjectId
 
 from app.api.models.user import PyObjectId
+from app.utils.sources import Source
 
 class ContentBase(BaseModel):
     """
@@ -111,7 +112,7 @@ class SavedSearchResult(BaseModel):
     title: str
     snippet: str
     content: str
-    sources: List[Dict[str, Any]] = Field(default_factory=list)
+    sources: List[Source] = Field(default_factory=list)
     saved_at: datetime = Field(default_factory=datetime.utcnow)
     
     model_config = ConfigDict(
@@ -127,7 +128,7 @@ class SaveSearchResultRequest(BaseModel):
     title: str
     snippet: str
     content: str
-    sources: List[Dict[str, Any]] = Field(default_factory=list)
+    sources: List[Source] = Field(default_factory=list)
     
     model_config = ConfigDict(
         populate_by_name=True,
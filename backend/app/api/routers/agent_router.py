@@ -2,37 +2,95 @@
 Agent router for handling information retrieval via Google ADK agents
 """
 from typing import Dict, Any, Optional, List
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from contextlib import aclosing
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Request, status
+from fastapi.responses import StreamingResponse
+from loguru import logger
 from pydantic import BaseModel
 
 from app.api.models.user import UserInDB
-from app.auth.jwt import get_current_active_user
-from app.agents.knowledge_agent import get_information
+from app.auth.jwt import get_current_active_reader, get_current_active_user
+from app.agents.knowledge_agent import get_information, stream_information
 from app.db.mongodb import get_database
+from app.db.write_behind import history_writer
+from app.db.search import source_facet_fields
+from app.utils.sources import Source
+from app.agents.resilient_llm import CircuitOpenError
+from app.utils.admission import AdmissionRejected
+from app.utils.fast_json import FastJSONResponse, dumps
+from app.utils.log import truncate
+from app.utils.single_flight import SingleFlightTimeout
+from app.utils.pagination import (
+    NEXT_CURSOR_HEADER, after_cursor_filter, descending_sort, next_cursor
+)
 from datetime import datetime
-import logging
 
 router = APIRouter()
 
+def admission_rejected_exception(rejection: AdmissionRejected) -> HTTPException:
+    """
+    Error returned when admission control refuses an agent query
+    """
+    return HTTPException(
+        status_code=rejection.status_code,
+        detail="Too many agent queries, please try again shortly",
+        headers={"Retry-After": str(rejection.retry_after)},
+    )
+
+def models_unavailable_exception(error: CircuitOpenError) -> HTTPException:
+    """
+    Error returned when the models are failing and no cached answer can stand in
+    """
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The knowledge agent is temporarily unavailable, please try again shortly",
+        headers={"Retry-After": str(max(1, round(error.retry_after)))},
+    )
+
 class QueryInput(BaseModel):
     """
     Input model for agent queries
     """
     query: str
     additional_context: Optional[Dict[str, Any]] = None
+    research_mode: bool = False  # Fan the search out into concurrent sub-queries
 
 class AgentResponse(BaseModel):
     """
     Response model for agent queries
     """
     response: str
-    sources: Optional[List[Dict[str, Any]]] = None
+    sources: Optional[List[Source]] = None
     metadata: Optional[Dict[str, Any]] = None
 
-@router.post("/query", response_model=AgentResponse)
+async def save_query_to_history(user_id: str, query: str, response: Dict[str, Any]):
+    """
+    Save an agent response to the user's query history
+    
+    The entry is written in the background by history_writer. Errors are
+    logged but never fail the request.
+    """
+    sources = response.get("sources", [])
+    await history_writer.enqueue({
+        "user_id": user_id,
+        "query": query,
+        "response": response.get("response", ""),
+        "sources": sources,
+        **source_facet_fields(sources),
+        "timestamp": datetime.utcnow()
+    })
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    Format a server-sent event
+    """
+    return f"event: {event}\ndata: {dumps(data).decode('utf-8')}\n\n"
+
+@router.post("/query", response_model=AgentResponse, response_class=FastJSONResponse)
 async def query_agent(
     query_input: QueryInput,
     save_to_history: bool = Query(True),
+    use_cache: bool = Query(True),
     current_user: UserInDB = Depends(get_current_active_user)
 ):
     """
@@ -41,6 +99,7 @@ async def query_agent(
     Args:
         query_input: The query and optional additional context
         save_to_history: Whether to save the query to history
+        use_cache: Whether the answer may be served from the answer cache
         current_user: The current user
         
     Returns:
@@ -48,78 +107,177 @@ async def query_agent(
     """
     try:
         # Use our new implementation for getting information
-        response = await get_information(query_input.query)
+        response = await get_information(query_input.query, user_id=current_user.id, use_cache=use_cache, research=query_input.research_mode)
         
         # Save query to history if requested
         if save_to_history:
-            try:
-                db = get_database()
-                await db.query_history.insert_one({
-                    "user_id": current_user.id,
-                    "query": query_input.query,
-                    "response": response.get("response", ""),
-                    "sources": response.get("sources", []),
-                    "timestamp": datetime.utcnow()
-                })
-            except Exception as hist_error:
-                # Log error but don't fail the request
-                logging.error(f"Failed to save query to history: {str(hist_error)}")
+            await save_query_to_history(current_user.id, query_input.query, response)
         
         # Return response
-        return AgentResponse(
-            response=response.get("response", ""),
-            sources=response.get("sources", []),
-            metadata=response.get("metadata", {})
+        return FastJSONResponse({
+            "response": response.get("response", ""),
+            "sources": response.get("sources", []),
+            "metadata": response.get("metadata", {})
+        })
+    
+    except AdmissionRejected as e:
+        raise admission_rejected_exception(e)
+    
+    except CircuitOpenError as e:
+        raise models_unavailable_exception(e)
+    
+    except SingleFlightTimeout as e:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail=f"Agent error: {str(e)}"
         )
     
     except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        logging.error(f"Agent error: {str(e)}\n{error_trace}")
+        logger.exception(f"Agent error: {e}")
         
         raise HTTPException(
             status_code=500,
             detail=f"Agent error: {str(e)}"
         )
 
-@router.get("/history", response_model=List[Dict[str, Any]])
+@router.post("/query/stream")
+async def stream_query_agent(
+    request: Request,
+    query_input: QueryInput,
+    save_to_history: bool = Query(True),
+    use_cache: bool = Query(True),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Query the information agent and stream its progress as server-sent events
+    
+    Events:
+        phase: a pipeline phase started ({"phase": "searching" | "extracting_sources" | "organizing"})
+        content: intermediate text ({"stage": "extracted" | "organized", "text": ...})
+        sources: the validated sources ({"sources": [...]})
+        final: the complete response, same shape as /query
+        error: the agent failed ({"detail": ...}), or the query was not admitted
+            ({"detail": ..., "status": 429 | 503, "retry_after": seconds}), or the
+            models are unavailable and no cached answer can stand in (same shape)
+    
+    The agent run is cancelled as soon as the client disconnects.
+    
+    Args:
+        request: The incoming request, used to detect client disconnects
+        query_input: The query and optional additional context
+        save_to_history: Whether to save the query to history
+        use_cache: Whether the answer may be served from the answer cache
+        current_user: The current user
+    """
+    async def event_stream():
+        try:
+            async with aclosing(stream_information(query_input.query, user_id=current_user.id, use_cache=use_cache, research=query_input.research_mode)) as pipeline_events:
+                async for pipeline_event in pipeline_events:
+                    if await request.is_disconnected():
+                        logger.info(f"Client disconnected, cancelling agent query: {truncate(query_input.query, 200)}")
+                        return
+                    
+                    if pipeline_event["event"] == "final":
+                        response = pipeline_event["data"]
+                        if save_to_history:
+                            await save_query_to_history(current_user.id, query_input.query, response)
+                        yield format_sse("final", {
+                            "response": response.get("response", ""),
+                            "sources": response.get("sources", []),
+                            "metadata": response.get("metadata", {})
+                        })
+                    else:
+                        yield format_sse(pipeline_event["event"], pipeline_event["data"])
+        except AdmissionRejected as e:
+            yield format_sse("error", {
+                "detail": admission_rejected_exception(e).detail,
+                "status": e.status_code,
+                "retry_after": e.retry_after
+            })
+        except CircuitOpenError as e:
+            yield format_sse("error", {
+                "detail": models_unavailable_exception(e).detail,
+                "status": status.HTTP_503_SERVICE_UNAVAILABLE,
+                "retry_after": max(1, round(e.retry_after))
+            })
+        except Exception as e:
+            logger.exception(f"Agent streaming error: {e}")
+            yield format_sse("error", {"detail": f"Agent error: {str(e)}"})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering so events reach the client immediately
+        }
+    )
+
+# Fields returned by the lightweight history list mode
+HISTORY_SUMMARY_PROJECTION = {"query": 1, "timestamp": 1}
+
+def history_entry_to_dict(document: Dict[str, Any], summary: bool = False) -> Dict[str, Any]:
+    """
+    Convert a query history document to its API representation
+    
+    Compacted entries (see app.db.history) return their summary as the response.
+    """
+    entry = {
+        "id": str(document["_id"]),
+        "query": document["query"],
+    }
+    if not summary:
+        compacted = "response" not in document
+        entry["response"] = document.get("summary", "") if compacted else document["response"]
+        entry["sources"] = document.get("sources", [])
+        entry["compacted"] = compacted
+        if compacted:
+            entry["source_domains"] = document.get("source_domains", [])
+    entry["timestamp"] = document["timestamp"]
+    return entry
+
+@router.get("/history", response_model=List[Dict[str, Any]], response_class=FastJSONResponse)
 async def get_query_history(
     limit: int = Query(10, ge=1, le=50),
-    current_user: UserInDB = Depends(get_current_active_user)
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    fields: str = Query("full", pattern="^(full|summary)$", description="summary returns only id, query and timestamp"),
+    current_user: UserInDB = Depends(get_current_active_reader)
 ):
     """
-    Get user's query history
+    Get user's query history, newest first
     
     Args:
         limit: Maximum number of history items to return
+        cursor: Cursor of the page to return, from the X-Next-Cursor header
+        fields: "full", or "summary" to leave out responses and sources
         current_user: The current user
         
     Returns:
-        List of query history items
+        List of query history items. The cursor of the next page, if any, is
+        returned in the X-Next-Cursor header.
     """
+    try:
+        query = {"user_id": current_user.id, **after_cursor_filter("timestamp", cursor)}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
     try:
         db = get_database()
         
-        # Get history
-        cursor = db.query_history.find(
-            {"user_id": current_user.id}
-        ).sort("timestamp", -1).limit(limit)
-        
-        # Convert to list
-        history_list = []
-        async for document in cursor:
-            history_list.append({
-                "id": str(document["_id"]),
-                "query": document["query"],
-                "response": document["response"],
-                "sources": document.get("sources", []),
-                "timestamp": document["timestamp"]
-            })
+        # Get history, with one extra entry to know whether there is a next page
+        summary = fields == "summary"
+        documents = await db.query_history.find(
+            query, HISTORY_SUMMARY_PROJECTION if summary else None
+        ).sort(descending_sort("timestamp")).limit(limit + 1).to_list(length=limit + 1)
         
-        return history_list
+        response = FastJSONResponse([history_entry_to_dict(document, summary) for document in documents])
+        page_cursor = next_cursor(documents, "timestamp", limit)
+        if page_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = page_cursor
+        return response
         
     except Exception as e:
-        logging.error(f"Error retrieving query history: {str(e)}")
+        logger.error(f"Error retrieving query history: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Error retrieving query history: {str(e)}"
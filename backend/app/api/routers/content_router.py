@@ -9,8 +9,13 @@ from bson import ObjectId
 from app.api.models.user import UserInDB
 from app.api.models.content import SavedSearchResult
 
-from app.auth.jwt import get_current_active_user
+from app.auth.jwt import get_current_active_user, get_current_active_reader
 from app.db.mongodb import get_database
+from app.db.search import local_search, source_facet_fields
+from app.utils.fast_json import FastJSONResponse
+from app.utils.pagination import (
+    NEXT_CURSOR_HEADER, after_cursor_filter, descending_sort, next_cursor
+)
 
 router = APIRouter()
 
@@ -35,7 +40,10 @@ async def save_content_v2(
         )
 
         try:
-            result = await db.saved_search_results.insert_one(saved_search.model_dump(by_alias=True))       
+            document = saved_search.model_dump(by_alias=True)
+            document.update(source_facet_fields(document["sources"]))
+            result = await db.saved_search_results.insert_one(document)
+            local_search.invalidate("saved", current_user.id)
             return {"message": "Content saved successfully", "id": str(result.inserted_id)}
         except Exception as e:
             raise HTTPException(
@@ -52,29 +60,93 @@ async def save_content_v2(
         )
 
 
-@router.get("/saved", response_model=List[Dict])
+# Fields returned by the lightweight list mode
+SUMMARY_PROJECTION = {"title": 1, "snippet": 1, "saved_at": 1}
+
+def saved_result_to_dict(document: Dict, summary: bool = False) -> Dict:
+    """
+    Convert a saved search result document to its API representation
+    """
+    result = {
+        "id": str(document["_id"]),
+        "title": document["title"],
+        "snippet": document["snippet"],
+    }
+    if not summary:
+        result["content"] = document["content"]
+        result["sources"] = document["sources"]
+    result["saved_at"] = document["saved_at"]
+    return result
+
+def saved_result_id_filter(content_id: str) -> Dict:
+    """
+    Match a saved search result id stored either as a string or as an ObjectId
+    """
+    if ObjectId.is_valid(content_id):
+        return {"_id": {"$in": [content_id, ObjectId(content_id)]}}
+    return {"_id": content_id}
+
+@router.get("/saved", response_model=List[Dict], response_class=FastJSONResponse)
 async def get_saved_search_results(
-    current_user: UserInDB = Depends(get_current_active_user)
+    limit: Optional[int] = Query(None, ge=1, le=100, description="Page size, omit to get every saved result"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    fields: str = Query("full", pattern="^(full|summary)$", description="summary returns only id, title, snippet and saved_at"),
+    current_user: UserInDB = Depends(get_current_active_reader)
 ):
     """
-    Get user's saved search results
+    Get user's saved search results, newest first
+    
+    When limit is set, the cursor for the next page is returned in the
+    X-Next-Cursor header, which is absent on the last page.
     """
     db = get_database()
     
-    saved_results = []
-    cursor = db.saved_search_results.find({"user_id": current_user.id}).sort("saved_at", -1)
+    try:
+        query = {"user_id": current_user.id, **after_cursor_filter("saved_at", cursor)}
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    
+    summary = fields == "summary"
+    find_cursor = db.saved_search_results.find(
+        query, SUMMARY_PROJECTION if summary else None
+    ).sort(descending_sort("saved_at"))
+    page_cursor = None
+    if limit:
+        # Fetch one extra document to know whether there is a next page
+        documents = await find_cursor.limit(limit + 1).to_list(length=limit + 1)
+        page_cursor = next_cursor(documents, "saved_at", limit)
+    else:
+        documents = await find_cursor.to_list(length=None)
     
-    async for document in cursor:
-        saved_results.append({
-            "id": str(document["_id"]),
-            "title": document["title"],
-            "snippet": document["snippet"],
-            "content": document["content"],
-            "sources": document["sources"],
-            "saved_at": document["saved_at"]
-        })
+    response = FastJSONResponse([saved_result_to_dict(document, summary) for document in documents])
+    if page_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = page_cursor
+    return response
+
+@router.get("/saved/{content_id}", response_model=Dict, response_class=FastJSONResponse)
+async def get_saved_search_result(
+    content_id: str = Path(...),
+    current_user: UserInDB = Depends(get_current_active_reader)
+):
+    """
+    Get a single saved search result with its full content
+    """
+    db = get_database()
+    
+    document = await db.saved_search_results.find_one({
+        **saved_result_id_filter(content_id),
+        "user_id": current_user.id
+    })
+    if not document:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Saved search result not found"
+        )
     
-    return saved_results
+    return FastJSONResponse(saved_result_to_dict(document))
 
 @router.delete("/delete", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_saved_search_result(
@@ -85,7 +157,6 @@ async def delete_saved_search_result(
     """
     Delete a saved search result
     """
-    print(f"content_id passed from front end: {content_id}")
     db = get_database()
     
     try:
@@ -99,6 +170,7 @@ async def delete_saved_search_result(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Saved search result not found"
             )
+        local_search.invalidate("saved", current_user.id)
     except Exception as e:
         if "not found" in str(e).lower():
             raise e
@@ -0,0 +1,232 @@
+"""
+Diagnostics router for database migrations, indexes and query plans
+"""
+from typing import Any, Callable, Dict, List, NamedTuple
+import json
+
+from bson import json_util
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from app.agents.knowledge_agent import query_flight
+from app.agents.resilient_llm import resilience_stats
+from app.api.models.user import UserInDB
+from app.auth.jwt import get_current_active_user
+from app.db.migrations import migration_status
+from app.db.write_behind import history_writer
+from app.db.mongodb import get_database
+from app.utils.admission import admission_controller
+from app.utils.config import settings
+from app.utils.local_formatter import local_formatter
+from app.utils.pagination import descending_sort
+
+router = APIRouter()
+
+
+class QueryShape(NamedTuple):
+    """
+    A query issued by the routers, explained by the /explain endpoint
+    """
+    collection: str
+    filter: Callable[[UserInDB], Dict[str, Any]]
+    sort: List[tuple]
+    limit: int
+
+
+# The hot queries of the routers, run for the calling user
+QUERY_SHAPES: Dict[str, QueryShape] = {
+    "query_history": QueryShape(
+        "query_history", lambda user: {"user_id": user.id}, descending_sort("timestamp"), 10
+    ),
+    "saved_search_results": QueryShape(
+        "saved_search_results", lambda user: {"user_id": user.id}, descending_sort("saved_at"), 20
+    ),
+    "user_by_email": QueryShape(
+        "users", lambda user: {"email": user.email}, [], 1
+    ),
+}
+
+
+async def require_diagnostics(current_user: UserInDB = Depends(get_current_active_user)) -> UserInDB:
+    """
+    Only serve diagnostics when they are enabled, and to the users listed in DIAGNOSTICS_ADMIN_USER_IDS
+
+    Diagnostics describe every user's data (indexes, plans, profiled queries),
+    so being logged in is not enough.
+    """
+    if not settings.DIAGNOSTICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if str(current_user.id) not in settings.DIAGNOSTICS_ADMIN_USER_IDS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Diagnostics are restricted to administrators")
+    return current_user
+
+
+def to_json(document: Any) -> Any:
+    """
+    Convert a BSON document (ObjectIds, datetimes...) to plain JSON values
+    """
+    return json.loads(json_util.dumps(document))
+
+
+def command_shape(command: Any) -> Any:
+    """
+    Reduce a profiled command to its shape: the keys are kept, every value becomes "?"
+
+    Commands hold other users' filters (ids, emails, queries), which must not be returned.
+    """
+    if isinstance(command, dict):
+        return {key: command_shape(value) for key, value in command.items()}
+    if isinstance(command, (list, tuple)):
+        return [command_shape(item) for item in command]
+    return "?"
+
+
+def plan_stages(plan: Dict[str, Any]) -> List[str]:
+    """
+    Flatten a query plan into its stage names, outermost first
+    """
+    stages = []
+    pending = [plan]
+    while pending:
+        current = pending.pop(0)
+        if not current:
+            continue
+        stage = current.get("stage")
+        if stage:
+            stages.append(f"{stage}({current['indexName']})" if current.get("indexName") else stage)
+        if "queryPlan" in current:
+            pending.append(current["queryPlan"])
+        if "inputStage" in current:
+            pending.append(current["inputStage"])
+        pending.extend(current.get("inputStages", []))
+    return stages
+
+
+def summarize_explain(explain: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Keep the parts of an explain result that tell whether a query is efficient
+    """
+    planner = explain.get("queryPlanner", {})
+    stats = explain.get("executionStats", {})
+    stages = plan_stages(planner.get("winningPlan", {}))
+    execution_ms = stats.get("executionTimeMillis", 0)
+    collection_scan = any(stage.startswith("COLLSCAN") for stage in stages)
+    return {
+        "stages": stages,
+        "collection_scan": collection_scan,
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": execution_ms,
+        "slow": collection_scan or execution_ms >= settings.DIAGNOSTICS_SLOW_QUERY_MS
+    }
+
+
+@router.get("/migrations", response_model=List[Dict[str, Any]])
+async def get_migrations(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    List known migrations and whether they have been applied
+    """
+    return await migration_status(get_database())
+
+
+@router.get("/indexes", response_model=Dict[str, Any])
+async def get_indexes(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    List the indexes of every collection
+    """
+    db = get_database()
+    indexes = {}
+    for collection in sorted(await db.list_collection_names()):
+        if collection.startswith("system."):
+            continue
+        indexes[collection] = to_json(await db[collection].index_information())
+    return indexes
+
+
+@router.get("/explain", response_model=Dict[str, Any])
+async def explain_queries(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    Explain the routers' hot queries for the current user and flag slow plans
+    """
+    db = get_database()
+    plans = {}
+    for name, shape in QUERY_SHAPES.items():
+        cursor = db[shape.collection].find(shape.filter(current_user)).limit(shape.limit)
+        if shape.sort:
+            cursor = cursor.sort(shape.sort)
+        try:
+            plans[name] = summarize_explain(await cursor.explain())
+        except Exception as e:
+            plans[name] = {"error": str(e)}
+    return plans
+
+
+@router.get("/write-behind", response_model=Dict[str, Any])
+async def get_write_behind_stats(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    Queue depth and counters of the query history write-behind queue
+    """
+    return history_writer.stats()
+
+
+@router.get("/formatter", response_model=Dict[str, Any])
+async def get_formatter_stats(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    How often content was formatted locally instead of by the organizer agent
+    """
+    return local_formatter.stats()
+
+
+@router.get("/single-flight", response_model=Dict[str, Any])
+async def get_single_flight_stats(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    Agent queries in flight and how many callers shared another caller's run
+    """
+    return query_flight.stats()
+
+
+@router.get("/admission", response_model=Dict[str, Any])
+async def get_admission_stats(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    Running and queued agent queries, wait times and rejections
+    """
+    return admission_controller.stats()
+
+
+@router.get("/models", response_model=Dict[str, Any])
+async def get_model_stats(current_user: UserInDB = Depends(require_diagnostics)):
+    """
+    Circuit breaker state and call latencies of the agent models
+    """
+    return resilience_stats()
+
+
+@router.get("/slow-queries", response_model=List[Dict[str, Any]])
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    current_user: UserInDB = Depends(require_diagnostics)
+):
+    """
+    Recent slow operations recorded by the MongoDB profiler
+
+    Empty unless profiling is enabled on the database (db.setProfilingLevel).
+    """
+    db = get_database()
+    cursor = db["system.profile"].find(
+        {"millis": {"$gte": settings.DIAGNOSTICS_SLOW_QUERY_MS}}
+    ).sort("ts", -1).limit(limit)
+
+    slow_queries = []
+    async for document in cursor:
+        slow_queries.append(to_json({
+            "ts": document.get("ts"),
+            "namespace": document.get("ns"),
+            "op": document.get("op"),
+            "millis": document.get("millis"),
+            "plan_summary": document.get("planSummary"),
+            "keys_examined": document.get("keysExamined"),
+            "docs_examined": document.get("docsExamined"),
+            "returned": document.get("nreturned"),
+            "command": command_shape(document.get("command"))
+        }))
+    return slow_queries
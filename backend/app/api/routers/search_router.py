@@ -0,0 +1,64 @@
+"""
+Search router for full-text search over saved results and query history
+"""
+from typing import Any, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from loguru import logger
+from pymongo.errors import OperationFailure
+
+from app.api.models.user import UserInDB
+from app.api.routers.agent_router import history_entry_to_dict
+from app.api.routers.content_router import saved_result_to_dict
+from app.auth.jwt import get_current_active_reader
+from app.db.mongodb import get_database
+from app.db.search import search_documents
+from app.utils.fast_json import FastJSONResponse
+
+router = APIRouter()
+
+@router.get("", response_model=Dict[str, Any], response_class=FastJSONResponse)
+async def search(
+    q: str = Query(..., min_length=1, max_length=200, description="Words to look for"),
+    scope: str = Query("saved", pattern="^(saved|history)$", description="Saved results or query history"),
+    domain: Optional[str] = Query(None, max_length=255, description="Only results citing a source from this domain"),
+    year: Optional[str] = Query(None, max_length=4, description="Only results citing a source from this year"),
+    limit: int = Query(20, ge=1, le=50),
+    offset: int = Query(0, ge=0, le=1000, description="next_offset of the previous page"),
+    current_user: UserInDB = Depends(get_current_active_reader)
+):
+    """
+    Search the user's saved results or query history, best matches first
+
+    Returns:
+        results: Summaries of the matching documents, each with its score
+        total: Number of matching documents
+        facets: Counts of the matching documents by source domain and year
+        next_offset: Offset of the next page, None on the last page
+        backend: "text" for the MongoDB text index, "bm25" for the local index
+    """
+    try:
+        outcome = await search_documents(
+            get_database(), scope, current_user.id, q,
+            domain=domain, year=year, limit=limit, offset=offset
+        )
+    except OperationFailure as e:
+        logger.error(f"Search over {scope} failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Search is temporarily unavailable"
+        )
+
+    to_dict = saved_result_to_dict if scope == "saved" else history_entry_to_dict
+    results = []
+    for document in outcome["results"]:
+        result = to_dict(document, summary=True)
+        result["score"] = round(document["score"], 4)
+        results.append(result)
+
+    return FastJSONResponse({
+        "results": results,
+        "total": outcome["total"],
+        "facets": outcome["facets"],
+        "next_offset": offset + limit if offset + limit < outcome["total"] else None,
+        "backend": outcome["backend"]
+    })
@@ -0,0 +1,92 @@
+"""
+Transfer router for bulk export and import of saved results and query history
+"""
+from typing import Any, Dict
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from loguru import logger
+from pymongo.errors import PyMongoError
+
+from app.api.models.user import UserInDB
+from app.auth.jwt import get_current_active_reader, get_current_active_user
+from app.db.mongodb import get_database
+from app.db.search import local_search
+from app.db.transfer import (
+    GZIP_MEDIA_TYPE, NDJSON_MEDIA_TYPE, ImportRejected, export_documents, import_documents
+)
+from app.utils.config import settings
+
+router = APIRouter()
+
+SCOPE_PATTERN = "^(saved|history)$"
+
+@router.get("/export")
+async def export_data(
+    scope: str = Query(..., pattern=SCOPE_PATTERN, description="Saved results or query history"),
+    compress: bool = Query(False, description="Send a gzip file instead of plain NDJSON"),
+    current_user: UserInDB = Depends(get_current_active_reader)
+):
+    """
+    Download all of the user's saved results or query history, oldest first
+
+    One document per line, in MongoDB relaxed extended JSON. The file is
+    streamed while it is read from the database, so it can be of any size.
+    """
+    extension = "ndjson.gz" if compress else "ndjson"
+    filename = f"articube-{scope}-{datetime.utcnow():%Y%m%d}.{extension}"
+    return StreamingResponse(
+        export_documents(
+            get_database(), scope, current_user.id,
+            batch_size=settings.TRANSFER_EXPORT_BATCH_SIZE, compress=compress
+        ),
+        media_type=GZIP_MEDIA_TYPE if compress else NDJSON_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/import", response_model=Dict[str, Any])
+async def import_data(
+    request: Request,
+    scope: str = Query(..., pattern=SCOPE_PATTERN, description="Saved results or query history"),
+    keep_ids: bool = Query(False, description="Keep the exported ids, to restore or resume an import into the same database"),
+    ordered: bool = Query(False, description="Stop at the first invalid line or failed insert"),
+    current_user: UserInDB = Depends(get_current_active_user)
+):
+    """
+    Add the documents of an export to the user's saved results or query history
+
+    The body is NDJSON as produced by the export, gzip-compressed when sent
+    with Content-Encoding: gzip or Content-Type: application/gzip. Documents
+    get new ids, unless keep_ids is set: documents whose _id already exists
+    are then skipped, so an interrupted import can be sent again.
+
+    Returns:
+        inserted, duplicates, invalid and failed counts, stopped (an ordered
+        import ended early) and errors (the first line errors)
+    """
+    compressed = (
+        request.headers.get("content-encoding", "").lower() == "gzip"
+        or request.headers.get("content-type", "").split(";")[0].strip().lower() in (GZIP_MEDIA_TYPE, "application/x-gzip")
+    )
+    try:
+        summary = await import_documents(
+            get_database(), scope, current_user.id, request.stream(),
+            compressed=compressed,
+            keep_ids=keep_ids,
+            ordered=ordered,
+            batch_size=settings.TRANSFER_IMPORT_BATCH_SIZE,
+            max_documents=settings.TRANSFER_IMPORT_MAX_DOCUMENTS,
+            max_line_bytes=settings.TRANSFER_IMPORT_MAX_LINE_BYTES
+        )
+    except ImportRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except PyMongoError as e:
+        logger.error(f"Import into {scope} failed: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Import is temporarily unavailable"
+        )
+    finally:
+        local_search.invalidate(scope, current_user.id)
+
+    return summary
@@ -3,12 +3,15 @@ User router for user management
 """
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
+from loguru import logger
 
 from app.api.models.user import User, UserCreate, UserUpdate, UserInDB, Token
 from app.auth.jwt import (
     authenticate_user, create_access_token, get_current_active_user,
-    get_password_hash, get_user_by_email
+    get_current_active_reader, get_user_by_email, user_token_claims
 )
+from app.auth.user_cache import user_cache
+from app.auth.hashing import password_hasher, PasswordHasherBusy
 from app.db.mongodb import get_database
 from app.utils.config import settings
 
@@ -16,6 +19,16 @@ from datetime import timedelta
 
 router = APIRouter()
 
+def server_busy_exception() -> HTTPException:
+    """
+    Error returned when the password hashing queue is full
+    """
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-in requests, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register", response_model=User)
 async def register_user(user_data: UserCreate):
     """
@@ -32,7 +45,7 @@ async def register_user(user_data: UserCreate):
             )
         
         # Create new user
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await password_hasher.hash(user_data.password)
         user_in_db = UserInDB(
             email=user_data.email,
             username=user_data.username,
@@ -64,10 +77,11 @@ async def register_user(user_data: UserCreate):
             is_active=created_user["is_active"],
             created_at=created_user["created_at"]
         )
+    except PasswordHasherBusy:
+        raise server_busy_exception()
     except Exception as e:
         # Log the error and return a user-friendly message
-        import logging
-        logging.error(f"Error registering user: {str(e)}")
+        logger.exception(f"Error registering user: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while registering the user: {str(e)}"
@@ -78,8 +92,10 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    print(f"form data sent from front end: {form_data}")
-    user = await authenticate_user(form_data.username, form_data.password)
+    try:
+        user = await authenticate_user(form_data.username, form_data.password)
+    except PasswordHasherBusy:
+        raise server_busy_exception()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -88,14 +104,17 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    token_data = {"sub": str(user.id)}
+    if settings.AUTH_TRUST_TOKEN_CLAIMS:
+        token_data.update(user_token_claims(user))
     access_token = create_access_token(
-        data={"sub": str(user.id)}, expires_delta=access_token_expires
+        data=token_data, expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=User)
-async def read_users_me(current_user: UserInDB = Depends(get_current_active_user)):
+async def read_users_me(current_user: UserInDB = Depends(get_current_active_reader)):
     """
     Get current user
     """
@@ -143,6 +162,7 @@ async def update_user_me(
                 {"_id": user_id},
                 {"$set": update_data}
             )
+            user_cache.invalidate(current_user.id)
             
             if result.matched_count == 0:
                 raise HTTPException(
@@ -169,8 +189,7 @@ async def update_user_me(
     except HTTPException:
         raise  # Re-raise HTTP exceptions as they are already properly formatted
     except Exception as e:
-        import logging
-        logging.error(f"Error updating user: {str(e)}")
+        logger.exception(f"Error updating user: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"An error occurred while updating the user: {str(e)}"
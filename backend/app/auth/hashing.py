@@ -0,0 +1,149 @@
+"""
+Password hashing service.
+
+bcrypt is deliberately slow, so hashing and verification run in a bounded
+thread pool instead of on the event loop. bcrypt releases the GIL while it
+works, which lets the worker threads use separate cores.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import asyncio
+import time
+
+from passlib.context import CryptContext
+
+from app.utils.config import settings
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Raised when too many hashing jobs are already waiting for a worker
+    """
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification in a bounded worker pool
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 4, max_pending: int = 0):
+        """
+        Args:
+            rounds: bcrypt cost factor for new hashes. Hashes made with a different
+                cost are re-hashed the next time their password is verified.
+            max_workers: Number of hashing threads
+            max_pending: Maximum number of jobs waiting for a thread, 0 for no limit
+        """
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds
+        )
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # Metrics
+        self._pending = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._rehashed = 0
+        self._total_wait = 0.0
+        self._total_work = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    def _get_slots(self) -> asyncio.Semaphore:
+        # Jobs queue on the semaphore rather than inside the executor, so the
+        # queue depth is visible and bounded
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        return self._slots
+
+    async def _run(self, func: Callable, *args) -> Any:
+        """Run a hashing function on a worker thread"""
+        if self.max_pending and self._pending >= self.max_pending:
+            self._rejected += 1
+            raise PasswordHasherBusy(f"{self._pending} password hashing jobs are already waiting")
+
+        slots = self._get_slots()
+        self._pending += 1
+        wait_started = time.perf_counter()
+        try:
+            await slots.acquire()
+        finally:
+            self._pending -= 1
+            self._total_wait += time.perf_counter() - wait_started
+
+        self._running += 1
+        work_started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._running -= 1
+            self._completed += 1
+            self._total_work += time.perf_counter() - work_started
+            slots.release()
+
+    async def hash(self, password: str) -> str:
+        """
+        Hash a password with the configured cost factor
+        """
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        """
+        Verify a password against a hash
+        """
+        return await self._run(self.context.verify, password, hashed_password)
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verify a password and re-hash it when its hash uses an outdated cost factor
+
+        Returns:
+            Whether the password matches, and the new hash to store (None if the
+            stored hash is still current or the password didn't match)
+        """
+        valid, new_hash = await self._run(self.context.verify_and_update, password, hashed_password)
+        if new_hash:
+            self._rehashed += 1
+        return valid, new_hash
+
+    def close(self) -> None:
+        """Stop the worker threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._slots = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Current queue depth and totals"""
+        return {
+            "rounds": self.rounds,
+            "workers": self.max_workers,
+            "pending": self._pending,
+            "running": self._running,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "rehashed": self._rehashed,
+            "total_wait_seconds": round(self._total_wait, 6),
+            "total_work_seconds": round(self._total_work, 6)
+        }
+
+
+password_hasher = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
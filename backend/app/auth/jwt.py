@@ -7,32 +7,20 @@ from typing import Optional, Dict, Any
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
+from loguru import logger
 from pydantic import ValidationError
 from bson import ObjectId
 
 from app.api.models.user import UserInDB, TokenData
+from app.auth.hashing import password_hasher
+from app.auth.user_cache import user_cache
 from app.db.mongodb import get_database
 from app.utils.config import settings
-
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from app.utils.tracing import traced
 
 # OAuth2 scheme for token authentication
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl=f"{settings.API_V1_STR}/auth/login")
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """
-    Verify a password against a hash
-    """
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str) -> str:
-    """
-    Hash a password
-    """
-    return pwd_context.hash(password)
-
 async def get_user_by_email(email: str) -> Optional[UserInDB]:
     """
     Get a user by email
@@ -47,8 +35,7 @@ async def get_user_by_email(email: str) -> Optional[UserInDB]:
             return UserInDB(**user_data)
         return None
     except Exception as e:
-        import logging
-        logging.error(f"Error retrieving user by email: {str(e)}")
+        logger.error(f"Error retrieving user by email: {e}")
         return None
 
 async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
@@ -58,15 +45,21 @@ async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
     user = await get_user_by_email(email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return None
     
-    # Update last login time
+    # Update last login time, and the password hash if the cost factor changed
+    update = {"last_login": datetime.utcnow()}
+    if new_hash:
+        update["hashed_password"] = new_hash
+        user.hashed_password = new_hash
     db = get_database()
     await db.users.update_one(
-        {"_id": user.id},
-        {"$set": {"last_login": datetime.utcnow()}}
+        {"_id": ObjectId(user.id)},
+        {"$set": update}
     )
+    user_cache.invalidate(user.id)
     
     return user
 
@@ -83,41 +76,113 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+def user_token_claims(user: UserInDB) -> Dict[str, Any]:
     """
-    Get current authenticated user from token
+    Profile claims embedded in access tokens so read-only endpoints can skip the user lookup
+    """
+    return {
+        "email": user.email,
+        "username": user.username,
+        "full_name": user.full_name,
+        "is_active": user.is_active,
+        "is_verified": user.is_verified,
+        "created_at": user.created_at.isoformat()
+    }
+
+def user_from_token_claims(payload: Dict[str, Any]) -> Optional[UserInDB]:
     """
-    credentials_exception = HTTPException(
+    Build a user from the profile claims of a token, or None if the token has none
+    """
+    if "email" not in payload or "username" not in payload:
+        return None
+    return UserInDB(
+        id=payload["sub"],
+        email=payload["email"],
+        username=payload["username"],
+        full_name=payload.get("full_name"),
+        is_active=payload.get("is_active", True),
+        is_verified=payload.get("is_verified", False),
+        created_at=datetime.fromisoformat(payload["created_at"]) if payload.get("created_at") else datetime.utcnow(),
+        hashed_password=""
+    )
+
+def credentials_exception() -> HTTPException:
+    """
+    Error returned when a token can't be validated
+    """
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_access_token(token: str) -> Dict[str, Any]:
+    """
+    Decode and validate a JWT access token
+    """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
-        token_data = TokenData(user_id=user_id)
+            raise credentials_exception()
+        TokenData(user_id=user_id)
     except (JWTError, ValidationError):
-        raise credentials_exception
+        raise credentials_exception()
+    return payload
+
+async def get_user_by_id(user_id: str) -> Optional[UserInDB]:
+    """
+    Get a user by id, from the user cache when possible
+    """
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    
+    db = get_database()
+    # Convert the string ID to ObjectId for MongoDB
+    user_data = await db.users.find_one({"_id": ObjectId(user_id)})
+    if user_data is None:
+        return None
+        
+    # Convert ObjectId to string for Pydantic model
+    if "_id" in user_data and isinstance(user_data["_id"], ObjectId):
+        user_data["_id"] = str(user_data["_id"])
+        
+    user = UserInDB(**user_data)
+    user_cache.set(user)
+    return user
+
+@traced("auth.get_current_user")
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserInDB:
+    """
+    Get current authenticated user from token
+    """
+    payload = decode_access_token(token)
     
     try:
-        db = get_database()
-        # Convert the string ID to ObjectId for MongoDB
-        object_id = ObjectId(token_data.user_id)
-        user_data = await db.users.find_one({"_id": object_id})
-        if user_data is None:
-            raise credentials_exception
-            
-        # Convert ObjectId to string for Pydantic model
-        if "_id" in user_data and isinstance(user_data["_id"], ObjectId):
-            user_data["_id"] = str(user_data["_id"])
-            
-        return UserInDB(**user_data)
+        user = await get_user_by_id(payload["sub"])
     except Exception as e:
-        import logging
-        logging.error(f"Error fetching user: {str(e)}")
-        raise credentials_exception
+        logger.error(f"Error fetching user: {e}")
+        raise credentials_exception()
+    if user is None:
+        raise credentials_exception()
+    return user
+
+@traced("auth.get_current_reader")
+async def get_current_reader(token: str = Depends(oauth2_scheme)) -> UserInDB:
+    """
+    Get current authenticated user for read-only endpoints
+    
+    With AUTH_TRUST_TOKEN_CLAIMS enabled the user is built from the token's
+    claims without a database lookup, so changes to the account only show up
+    once the user logs in again. The returned user has no password hash.
+    """
+    if settings.AUTH_TRUST_TOKEN_CLAIMS:
+        payload = decode_access_token(token)
+        user = user_from_token_claims(payload)
+        if user is not None:
+            return user
+    return await get_current_user(token)
 
 async def get_current_active_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
     """
@@ -126,3 +191,11 @@ async def get_current_active_user(current_user: UserInDB = Depends(get_current_u
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+async def get_current_active_reader(current_user: UserInDB = Depends(get_current_reader)) -> UserInDB:
+    """
+    Get current active user for read-only endpoints
+    """
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return current_user
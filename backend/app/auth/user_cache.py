@@ -0,0 +1,140 @@
+"""
+In-process cache of authenticated users.
+
+get_current_user runs on every protected request. Caching the user document
+by id saves a MongoDB round trip on most of them. Entries expire after a short
+TTL. update_user_me invalidates them explicitly. Other workers can be told
+about changes through a change stream on the users collection.
+"""
+from typing import Any, Dict, Optional
+from collections import OrderedDict
+import asyncio
+import time
+
+from loguru import logger
+
+from app.api.models.user import UserInDB
+from app.utils.config import settings
+
+
+class UserCache:
+    """
+    TTL + LRU cache of UserInDB objects keyed by user id
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 60.0):
+        """
+        Args:
+            max_entries: Maximum number of users kept in the cache
+            ttl_seconds: How long a cached user is trusted, 0 disables the cache
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._watch_task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, user_id: str) -> Optional[UserInDB]:
+        """
+        Get a cached user
+
+        Returns:
+            A copy of the cached user, or None if it isn't cached or has expired
+        """
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self._misses += 1
+            return None
+
+        user, cached_at = entry
+        if time.monotonic() - cached_at >= self.ttl_seconds:
+            del self._entries[user_id]
+            self._misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self._hits += 1
+        return user.model_copy()
+
+    def set(self, user: UserInDB) -> None:
+        """Cache a user loaded from the database"""
+        if not self.enabled or not user.id:
+            return
+        self._entries[str(user.id)] = (user.model_copy(), time.monotonic())
+        self._entries.move_to_end(str(user.id))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user from the cache, e.g. after it was updated"""
+        if self._entries.pop(str(user_id), None) is not None:
+            self._invalidations += 1
+
+    def clear(self) -> None:
+        """Drop every cached user"""
+        self._entries.clear()
+
+    async def _watch(self, collection) -> None:
+        """Invalidate users changed by any worker, as reported by a change stream"""
+        try:
+            async with collection.watch(
+                [{"$match": {"operationType": {"$in": ["update", "replace", "delete"]}}}]
+            ) as stream:
+                logger.info("Watching the users collection for user cache invalidation")
+                async for change in stream:
+                    user_id = change.get("documentKey", {}).get("_id")
+                    if user_id is not None:
+                        self.invalidate(str(user_id))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Change streams need a replica set; without one the TTL bounds staleness
+            logger.warning(f"User cache change stream stopped, relying on the TTL: {e}")
+
+    def start_watching(self, collection) -> None:
+        """
+        Start invalidating entries from a change stream on the users collection
+
+        Args:
+            collection: The Motor users collection
+        """
+        if not self.enabled or self._watch_task is not None:
+            return
+        self._watch_task = asyncio.create_task(self._watch(collection))
+
+    async def stop_watching(self) -> None:
+        """Stop the change stream watcher"""
+        task, self._watch_task = self._watch_task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Current size and hit counters"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self._hits,
+            "misses": self._misses,
+            "invalidations": self._invalidations,
+            "watching": self._watch_task is not None and not self._watch_task.done()
+        }
+
+
+user_cache = UserCache(
+    max_entries=settings.USER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.USER_CACHE_TTL_SECONDS
+)
@@ -0,0 +1,183 @@
+"""
+Query history retention.
+
+History entries keep their full response and sources for
+HISTORY_FULL_RETENTION_DAYS. Older entries are compacted in place into an
+archive format: the query, its timestamp, a short plain-text summary of the
+response and the domains of its sources. With HISTORY_MAX_RETENTION_DAYS set,
+a TTL index also deletes entries entirely once they reach that age.
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+import asyncio
+import re
+
+from loguru import logger
+from pymongo import UpdateOne
+
+from app.utils.config import settings
+from app.utils.sources import source_domain
+
+HISTORY_COLLECTION = "query_history"
+TTL_INDEX_NAME = "timestamp_ttl"
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+def summarize_response(response: Optional[str], max_chars: int) -> str:
+    """Collapse a response to a single line of at most max_chars characters"""
+    text = _WHITESPACE_PATTERN.sub(" ", response or "").strip()
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars - 1].rstrip() + "…"
+
+
+def compacted_fields(document: Dict[str, Any], summary_chars: int) -> Dict[str, Any]:
+    """
+    Archive fields replacing the response and sources of a history entry
+    """
+    domains: List[str] = []
+    for source in document.get("sources") or []:
+        domain = source_domain(source.get("link")) if isinstance(source, dict) else ""
+        if domain and domain not in domains:
+            domains.append(domain)
+    return {
+        "summary": summarize_response(document.get("response"), summary_chars),
+        "source_domains": domains,
+        "source_count": len(document.get("sources") or []),
+        "compacted_at": datetime.utcnow()
+    }
+
+
+async def compact_history(db, older_than_days: int, summary_chars: int = 280, batch_size: int = 500) -> int:
+    """
+    Compact history entries older than a number of days
+
+    Args:
+        db: The database
+        older_than_days: Entries older than this keep only their archive fields
+        summary_chars: Length of the response summary kept
+        batch_size: Entries updated per bulk write
+
+    Returns:
+        The number of compacted entries
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    # Served by the partial index over entries that still have a response
+    query = {"timestamp": {"$lt": cutoff}, "response": {"$exists": True}}
+    projection = {"response": 1, "sources": 1}
+
+    compacted = 0
+    while True:
+        documents = await db[HISTORY_COLLECTION].find(query, projection).limit(batch_size).to_list(length=batch_size)
+        if not documents:
+            break
+
+        await db[HISTORY_COLLECTION].bulk_write([
+            UpdateOne(
+                {"_id": document["_id"]},
+                {"$set": compacted_fields(document, summary_chars), "$unset": {"response": "", "sources": ""}}
+            )
+            for document in documents
+        ], ordered=False)
+        compacted += len(documents)
+        if len(documents) < batch_size:
+            break
+    return compacted
+
+
+async def ensure_history_ttl(db, max_days: int) -> None:
+    """
+    Create, update or drop the TTL index deleting entries older than max_days
+
+    Args:
+        db: The database
+        max_days: Maximum age of a history entry, 0 keeps entries forever
+    """
+    indexes = await db[HISTORY_COLLECTION].index_information()
+    existing = indexes.get(TTL_INDEX_NAME)
+    expire_after = max_days * 24 * 3600
+
+    if not max_days:
+        if existing:
+            await db[HISTORY_COLLECTION].drop_index(TTL_INDEX_NAME)
+            logger.info("Dropped the query history TTL index")
+        return
+
+    if existing is None:
+        await db[HISTORY_COLLECTION].create_index("timestamp", name=TTL_INDEX_NAME, expireAfterSeconds=expire_after)
+        logger.info(f"Query history entries now expire after {max_days} days")
+    elif existing.get("expireAfterSeconds") != expire_after:
+        await db.command(
+            "collMod", HISTORY_COLLECTION,
+            index={"name": TTL_INDEX_NAME, "expireAfterSeconds": expire_after}
+        )
+        logger.info(f"Query history entries now expire after {max_days} days")
+
+
+class HistoryRetention:
+    """
+    Periodically compacts old history entries
+    """
+
+    def __init__(self, full_retention_days: int, max_retention_days: int = 0,
+                 interval_seconds: float = 3600, summary_chars: int = 280):
+        """
+        Args:
+            full_retention_days: Days entries keep their full response, 0 disables compaction
+            max_retention_days: Days after which entries are deleted, 0 keeps them forever
+            interval_seconds: Time between two compaction runs
+            summary_chars: Length of the response summary kept by compacted entries
+        """
+        self.full_retention_days = full_retention_days
+        self.max_retention_days = max_retention_days
+        self.interval_seconds = interval_seconds
+        self.summary_chars = summary_chars
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self, db) -> int:
+        """Compact every entry past the full retention period"""
+        if not self.full_retention_days:
+            return 0
+        compacted = await compact_history(db, self.full_retention_days, self.summary_chars)
+        if compacted:
+            logger.info(f"Compacted {compacted} query history entries")
+        return compacted
+
+    async def _run(self, db) -> None:
+        while True:
+            try:
+                await self.run_once(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Query history compaction failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def start(self, db) -> None:
+        """Apply the TTL policy and start the periodic compaction"""
+        try:
+            await ensure_history_ttl(db, self.max_retention_days)
+        except Exception as e:
+            logger.warning(f"Could not apply the query history TTL: {e}")
+        if self.full_retention_days and self.interval_seconds > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        """Stop the periodic compaction"""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+history_retention = HistoryRetention(
+    full_retention_days=settings.HISTORY_FULL_RETENTION_DAYS,
+    max_retention_days=settings.HISTORY_MAX_RETENTION_DAYS,
+    interval_seconds=settings.HISTORY_COMPACTION_INTERVAL_SECONDS,
+    summary_chars=settings.HISTORY_SUMMARY_CHARS
+)
@@ -5,7 +5,8 @@ import asyncio
 from loguru import logger
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.db.mongodb import connect_to_mongo, close_mongo_connection, get_database
-from app.auth.jwt import get_password_hash
+from app.db.migrations import run_migrations
+from app.auth.hashing import password_hasher
 from app.api.models.user import UserInDB
 from app.utils.config import settings
 
@@ -25,7 +26,7 @@ async def create_initial_user():
             email="admin@articube.ai",
             username="admin",
             full_name="Admin User",
-            hashed_password=get_password_hash("adminpassword"),  # Change this in production!
+            hashed_password=await password_hasher.hash("adminpassword"),  # Change this in production!
             is_active=True,
             is_verified=True
         )
@@ -42,18 +43,13 @@ async def create_initial_user():
 
 async def create_indexes():
     """
-    Create necessary database indexes
+    Create necessary database indexes by applying pending migrations
     """
     db = get_database()
     
     # Ensure indexes exist
     logger.info("Creating database indexes...")
-    await db.users.create_index("email", unique=True)
-    await db.users.create_index("username", unique=True)
-    
-    # Add other indexes as needed
-    # await db.content.create_index([("title", "text"), ("summary", "text")])
-    
+    await run_migrations(db)
     logger.info("Database indexes created")
 
 async def init_db():
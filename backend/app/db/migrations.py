@@ -0,0 +1,208 @@
+"""
+Versioned database migrations.
+
+Every index the application relies on is declared here as a numbered
+migration. Pending migrations run in order at startup and each applied version
+is recorded in the schema_migrations collection. Migrations must be idempotent:
+several workers may start at the same time and run the same version.
+
+A failing migration holds back every later one. Its error is kept and shown by
+migration_status until a later run applies it. Migrations that need clean data,
+such as unique indexes, check it first and raise a MigrationError naming what
+has to be fixed.
+"""
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple
+from datetime import datetime
+
+from loguru import logger
+from pymongo import ASCENDING, DESCENDING, TEXT, UpdateOne
+
+from app.db.search import SEARCH_SCOPES, source_facet_fields
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+
+# Conflicting values listed in the error of a unique index migration
+MAX_REPORTED_DUPLICATES = 20
+
+
+class MigrationError(Exception):
+    """
+    A migration that can't be applied until the data it depends on is fixed
+    """
+
+
+class Migration(NamedTuple):
+    """
+    A numbered, idempotent change to the database
+    """
+    version: int
+    name: str
+    apply: Callable[[Any], Awaitable[None]]
+
+
+MIGRATIONS: List[Migration] = []
+
+# Error of each migration whose last attempt in this process failed
+_failures: Dict[int, str] = {}
+
+
+def migration(version: int, name: str):
+    """
+    Register a migration function
+
+    Args:
+        version: Unique version number, migrations run in increasing order
+        name: Short description recorded with the version
+    """
+    def register(apply: Callable[[Any], Awaitable[None]]):
+        if any(existing.version == version for existing in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append(Migration(version, name, apply))
+        MIGRATIONS.sort(key=lambda item: item.version)
+        return apply
+    return register
+
+
+@migration(1, "query_history by user, newest first")
+async def create_query_history_index(db) -> None:
+    await db.query_history.create_index(
+        [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+        name="user_id_timestamp"
+    )
+
+
+@migration(2, "saved_search_results by user, newest first")
+async def create_saved_results_index(db) -> None:
+    await db.saved_search_results.create_index(
+        [("user_id", ASCENDING), ("saved_at", DESCENDING), ("_id", DESCENDING)],
+        name="user_id_saved_at"
+    )
+
+
+async def find_duplicates(collection, field: str, limit: int = MAX_REPORTED_DUPLICATES) -> List[Any]:
+    """Values of a field shared by more than one document"""
+    pipeline = [
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit}
+    ]
+    return [group["_id"] for group in await collection.aggregate(pipeline).to_list(length=limit)]
+
+
+@migration(3, "unique user email and username")
+async def create_user_indexes(db) -> None:
+    for field in ("email", "username"):
+        duplicates = await find_duplicates(db.users, field)
+        if duplicates:
+            raise MigrationError(
+                f"Several users share the same {field}, rename or merge them so the unique index "
+                f"can be built: {', '.join(str(value) for value in duplicates)}"
+            )
+        await db.users.create_index(field, unique=True)
+
+
+@migration(4, "query_history entries awaiting compaction, oldest first")
+async def create_history_compaction_index(db) -> None:
+    # Compacted entries lose their response and drop out of this partial index
+    await db.query_history.create_index(
+        [("timestamp", ASCENDING), ("_id", ASCENDING)],
+        name="uncompacted_by_timestamp",
+        partialFilterExpression={"response": {"$exists": True}}
+    )
+
+
+@migration(5, "text search over saved results and query history, with source facets")
+async def create_text_search_indexes(db) -> None:
+    for scope in SEARCH_SCOPES.values():
+        await db[scope.collection].create_index(
+            [("user_id", ASCENDING), *((field, TEXT) for field in scope.weights)],
+            name=f"user_id_{scope.collection}_text",
+            weights=scope.weights,
+            default_language="english"
+        )
+
+        # Fill the facet fields of documents written before they existed
+        while True:
+            documents = await db[scope.collection].find(
+                {"source_years": {"$exists": False}}, {"sources": 1, "source_domains": 1}
+            ).limit(500).to_list(length=500)
+            if not documents:
+                break
+            updates = []
+            for document in documents:
+                fields = source_facet_fields(document.get("sources"))
+                if "sources" not in document:
+                    # Compacted history keeps the domains it already extracted
+                    fields["source_domains"] = document.get("source_domains", [])
+                updates.append(UpdateOne({"_id": document["_id"]}, {"$set": fields}))
+            await db[scope.collection].bulk_write(updates, ordered=False)
+
+
+async def get_applied_versions(db) -> Dict[int, Dict[str, Any]]:
+    """Applied migrations keyed by version"""
+    applied = {}
+    async for document in db[MIGRATIONS_COLLECTION].find({}):
+        applied[document["_id"]] = document
+    return applied
+
+
+async def run_migrations(db) -> List[int]:
+    """
+    Apply every pending migration in version order
+
+    Stops at the first failing migration so later ones never run against a
+    database that is missing an earlier change. The failure is kept for
+    migration_status.
+
+    Returns:
+        The versions applied by this call
+    """
+    applied = await get_applied_versions(db)
+    newly_applied = []
+    for pending in MIGRATIONS:
+        if pending.version in applied:
+            continue
+
+        logger.info(f"Applying migration {pending.version}: {pending.name}")
+        started_at = datetime.utcnow()
+        try:
+            await pending.apply(db)
+        except Exception as e:
+            _failures[pending.version] = str(e)
+            blocked = [later.version for later in MIGRATIONS if later.version > pending.version and later.version not in applied]
+            logger.error(
+                f"Migration {pending.version} ({pending.name}) failed, "
+                f"{blocked or 'no later migrations'} held back until it is applied: {e}"
+            )
+            break
+        _failures.pop(pending.version, None)
+
+        await db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": pending.version},
+            {"$setOnInsert": {
+                "name": pending.name,
+                "applied_at": datetime.utcnow(),
+                "duration_ms": round((datetime.utcnow() - started_at).total_seconds() * 1000, 3)
+            }},
+            upsert=True
+        )
+        newly_applied.append(pending.version)
+
+    if newly_applied:
+        logger.info(f"Applied migrations {newly_applied}")
+    return newly_applied
+
+
+async def migration_status(db) -> List[Dict[str, Any]]:
+    """Every known migration with when it was applied, if it was, or why it last failed"""
+    applied = await get_applied_versions(db)
+    return [
+        {
+            "version": known.version,
+            "name": known.name,
+            "applied": known.version in applied,
+            "applied_at": applied.get(known.version, {}).get("applied_at"),
+            "error": None if known.version in applied else _failures.get(known.version)
+        }
+        for known in MIGRATIONS
+    ]
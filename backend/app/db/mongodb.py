@@ -5,6 +5,7 @@ from motor.motor_asyncio import AsyncIOMotorClient
 from loguru import logger
 
 from app.utils.config import settings
+from app.utils.tracing import mongo_command_listener
 
 # MongoDB Client - initialized in the startup event
 mongodb_client = None
@@ -28,7 +29,8 @@ async def connect_to_mongo():
             connectTimeoutMS=20000,  # 20 seconds timeout for connection
             maxIdleTimeMS=45000,    # Prevent disconnect due to idle connection
             retryWrites=True,        # Enable retry for write operations
-            appname="ArtiCube"       # Identify our application in MongoDB logs
+            appname="ArtiCube",      # Identify our application in MongoDB logs
+            event_listeners=[mongo_command_listener] if settings.TRACING_ENABLED else []
         )
         
         # Access the database
@@ -38,12 +40,7 @@ async def connect_to_mongo():
         collections = await mongodb_database.list_collection_names()
         logger.info(f"Connected to MongoDB. Available collections: {collections}")
         
-        # Create indexes for better query performance if users collection doesn't exist
-        if "users" not in collections:
-            logger.info("Creating users collection and indexes")
-            await mongodb_database.create_collection("users")
-            await mongodb_database.users.create_index("email", unique=True)
-            logger.info("Created index on users.email")
+        # Indexes are created by the migrations in app.db.migrations
         
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB: {e}")
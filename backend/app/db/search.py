@@ -0,0 +1,312 @@
+"""
+Full-text search over a user's saved results and query history.
+
+Searches run against the MongoDB text indexes created by migration 5, ranked
+by text score, with facets on the domains and years of the stored sources.
+Both text indexes start with user_id, so a search only reads the calling
+user's index entries.
+
+Where a text index is missing, searches fall back to an in-process BM25 index
+built from the user's most recent documents and kept for a short while. An
+index is dropped as soon as the user's documents change, including when
+history_writer flushes new history entries. SEARCH_BACKEND forces either
+backend.
+
+Source domains and years are denormalized into source_domains and
+source_years when a document is written, so facets never have to parse links.
+"""
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from collections import OrderedDict
+import time
+
+from loguru import logger
+from pymongo import DESCENDING
+from pymongo.errors import OperationFailure
+
+from app.utils.bm25 import BM25Index
+from app.utils.config import settings
+from app.utils.sources import Source, source_domain
+
+# MongoDB error code of a $text query without a text index
+INDEX_NOT_FOUND = 27
+
+# How long a missing text index keeps searches on the local backend before $text is tried again
+TEXT_INDEX_RECHECK_SECONDS = 300
+
+
+class SearchScope(NamedTuple):
+    """
+    A searchable collection
+    """
+    collection: str
+    weights: Dict[str, int]  # Text fields and their weights, as in the text index
+    date_field: str
+    projection: Dict[str, int]  # Fields returned with each result
+
+
+SEARCH_SCOPES: Dict[str, SearchScope] = {
+    "saved": SearchScope(
+        "saved_search_results",
+        {"title": 10, "snippet": 5, "content": 1},
+        "saved_at",
+        {"title": 1, "snippet": 1, "saved_at": 1}
+    ),
+    "history": SearchScope(
+        "query_history",
+        {"query": 10, "response": 1, "summary": 1},
+        "timestamp",
+        {"query": 1, "timestamp": 1}
+    ),
+}
+
+
+def source_facet_fields(sources: Optional[List[Any]]) -> Dict[str, List[str]]:
+    """
+    Facet fields stored alongside a document's sources
+
+    Returns:
+        source_domains and source_years, deduplicated in source order
+    """
+    domains: List[str] = []
+    years: List[str] = []
+    for source in sources or []:
+        if isinstance(source, Source):
+            domain, year = source.domain, source.year.strip()
+        elif isinstance(source, dict):
+            domain, year = source_domain(source.get("link")), str(source.get("year") or "").strip()
+        else:
+            continue
+        if domain and domain not in domains:
+            domains.append(domain)
+        if year and year not in years:
+            years.append(year)
+    return {"source_domains": domains, "source_years": years}
+
+
+def facet_filter(domain: Optional[str], year: Optional[str]) -> Dict[str, Any]:
+    """Filter restricting a search to a source domain and year"""
+    query: Dict[str, Any] = {}
+    if domain:
+        query["source_domains"] = domain.lower()
+    if year:
+        query["source_years"] = year
+    return query
+
+
+def _facet_counts(buckets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"value": bucket["_id"], "count": bucket["count"]} for bucket in buckets]
+
+
+async def text_search(
+    db,
+    scope: SearchScope,
+    user_id: Any,
+    query: str,
+    filters: Dict[str, Any],
+    limit: int,
+    offset: int,
+    facet_size: int
+) -> Dict[str, Any]:
+    """
+    Search with the MongoDB text index, counting facets in the same aggregation
+
+    Raises:
+        OperationFailure: The collection has no text index
+    """
+    pipeline = [
+        {"$match": {"user_id": user_id, "$text": {"$search": query}, **filters}},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$facet": {
+            "results": [
+                {"$sort": {"score": -1, "_id": -1}},
+                {"$skip": offset},
+                {"$limit": limit},
+                {"$project": {**scope.projection, "score": 1}}
+            ],
+            "total": [{"$count": "count"}],
+            "domain": [{"$unwind": "$source_domains"}, {"$sortByCount": "$source_domains"}, {"$limit": facet_size}],
+            "year": [{"$unwind": "$source_years"}, {"$sortByCount": "$source_years"}, {"$limit": facet_size}]
+        }}
+    ]
+    outcome = (await db[scope.collection].aggregate(pipeline).to_list(length=1))[0]
+    return {
+        "results": outcome["results"],
+        "total": outcome["total"][0]["count"] if outcome["total"] else 0,
+        "facets": {"domain": _facet_counts(outcome["domain"]), "year": _facet_counts(outcome["year"])}
+    }
+
+
+class _LocalIndex:
+    __slots__ = ("index", "documents", "built_at")
+
+    def __init__(self, index: BM25Index, documents: Dict[Any, Dict[str, Any]]):
+        self.index = index
+        self.documents = documents
+        self.built_at = time.monotonic()
+
+
+class LocalSearchIndexes:
+    """
+    Per-user BM25 indexes, built on demand and kept for a short while
+    """
+
+    def __init__(self, max_documents: int = 5000, ttl: float = 60.0, max_indexes: int = 128):
+        """
+        Args:
+            max_documents: Most recent documents of a user indexed per scope
+            ttl: Seconds an index is reused before it is rebuilt
+            max_indexes: Indexes kept, least recently used ones are dropped first
+        """
+        self.max_documents = max_documents
+        self.ttl = ttl
+        self.max_indexes = max_indexes
+        self._indexes: "OrderedDict[Tuple[str, str], _LocalIndex]" = OrderedDict()
+
+        # Metrics
+        self._builds = 0
+        self._hits = 0
+
+    async def _build(self, db, scope: SearchScope, user_id: Any) -> _LocalIndex:
+        projection = {field: 1 for field in (*scope.weights, *scope.projection)}
+        projection.update({"sources.link": 1, "sources.year": 1, "source_domains": 1, "source_years": 1})
+        documents = await db[scope.collection].find({"user_id": user_id}, projection).sort(
+            [(scope.date_field, DESCENDING), ("_id", DESCENDING)]
+        ).limit(self.max_documents).to_list(length=self.max_documents)
+
+        index = BM25Index()
+        by_id = {}
+        for document in documents:
+            index.add(document["_id"], [(document.get(field), weight) for field, weight in scope.weights.items()])
+            if "source_years" not in document:
+                # Written before the facet fields existed
+                document.update(source_facet_fields(document.get("sources")))
+            by_id[document["_id"]] = document
+        self._builds += 1
+        return _LocalIndex(index, by_id)
+
+    async def get(self, db, scope_name: str, user_id: Any) -> _LocalIndex:
+        """The index of a user's documents in a scope, built if missing or expired"""
+        key = (scope_name, str(user_id))
+        local = self._indexes.get(key)
+        if local is not None and time.monotonic() - local.built_at < self.ttl:
+            self._indexes.move_to_end(key)
+            self._hits += 1
+            return local
+
+        local = await self._build(db, SEARCH_SCOPES[scope_name], user_id)
+        self._indexes[key] = local
+        self._indexes.move_to_end(key)
+        while len(self._indexes) > self.max_indexes:
+            self._indexes.popitem(last=False)
+        return local
+
+    def invalidate(self, scope_name: str, user_id: Any) -> None:
+        """Forget a user's index after their documents changed"""
+        self._indexes.pop((scope_name, str(user_id)), None)
+
+    async def search(
+        self,
+        db,
+        scope_name: str,
+        user_id: Any,
+        query: str,
+        filters: Dict[str, Any],
+        limit: int,
+        offset: int,
+        facet_size: int
+    ) -> Dict[str, Any]:
+        """Same results as text_search, ranked with BM25"""
+        scope = SEARCH_SCOPES[scope_name]
+        local = await self.get(db, scope_name, user_id)
+
+        candidates = None
+        if filters:
+            candidates = {
+                doc_id for doc_id, document in local.documents.items()
+                if all(value in document.get(field, []) for field, value in filters.items())
+            }
+        ranked = local.index.search(query, candidates)
+
+        domains: Dict[str, int] = {}
+        years: Dict[str, int] = {}
+        for doc_id, _ in ranked:
+            document = local.documents[doc_id]
+            for domain in document.get("source_domains", []):
+                domains[domain] = domains.get(domain, 0) + 1
+            for year in document.get("source_years", []):
+                years[year] = years.get(year, 0) + 1
+
+        def top(counts: Dict[str, int]) -> List[Dict[str, Any]]:
+            ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:facet_size]
+            return [{"value": value, "count": count} for value, count in ordered]
+
+        results = []
+        for doc_id, score in ranked[offset:offset + limit]:
+            document = local.documents[doc_id]
+            result = {field: document[field] for field in scope.projection if field in document}
+            results.append({"_id": doc_id, **result, "score": score})
+        return {"results": results, "total": len(ranked), "facets": {"domain": top(domains), "year": top(years)}}
+
+    def stats(self) -> Dict[str, int]:
+        return {"indexes": len(self._indexes), "builds": self._builds, "hits": self._hits}
+
+
+local_search = LocalSearchIndexes(
+    max_documents=settings.SEARCH_LOCAL_MAX_DOCUMENTS,
+    ttl=settings.SEARCH_LOCAL_INDEX_TTL_SECONDS,
+    max_indexes=settings.SEARCH_LOCAL_MAX_INDEXES
+)
+
+# When each scope's text index was found missing
+_text_index_missing: Dict[str, float] = {}
+
+
+async def search_documents(
+    db,
+    scope_name: str,
+    user_id: Any,
+    query: str,
+    domain: Optional[str] = None,
+    year: Optional[str] = None,
+    limit: int = 20,
+    offset: int = 0
+) -> Dict[str, Any]:
+    """
+    Search a user's documents in a scope
+
+    Args:
+        db: The database
+        scope_name: "saved" or "history"
+        user_id: Only this user's documents are searched
+        query: Free text
+        domain: Only documents citing a source from this domain
+        year: Only documents citing a source from this year
+        limit: Results returned
+        offset: Results skipped, for the following pages
+
+    Returns:
+        results (with _id and score), total matches, facets by domain and
+        year, and the backend that answered ("text" or "bm25")
+    """
+    scope = SEARCH_SCOPES[scope_name]
+    filters = facet_filter(domain, year)
+    facet_size = settings.SEARCH_FACET_SIZE
+    backend = settings.SEARCH_BACKEND
+
+    missing_since = _text_index_missing.get(scope_name)
+    if backend == "auto" and missing_since is not None and time.monotonic() - missing_since < TEXT_INDEX_RECHECK_SECONDS:
+        backend = "bm25"
+
+    if backend != "bm25":
+        try:
+            outcome = await text_search(db, scope, user_id, query, filters, limit, offset, facet_size)
+            _text_index_missing.pop(scope_name, None)
+            return {**outcome, "backend": "text"}
+        except OperationFailure as e:
+            if backend == "text" or e.code != INDEX_NOT_FOUND:
+                raise
+            logger.warning(f"No text index on {scope.collection}, searching with the local BM25 index")
+            _text_index_missing[scope_name] = time.monotonic()
+
+    outcome = await local_search.search(db, scope_name, user_id, query, filters, limit, offset, facet_size)
+    return {**outcome, "backend": "bm25"}
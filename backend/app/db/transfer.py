@@ -0,0 +1,382 @@
+"""
+Bulk export and import of a user's saved results and query history.
+
+Exports write one document per line (NDJSON) in MongoDB relaxed extended JSON,
+so ids and dates survive the round trip. They can be gzip-compressed. The
+cursor is read in batches of TRANSFER_EXPORT_BATCH_SIZE documents, and each
+batch is encoded and handed to the client before the next one is read. Memory
+use therefore stays the same however many documents a user has.
+
+Imports take the same format, compressed or not, and read the request body as
+it arrives. Documents are inserted with insert_many in chunks of
+TRANSFER_IMPORT_BATCH_SIZE. The body is only read further once a chunk is
+written, so a slow database slows the upload down instead of filling memory.
+Imported documents get new ids unless the export's ids are kept, in which case
+an import sent twice skips the documents it already inserted. Unordered
+imports skip invalid lines and duplicate ids, and keep going. Ordered imports
+stop at the first error.
+"""
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List
+from datetime import datetime, timezone
+import zlib
+
+from bson import json_util
+from bson.errors import BSONError
+from loguru import logger
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from app.db.search import SEARCH_SCOPES, source_facet_fields
+from app.utils.metrics import metrics
+from app.utils.sources import sources_from
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GZIP_MEDIA_TYPE = "application/gzip"
+
+# zlib window bits for a gzip stream, and for a gzip or zlib stream when decompressing
+GZIP_WBITS = 31
+AUTO_WBITS = 47
+GZIP_LEVEL = 6
+
+# MongoDB error code of a duplicate _id
+DUPLICATE_KEY = 11000
+
+# Line errors returned with an import summary
+MAX_REPORTED_ERRORS = 20
+
+# Largest piece of a compressed body inflated at once
+INFLATE_CHUNK_BYTES = 1 << 20
+
+EXPORT_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+transferred_documents = metrics.counter(
+    "transfer_documents_total", "Documents exported or imported in bulk", ("direction", "scope")
+)
+
+
+class ImportRejected(Exception):
+    """
+    An import body that cannot be read any further
+    """
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+async def export_documents(
+    db,
+    scope_name: str,
+    user_id: Any,
+    batch_size: int = 500,
+    compress: bool = False
+) -> AsyncIterator[bytes]:
+    """
+    Stream a user's documents in a scope, oldest first
+
+    Args:
+        db: The database
+        scope_name: "saved" or "history"
+        user_id: The user whose documents are exported
+        batch_size: Documents read from the cursor and encoded per chunk
+        compress: gzip the stream
+
+    Yields:
+        Chunks of NDJSON, gzip-compressed when compress is set
+    """
+    scope = SEARCH_SCOPES[scope_name]
+    cursor = db[scope.collection].find({"user_id": user_id}, {"user_id": 0}).sort(
+        [(scope.date_field, ASCENDING), ("_id", ASCENDING)]
+    ).batch_size(batch_size)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, GZIP_WBITS) if compress else None
+
+    def encode(lines: List[str]) -> bytes:
+        chunk = ("\n".join(lines) + "\n").encode("utf-8")
+        return compressor.compress(chunk) if compressor else chunk
+
+    exported = 0
+    lines: List[str] = []
+    async for document in cursor:
+        lines.append(json_util.dumps(document, json_options=EXPORT_JSON_OPTIONS))
+        if len(lines) == batch_size:
+            exported += len(lines)
+            chunk = encode(lines)
+            lines = []
+            if chunk:
+                yield chunk
+    if lines:
+        exported += len(lines)
+        chunk = encode(lines)
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+    transferred_documents.inc(exported, direction="export", scope=scope_name)
+    logger.info(f"Exported {exported} documents from {scope.collection}")
+
+
+def _text(data: Dict[str, Any], field: str, required: bool = False) -> str:
+    value = data.get(field)
+    if value is None and not required:
+        return ""
+    if not isinstance(value, str) or (required and not value):
+        raise ValueError(f"{field} must be a non-empty string" if required else f"{field} must be a string")
+    return value
+
+
+def _date(data: Dict[str, Any], field: str) -> datetime:
+    """A naive UTC datetime, like the ones MongoDB hands back"""
+    value = data.get(field)
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"{field} must be a date")
+    if not isinstance(value, datetime):
+        raise ValueError(f"{field} must be a date")
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _saved_document(data: Dict[str, Any]) -> Dict[str, Any]:
+    sources = sources_from(data.get("sources"))
+    return {
+        "title": _text(data, "title", required=True),
+        "snippet": _text(data, "snippet"),
+        "content": _text(data, "content", required=True),
+        "sources": sources,
+        **source_facet_fields(sources),
+        "saved_at": _date(data, "saved_at")
+    }
+
+
+def _history_document(data: Dict[str, Any]) -> Dict[str, Any]:
+    document: Dict[str, Any] = {"query": _text(data, "query", required=True)}
+    if "response" in data:
+        sources = sources_from(data.get("sources"))
+        document.update({"response": _text(data, "response"), "sources": sources, **source_facet_fields(sources)})
+    else:
+        # A compacted entry (see app.db.history): its sources are gone, only their domains remain
+        domains = data.get("source_domains")
+        document.update({
+            "summary": _text(data, "summary"),
+            "source_domains": [domain for domain in domains if isinstance(domain, str)] if isinstance(domains, list) else [],
+            "source_years": [],
+            "source_count": data["source_count"] if isinstance(data.get("source_count"), int) else 0,
+            "compacted_at": _date(data, "compacted_at")
+        })
+    document["timestamp"] = _date(data, "timestamp")
+    return document
+
+
+# Build the document stored for an imported line, raising ValueError when the line is invalid
+IMPORT_BUILDERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "saved": _saved_document,
+    "history": _history_document,
+}
+
+
+class _Inflater:
+    """
+    Decompresses a gzip body in bounded pieces, so a small body cannot expand all at once
+
+    A body may hold several gzip members one after the other (as written by
+    cat a.ndjson.gz b.ndjson.gz): each member is decompressed in turn. Zero
+    bytes padding the end of a member are skipped.
+    """
+
+    def __init__(self):
+        self._decompressor = zlib.decompressobj(AUTO_WBITS)
+
+    def inflate(self, data: bytes) -> Iterator[bytes]:
+        try:
+            while True:
+                yield self._decompressor.decompress(data, INFLATE_CHUNK_BYTES)
+                if self._decompressor.unconsumed_tail:
+                    data = self._decompressor.unconsumed_tail
+                elif self._decompressor.eof and self._decompressor.unused_data.lstrip(b"\0"):
+                    data = self._decompressor.unused_data.lstrip(b"\0")
+                    self._decompressor = zlib.decompressobj(AUTO_WBITS)
+                else:
+                    return
+        except zlib.error:
+            raise ImportRejected("The body is not valid gzip")
+
+    def finish(self) -> bytes:
+        """
+        Raises:
+            ImportRejected: The last member is incomplete
+        """
+        if not self._decompressor.eof:
+            raise ImportRejected("The gzip body is truncated")
+        return self._decompressor.flush()
+
+
+class _Import:
+    """
+    State of one import: the pending chunk and the running summary
+    """
+
+    def __init__(self, collection, build: Callable[[Dict[str, Any]], Dict[str, Any]], user_id: Any,
+                 keep_ids: bool, ordered: bool, batch_size: int, max_documents: int):
+        self.collection = collection
+        self.build = build
+        self.user_id = user_id
+        self.keep_ids = keep_ids
+        self.ordered = ordered
+        self.batch_size = batch_size
+        self.max_documents = max_documents
+        self.batch: List[Dict[str, Any]] = []
+        self.batch_lines: List[int] = []
+        self.documents = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.failed = 0
+        self.stopped = False
+        self.errors: List[Dict[str, Any]] = []
+
+    def _error(self, line_number: int, message: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_number, "error": message})
+        if self.ordered:
+            self.stopped = True
+
+    async def add_line(self, line_number: int, line: bytes) -> None:
+        if not line.strip():
+            return
+        self.documents += 1
+        if self.documents > self.max_documents:
+            raise ImportRejected(f"An import holds at most {self.max_documents} documents", status_code=413)
+        try:
+            data = json_util.loads(line)
+            if not isinstance(data, dict):
+                raise ValueError("each line must be a JSON object")
+            document = self.build(data)
+        except (ValueError, TypeError, BSONError) as e:
+            self.invalid += 1
+            self._error(line_number, str(e))
+            return
+        document["user_id"] = self.user_id
+        if self.keep_ids and "_id" in data:
+            document["_id"] = data["_id"]
+        self.batch.append(document)
+        self.batch_lines.append(line_number)
+        if len(self.batch) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Insert the pending chunk"""
+        if not self.batch:
+            return
+        batch, lines = self.batch, self.batch_lines
+        self.batch, self.batch_lines = [], []
+        try:
+            result = await self.collection.insert_many(batch, ordered=self.ordered)
+            self.inserted += len(result.inserted_ids)
+        except BulkWriteError as e:
+            self.inserted += e.details.get("nInserted", 0)
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") == DUPLICATE_KEY:
+                    self.duplicates += 1
+                    message = "A document with this _id already exists"
+                else:
+                    self.failed += 1
+                    message = error.get("errmsg", "Write failed")
+                self._error(lines[error["index"]], message)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "stopped": self.stopped,
+            "errors": self.errors
+        }
+
+
+async def import_documents(
+    db,
+    scope_name: str,
+    user_id: Any,
+    body: AsyncIterator[bytes],
+    compressed: bool = False,
+    keep_ids: bool = False,
+    ordered: bool = False,
+    batch_size: int = 500,
+    max_documents: int = 100000,
+    max_line_bytes: int = 4194304
+) -> Dict[str, Any]:
+    """
+    Insert the documents of an NDJSON stream into a user's scope
+
+    Args:
+        db: The database
+        scope_name: "saved" or "history"
+        user_id: The user the documents are imported for, whatever user they were exported from
+        body: Chunks of the request body
+        compressed: The body is gzip-compressed
+        keep_ids: Insert documents with their exported _id instead of a new one
+        ordered: Stop at the first invalid line or failed insert
+        batch_size: Documents inserted per insert_many
+        max_documents: Documents accepted by the import
+        max_line_bytes: Longest accepted line
+
+    Returns:
+        Counts of inserted, duplicate (existing _id), invalid and failed
+        documents, whether an ordered import stopped early, and the first errors
+        with their line numbers
+
+    Raises:
+        ImportRejected: The body is not valid gzip, has a line that is too long,
+            or has too many documents. Chunks inserted before are kept.
+    """
+    scope = SEARCH_SCOPES[scope_name]
+    state = _Import(db[scope.collection], IMPORT_BUILDERS[scope_name], user_id, keep_ids, ordered, batch_size, max_documents)
+    inflater = _Inflater() if compressed else None
+    pending = b""
+    line_number = 0
+
+    async def read_lines(data: bytes) -> None:
+        nonlocal pending, line_number
+        pending += data
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if len(line) > max_line_bytes:
+                raise ImportRejected(f"Line {line_number} is longer than {max_line_bytes} bytes", status_code=413)
+            await state.add_line(line_number, line)
+            if state.stopped:
+                return
+        if len(pending) > max_line_bytes:
+            raise ImportRejected(f"Line {line_number + 1} is longer than {max_line_bytes} bytes", status_code=413)
+
+    try:
+        async for chunk in body:
+            for piece in (inflater.inflate(chunk) if inflater else (chunk,)):
+                await read_lines(piece)
+                if state.stopped:
+                    break
+            if state.stopped:
+                break
+        if not state.stopped:
+            if inflater:
+                await read_lines(inflater.finish())
+            line_number += 1
+            await state.add_line(line_number, pending)
+        # An ordered import that stopped at an invalid line still keeps the lines before it
+        await state.flush()
+    finally:
+        transferred_documents.inc(state.inserted, direction="import", scope=scope_name)
+
+    summary = state.summary()
+    logger.info(
+        f"Imported {summary['inserted']} documents into {scope.collection} "
+        f"({summary['duplicates']} duplicates, {summary['invalid']} invalid, {summary['failed']} failed)"
+    )
+    return summary
@@ -0,0 +1,264 @@
+"""
+Write-behind batching for non-critical inserts.
+
+Callers hand documents to a WriteBehindQueue and return immediately. A
+background task writes them with insert_many in batches, flushing when a batch
+is full or when the oldest queued document has waited flush_interval seconds.
+When the queue is full, callers wait briefly for room and the document is
+dropped if none frees up, so a slow database never stalls request handling.
+
+A batch that fails with a transient error (a lost connection, a timeout, or an
+error MongoDB labels retryable) is retried once after retry_backoff seconds.
+When some documents of a batch are rejected, only those are dropped.
+
+on_flush is called with every batch once it is written, e.g. to refresh caches
+built from the collection.
+"""
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import time
+
+from loguru import logger
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+
+from app.db.search import local_search
+from app.utils.config import settings
+from app.utils.metrics import metrics
+from app.utils.tracing import traced
+
+DUPLICATE_KEY = 11000
+
+
+def is_retryable(error: PyMongoError) -> bool:
+    """Whether a failed write may succeed when tried again"""
+    return isinstance(error, ConnectionFailure) or error.has_error_label("RetryableWriteError")
+
+
+class WriteBehindQueue:
+    """
+    Batches inserts into one MongoDB collection
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_queued: int = 10000,
+        enqueue_timeout: float = 0.05,
+        retry_backoff: float = 0.5,
+        on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None
+    ):
+        """
+        Args:
+            collection_name: Collection the documents are inserted into
+            batch_size: Maximum number of documents per insert_many
+            flush_interval: Maximum seconds a document waits before its batch is written
+            max_queued: Maximum number of documents waiting to be written
+            enqueue_timeout: Seconds a caller waits for room in a full queue before
+                the document is dropped
+            retry_backoff: Seconds to wait before retrying a batch that failed
+                with a transient error
+            on_flush: Called with each batch after it was written, even partly
+        """
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queued = max_queued
+        self.enqueue_timeout = enqueue_timeout
+        self.retry_backoff = retry_backoff
+        self.on_flush = on_flush
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._closing = False
+
+        # Metrics
+        self._queued = 0
+        self._flushed = 0
+        self._dropped = 0
+        self._batches = 0
+        self._failed_batches = 0
+        self._retried_batches = 0
+
+    @property
+    def started(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self) -> None:
+        """Start the background writer. Safe to call more than once."""
+        if self.started:
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._closing = False
+        self._worker = asyncio.create_task(self._run())
+
+    async def enqueue(self, document: Dict[str, Any]) -> bool:
+        """
+        Queue a document for insertion
+
+        Returns:
+            True if the document was queued, False if it was dropped
+        """
+        if self._closing:
+            self._dropped += 1
+            return False
+        if not self.started:
+            self.start()
+
+        try:
+            self._queue.put_nowait(document)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(document), timeout=self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self._dropped += 1
+                logger.warning(f"Write-behind queue for {self.collection_name} is full, dropped a document")
+                return False
+        self._queued += 1
+        return True
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """Wait for a document, then collect more until the batch is full or the flush interval ends"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    @traced("write_behind.write_batch")
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """Insert a batch, retrying once on a transient error and dropping the documents the database rejects"""
+        try:
+            if await self._insert(batch) and self.on_flush is not None:
+                try:
+                    self.on_flush(batch)
+                except Exception as e:
+                    logger.error(f"on_flush failed for {self.collection_name}: {e}")
+        finally:
+            self._batches += 1
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _insert(self, batch: List[Dict[str, Any]]) -> bool:
+        """Insert a batch, returning whether any of its documents were written"""
+        from app.db.mongodb import get_database
+
+        retried = False
+        while True:
+            try:
+                await get_database()[self.collection_name].insert_many(batch, ordered=False)
+                self._flushed += len(batch)
+                return True
+            except BulkWriteError as e:
+                return self._record_partial_write(batch, e, retried) > 0
+            except PyMongoError as e:
+                if retried or not is_retryable(e):
+                    self._record_failed_write(batch, e)
+                    return False
+                retried = True
+                self._retried_batches += 1
+                logger.warning(
+                    f"Retrying a batch of {len(batch)} documents for {self.collection_name} "
+                    f"in {self.retry_backoff}s after a transient error: {e}"
+                )
+                await asyncio.sleep(self.retry_backoff)
+            except Exception as e:
+                self._record_failed_write(batch, e)
+                return False
+
+    def _record_partial_write(self, batch: List[Dict[str, Any]], error: BulkWriteError, retried: bool) -> int:
+        """Count the inserted documents as flushed and drop only the rejected ones, returning the flushed count"""
+        flushed = error.details.get("nInserted", 0)
+        write_errors = error.details.get("writeErrors", [])
+        if retried:
+            # insert_many assigns the _ids in place, so documents the first
+            # attempt wrote before failing come back as duplicates
+            flushed += sum(1 for write_error in write_errors if write_error.get("code") == DUPLICATE_KEY)
+        flushed = min(flushed, len(batch))
+        self._flushed += flushed
+        dropped = len(batch) - flushed
+        if dropped:
+            self._failed_batches += 1
+            self._dropped += dropped
+            messages = {write_error.get("errmsg", "Write failed") for write_error in write_errors}
+            logger.error(
+                f"Dropped {dropped} of {len(batch)} documents written to {self.collection_name}: "
+                f"{'; '.join(sorted(messages)) or error}"
+            )
+        return flushed
+
+    def _record_failed_write(self, batch: List[Dict[str, Any]], error: Exception) -> None:
+        self._failed_batches += 1
+        self._dropped += len(batch)
+        logger.error(f"Failed to write {len(batch)} documents to {self.collection_name}: {error}")
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            await self._write(batch)
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """
+        Stop accepting documents and wait until everything queued is written
+
+        Args:
+            timeout: Maximum seconds to wait for the queue to drain
+        """
+        self._closing = True
+        worker, self._worker = self._worker, None
+        if worker is None:
+            return
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            lost = self._queue.qsize()
+            self._dropped += lost
+            logger.error(f"Gave up draining the write-behind queue for {self.collection_name}, {lost} documents lost")
+
+        worker.cancel()
+        try:
+            await worker
+        except asyncio.CancelledError:
+            pass
+        logger.info(f"Write-behind queue for {self.collection_name} closed: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and counters"""
+        return {
+            "collection": self.collection_name,
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "queued": self._queued,
+            "flushed": self._flushed,
+            "dropped": self._dropped,
+            "batches": self._batches,
+            "failed_batches": self._failed_batches,
+            "retried_batches": self._retried_batches
+        }
+
+
+def _refresh_history_search(documents: List[Dict[str, Any]]) -> None:
+    """Rebuild the local search index of the users whose entries were written, so they are searchable at once"""
+    for user_id in {str(document.get("user_id")) for document in documents}:
+        local_search.invalidate("history", user_id)
+
+
+history_writer = WriteBehindQueue(
+    "query_history",
+    batch_size=settings.HISTORY_WRITE_BATCH_SIZE,
+    flush_interval=settings.HISTORY_WRITE_FLUSH_INTERVAL_SECONDS,
+    max_queued=settings.HISTORY_WRITE_QUEUE_SIZE,
+    enqueue_timeout=settings.HISTORY_WRITE_ENQUEUE_TIMEOUT_SECONDS,
+    retry_backoff=settings.HISTORY_WRITE_RETRY_BACKOFF_SECONDS,
+    on_flush=_refresh_history_search
+)
+
+metrics.gauge("history_write_queue_depth", "Query history entries waiting to be written", lambda: history_writer.stats()["pending"])
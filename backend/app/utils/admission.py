@@ -0,0 +1,259 @@
+"""
+Admission control for agent pipeline executions.
+
+Every pipeline run takes a slot. At most max_concurrent runs are in progress
+at once, and at most max_per_user of them for any single user. Queries that
+can't start right away wait in a fair queue: waiting users are served round
+robin, so one user submitting many queries can't starve the others. A query
+is rejected instead of queued when its user already has too many queries
+waiting (429) or the queue is full (503), and gives up when it has waited
+longer than the queue time budget (503). Rejections carry a Retry-After
+estimate derived from the recent run times.
+"""
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+import asyncio
+import math
+import time
+
+from app.utils.config import settings
+from app.utils.metrics import metrics
+
+
+admission_wait = metrics.histogram("admission_wait_seconds", "Time agent queries waited for a run slot")
+admission_rejections = metrics.counter("admission_rejections_total", "Agent queries refused by admission control", ("reason",))
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a query is not admitted
+    """
+
+    def __init__(self, reason: str, status_code: int, retry_after: int):
+        """
+        Args:
+            reason: "user_queue_full", "queue_full" or "queue_timeout"
+            status_code: HTTP status to answer with, 429 or 503
+            retry_after: Seconds the client should wait before retrying
+        """
+        super().__init__(f"Query not admitted ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("user_id", "future", "enqueued_at")
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """
+    Global and per-user concurrency caps with a round-robin queue
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_per_user: int = 2,
+        max_queue: int = 256,
+        max_queue_per_user: int = 8,
+        queue_timeout: float = 30.0,
+        enabled: bool = True
+    ):
+        """
+        Args:
+            max_concurrent: Maximum number of runs in progress
+            max_per_user: Maximum number of runs in progress for one user
+            max_queue: Maximum number of queries waiting for a slot
+            max_queue_per_user: Maximum number of queries one user may have waiting
+            queue_timeout: Seconds a query may wait for a slot
+            enabled: Whether queries are limited at all
+        """
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.enabled = enabled
+
+        self._running: Dict[str, int] = {}
+        self._running_total = 0
+        # Waiting queries per user, users in the order they are served
+        self._queues: "OrderedDict[str, Deque[_Waiter]]" = OrderedDict()
+        self._queued_total = 0
+
+        # Metrics
+        self._admitted = 0
+        self._queued = 0
+        self._rejected: Dict[str, int] = {}
+        self._waits: Deque[float] = deque(maxlen=1000)
+        self._run_seconds = 0.0  # Moving average of how long a slot is held
+
+    def _can_start(self, user_id: str) -> bool:
+        return self._running_total < self.max_concurrent and self._running.get(user_id, 0) < self.max_per_user
+
+    def _start(self, user_id: str, waited: float) -> None:
+        self._running[user_id] = self._running.get(user_id, 0) + 1
+        self._running_total += 1
+        self._admitted += 1
+        self._waits.append(waited)
+        admission_wait.observe(waited)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting queries, one user at a time"""
+        while self._running_total < self.max_concurrent and self._queues:
+            for user_id in list(self._queues):
+                if self._running.get(user_id, 0) < self.max_per_user:
+                    break
+            else:
+                # Every waiting user is at their own cap
+                return
+
+            user_queue = self._queues[user_id]
+            waiter = user_queue.popleft()
+            self._queued_total -= 1
+            if user_queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+
+            if not waiter.future.done():
+                self._start(user_id, time.monotonic() - waiter.enqueued_at)
+                waiter.future.set_result(None)
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        user_queue = self._queues.get(waiter.user_id)
+        if user_queue is None or waiter not in user_queue:
+            return
+        user_queue.remove(waiter)
+        self._queued_total -= 1
+        if not user_queue:
+            del self._queues[waiter.user_id]
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely to be free for a new query"""
+        run_seconds = self._run_seconds or 1.0
+        waves = (self._queued_total + 1) / max(1, self.max_concurrent)
+        return max(1, min(120, math.ceil(run_seconds * waves)))
+
+    def _reject(self, reason: str, status_code: int) -> AdmissionRejected:
+        self._rejected[reason] = self._rejected.get(reason, 0) + 1
+        admission_rejections.inc(reason=reason)
+        return AdmissionRejected(reason, status_code, self.retry_after())
+
+    async def acquire(self, user_id: str) -> None:
+        """
+        Wait for a slot
+
+        Raises:
+            AdmissionRejected: The query was refused or waited too long
+        """
+        if self._can_start(user_id) and user_id not in self._queues:
+            self._start(user_id, 0.0)
+            return
+
+        if len(self._queues.get(user_id, ())) >= self.max_queue_per_user:
+            raise self._reject("user_queue_full", 429)
+        if self._queued_total >= self.max_queue:
+            raise self._reject("queue_full", 503)
+
+        waiter = _Waiter(user_id)
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self._queued_total += 1
+        self._queued += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.future.done():
+                # The slot was granted as the budget ran out
+                return
+            waiter.future.cancel()
+            self._remove_waiter(waiter)
+            raise self._reject("queue_timeout", 503)
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                self.release(user_id)
+            else:
+                waiter.future.cancel()
+                self._remove_waiter(waiter)
+            raise
+
+    def release(self, user_id: str, held_for: Optional[float] = None) -> None:
+        """
+        Free a slot taken by acquire
+
+        Args:
+            user_id: The user the slot was taken for
+            held_for: Seconds the slot was held, used for Retry-After estimates
+        """
+        remaining = self._running.get(user_id, 0) - 1
+        if remaining > 0:
+            self._running[user_id] = remaining
+        else:
+            self._running.pop(user_id, None)
+        self._running_total -= 1
+        if held_for is not None:
+            self._run_seconds = held_for if not self._run_seconds else 0.9 * self._run_seconds + 0.1 * held_for
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str]) -> AsyncIterator[None]:
+        """
+        Hold a slot for the duration of the block
+
+        Raises:
+            AdmissionRejected: The query was refused or waited too long
+        """
+        if not self.enabled:
+            yield
+            return
+
+        user_id = user_id or "anonymous"
+        await self.acquire(user_id)
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(user_id, time.monotonic() - started_at)
+
+    def stats(self) -> Dict[str, Any]:
+        """Current load, queue depth, wait times and rejection counters"""
+        waits = sorted(self._waits)
+
+        def wait_percentile(fraction: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(fraction * len(waits)))] * 1000, 3)
+
+        return {
+            "enabled": self.enabled,
+            "running": self._running_total,
+            "queued": self._queued_total,
+            "users_running": len(self._running),
+            "users_queued": len(self._queues),
+            "admitted": self._admitted,
+            "queued_total": self._queued,
+            "rejected": dict(self._rejected),
+            "wait_ms": {"p50": wait_percentile(0.5), "p95": wait_percentile(0.95), "max": wait_percentile(1.0)},
+            "average_run_ms": round(self._run_seconds * 1000, 3)
+        }
+
+
+admission_controller = AdmissionController(
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+    max_per_user=settings.ADMISSION_MAX_PER_USER,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_queue_per_user=settings.ADMISSION_MAX_QUEUE_PER_USER,
+    queue_timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+    enabled=settings.ADMISSION_ENABLED
+)
+
+metrics.gauge("admission_running", "Agent pipeline runs in progress", lambda: admission_controller.stats()["running"])
+metrics.gauge("admission_queued", "Agent queries waiting for a run slot", lambda: admission_controller.stats()["queued"])
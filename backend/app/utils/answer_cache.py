@@ -0,0 +1,383 @@
+"""
+Answer cache for knowledge agent responses.
+
+Answers are cached in two tiers:
+- An in-process LRU cache with a TTL, checked first on every query
+- A MongoDB collection shared by all workers, which also survives restarts
+
+Lookups are exact on the normalized query text. When a similarity threshold is
+configured, near-identical questions can also be served from the in-process tier.
+Expired answers are kept for max_stale_seconds, in process and in MongoDB, so
+they can still be served, flagged as stale, while the models are unavailable.
+"""
+from typing import Dict, List, Any, Optional, Callable
+from collections import OrderedDict
+from datetime import datetime, timezone
+import asyncio
+import hashlib
+import math
+import re
+import time
+
+from loguru import logger
+
+from app.utils.config import settings
+from app.utils.sources import Source, sources_from
+
+CACHE_COLLECTION = "answer_cache"
+CACHE_TTL_INDEX_NAME = "created_at_1"
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query so trivially different phrasings share a cache entry.
+
+    Lowercases the text, drops punctuation and collapses whitespace.
+    """
+    return " ".join(_WORD_PATTERN.findall(query.lower()))
+
+
+def cache_key(query: str, namespace: str = "") -> str:
+    """Build the cache key for a query, optionally scoped to a namespace (e.g. "research")"""
+    normalized = normalize_query(query)
+    if namespace:
+        normalized = f"{namespace}\x00{normalized}"
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def embed_query(query: str) -> Dict[str, float]:
+    """
+    Build a sparse, L2-normalized bag-of-words embedding for a query.
+
+    Words and word bigrams are used as features, which is enough to match
+    reordered or slightly reworded questions without a model round trip.
+    """
+    words = normalize_query(query).split()
+    features: Dict[str, float] = {}
+    for word in words:
+        features[word] = features.get(word, 0.0) + 1.0
+    for first, second in zip(words, words[1:]):
+        bigram = f"{first} {second}"
+        features[bigram] = features.get(bigram, 0.0) + 1.0
+
+    norm = math.sqrt(sum(weight * weight for weight in features.values()))
+    if not norm:
+        return {}
+    return {feature: weight / norm for feature, weight in features.items()}
+
+
+def cosine_similarity(first: Dict[str, float], second: Dict[str, float]) -> float:
+    """Cosine similarity between two normalized sparse embeddings"""
+    if len(first) > len(second):
+        first, second = second, first
+    return sum(weight * second.get(feature, 0.0) for feature, weight in first.items())
+
+
+class CacheEntry:
+    """
+    A cached agent answer
+    """
+    __slots__ = ("key", "query", "response", "sources", "created_at", "embedding", "namespace")
+
+    def __init__(self, key: str, query: str, response: str, sources: List[Source],
+                 created_at: float, embedding: Optional[Dict[str, float]] = None, namespace: str = ""):
+        self.key = key
+        self.namespace = namespace
+        self.query = query
+        self.response = response
+        self.sources = sources
+        self.created_at = created_at
+        self.embedding = embedding
+
+    def age(self) -> float:
+        """Age of the entry in seconds"""
+        return max(0.0, time.time() - self.created_at)
+
+    def to_result(self, tier: str, similarity: Optional[float] = None, stale: bool = False) -> Dict[str, Any]:
+        """Build a get_information style result for this entry"""
+        cache_info = {
+            "hit": True,
+            "tier": tier,
+            "age_seconds": round(self.age(), 3)
+        }
+        if stale:
+            cache_info["stale"] = True
+        if similarity is not None:
+            cache_info["similarity"] = round(similarity, 4)
+            cache_info["matched_query"] = self.query
+
+        return {
+            "response": self.response,
+            "sources": list(self.sources),  # Sources are immutable, so they are shared
+            "metadata": {"cache": cache_info}
+        }
+
+
+class AnswerCache:
+    """
+    Two-tier (in-process LRU + MongoDB) cache of agent answers
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: int = 3600,
+        similarity_threshold: float = 0.0,
+        persist: bool = True,
+        embedder: Callable[[str], Dict[str, float]] = embed_query,
+        max_stale_seconds: int = 0
+    ):
+        """
+        Args:
+            max_entries: Maximum number of answers kept in process
+            ttl_seconds: How long an answer may be served from the cache
+            similarity_threshold: Minimum similarity for a near-identical query hit, 0 disables it
+            persist: Whether to use the shared MongoDB tier
+            embedder: Function building the embedding used for similarity hits
+            max_stale_seconds: How long past the TTL an answer may still be served
+                to lookups allowing stale answers
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.persist = persist
+        self.embedder = embedder
+        self.max_stale_seconds = max_stale_seconds
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._indexes_ready = False
+        self._pending_writes: set = set()
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.similarity_threshold > 0
+
+    def _is_fresh(self, entry: CacheEntry) -> bool:
+        return entry.age() < self.ttl_seconds
+
+    @property
+    def retention_seconds(self) -> int:
+        """How long an entry is kept, including the time it may be served stale"""
+        return self.ttl_seconds + self.max_stale_seconds
+
+    def _is_servable(self, entry: CacheEntry, allow_stale: bool) -> bool:
+        if allow_stale:
+            return entry.age() < self.retention_seconds
+        return self._is_fresh(entry)
+
+    def _remember(self, entry: CacheEntry) -> None:
+        """Insert an entry in the in-process tier, evicting the least recently used ones"""
+        if self.semantic_enabled and entry.embedding is None:
+            entry.embedding = self.embedder(entry.query)
+        self._entries[entry.key] = entry
+        self._entries.move_to_end(entry.key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _get_memory(self, key: str, allow_stale: bool = False) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not self._is_servable(entry, allow_stale):
+            # Expired entries are kept for stale lookups until they are too old even for those
+            if not self._is_servable(entry, allow_stale=True):
+                del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _get_similar(self, query: str, namespace: str = "", allow_stale: bool = False) -> Optional[tuple]:
+        """Find the most similar servable entry of a namespace above the similarity threshold"""
+        embedding = self.embedder(query)
+        if not embedding:
+            return None
+
+        best_entry, best_score = None, self.similarity_threshold
+        for entry in self._entries.values():
+            if entry.namespace != namespace or entry.embedding is None or not self._is_servable(entry, allow_stale):
+                continue
+            score = cosine_similarity(embedding, entry.embedding)
+            if score >= best_score:
+                best_entry, best_score = entry, score
+
+        if best_entry is None:
+            return None
+        self._entries.move_to_end(best_entry.key)
+        return best_entry, best_score
+
+    def _get_collection(self):
+        """Get the shared cache collection, or None when MongoDB isn't available"""
+        if not self.persist:
+            return None
+        from app.db import mongodb
+        if mongodb.mongodb_database is None:
+            return None
+        return mongodb.mongodb_database[CACHE_COLLECTION]
+
+    async def _ensure_indexes(self, collection) -> None:
+        """
+        Let MongoDB expire shared entries once they are too old to be served
+
+        Entries are kept max_stale_seconds past the TTL so that other workers
+        can serve them stale too; lookups check freshness themselves. An index
+        left by a different retention is updated with collMod, since
+        create_index refuses to change its options.
+        """
+        if self._indexes_ready:
+            return
+        expire_after = self.retention_seconds
+        existing = (await collection.index_information()).get(CACHE_TTL_INDEX_NAME)
+        if existing is None:
+            await collection.create_index("created_at", name=CACHE_TTL_INDEX_NAME, expireAfterSeconds=expire_after)
+        elif existing.get("expireAfterSeconds") != expire_after:
+            await collection.database.command(
+                "collMod", collection.name,
+                index={"name": CACHE_TTL_INDEX_NAME, "expireAfterSeconds": expire_after}
+            )
+            logger.info(f"Shared answer cache entries now expire after {expire_after}s")
+        self._indexes_ready = True
+
+    async def _get_shared(self, key: str, namespace: str = "", allow_stale: bool = False) -> Optional[CacheEntry]:
+        collection = self._get_collection()
+        if collection is None:
+            return None
+
+        try:
+            document = await collection.find_one({"_id": key})
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            return None
+        if not document:
+            return None
+
+        # MongoDB hands back naive datetimes in UTC
+        created_at = document["created_at"].replace(tzinfo=timezone.utc).timestamp()
+        entry = CacheEntry(
+            key=key,
+            query=document.get("query", ""),
+            response=document.get("response", ""),
+            sources=sources_from(document.get("sources")),
+            created_at=created_at,
+            namespace=namespace
+        )
+        if not self._is_servable(entry, allow_stale):
+            return None
+
+        self._remember(entry)
+        return entry
+
+    async def get(self, query: str, namespace: str = "", allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer for a query
+
+        Args:
+            query: The user's query string
+            namespace: Keeps answers of different pipeline variants apart
+            allow_stale: Also return answers up to max_stale_seconds past their TTL
+
+        Returns:
+            A get_information style result with cache metadata, or None on a miss
+        """
+        key = cache_key(query, namespace)
+
+        entry = self._get_memory(key, allow_stale)
+        if entry is not None:
+            return entry.to_result("memory", stale=not self._is_fresh(entry))
+
+        entry = await self._get_shared(key, namespace, allow_stale)
+        if entry is not None:
+            return entry.to_result("mongo", stale=not self._is_fresh(entry))
+
+        if self.semantic_enabled:
+            match = self._get_similar(query, namespace, allow_stale)
+            if match is not None:
+                entry, score = match
+                return entry.to_result("semantic", similarity=score, stale=not self._is_fresh(entry))
+
+        return None
+
+    async def set(self, query: str, result: Dict[str, Any], namespace: str = "") -> None:
+        """
+        Store an answer in the cache
+
+        The shared tier is written in the background so a cache miss doesn't pay
+        for an extra database round trip.
+
+        Args:
+            query: The user's query string
+            result: The result returned by the knowledge pipeline
+            namespace: Keeps answers of different pipeline variants apart
+        """
+        entry = CacheEntry(
+            key=cache_key(query, namespace),
+            query=normalize_query(query),
+            response=result.get("response", ""),
+            sources=sources_from(result.get("sources")),
+            created_at=time.time(),
+            namespace=namespace
+        )
+        self._remember(entry)
+
+        collection = self._get_collection()
+        if collection is not None:
+            task = asyncio.create_task(self._write_shared(collection, entry))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    async def _write_shared(self, collection, entry: CacheEntry) -> None:
+        try:
+            await self._ensure_indexes(collection)
+        except Exception as e:
+            # Entries are still shared, the index is set up again on the next write
+            logger.warning(f"Failed to set up the answer cache TTL index: {e}")
+        try:
+            await collection.replace_one(
+                {"_id": entry.key},
+                {
+                    "query": entry.query,
+                    "namespace": entry.namespace,
+                    "response": entry.response,
+                    "sources": entry.sources,
+                    "created_at": datetime.utcfromtimestamp(entry.created_at)
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logger.warning(f"Failed to write answer cache entry: {e}")
+
+    async def invalidate(self, query: str, namespace: str = "") -> None:
+        """Remove a query's answer from both tiers"""
+        key = cache_key(query, namespace)
+        self._entries.pop(key, None)
+
+        collection = self._get_collection()
+        if collection is not None:
+            try:
+                await collection.delete_one({"_id": key})
+            except Exception as e:
+                logger.warning(f"Failed to invalidate answer cache entry: {e}")
+
+    def clear(self) -> None:
+        """Drop every entry from the in-process tier"""
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Current size and configuration of the in-process tier"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "max_stale_seconds": self.max_stale_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "persist": self.persist
+        }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    persist=settings.ANSWER_CACHE_PERSIST,
+    max_stale_seconds=settings.ANSWER_CACHE_MAX_STALE_SECONDS
+)
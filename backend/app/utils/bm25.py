@@ -0,0 +1,105 @@
+"""
+In-process BM25 full-text index.
+
+Used by search when MongoDB has no text index to answer $text queries, e.g.
+on deployments where the migration creating it could not run. Documents are
+made of weighted fields, so a term in a title counts more than a term in the
+body, the way the text index weights do.
+"""
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import math
+import re
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Common English words that say nothing about what a document is about
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how in is it its of on or that the this "
+    "to was were what when where which who why will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens of a text, without stopwords and single characters"""
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    An inverted index ranking documents with Okapi BM25
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            k1: Term frequency saturation
+            b: How much long documents are penalized
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[Hashable, float]] = {}
+        self._lengths: Dict[Hashable, float] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: Hashable, fields: Iterable[Tuple[Optional[str], float]]) -> None:
+        """
+        Index a document
+
+        Args:
+            doc_id: Identifies the document in search results
+            fields: (text, weight) pairs, a term in a field of weight 5 counts five times
+        """
+        if doc_id in self._lengths:
+            self.remove(doc_id)
+        frequencies: Dict[str, float] = {}
+        length = 0.0
+        for text, weight in fields:
+            for token in tokenize(text or ""):
+                frequencies[token] = frequencies.get(token, 0.0) + weight
+                length += weight
+        for token, frequency in frequencies.items():
+            self._postings.setdefault(token, {})[doc_id] = frequency
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: Hashable) -> None:
+        """Drop a document from the index"""
+        length = self._lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        for token in list(self._postings):
+            postings = self._postings[token]
+            if postings.pop(doc_id, None) is not None and not postings:
+                del self._postings[token]
+
+    def search(self, query: str, candidates: Optional[Set[Hashable]] = None) -> List[Tuple[Hashable, float]]:
+        """
+        Documents matching any query term, best first
+
+        Args:
+            query: Free text
+            candidates: Only score these documents, e.g. the ones passing facet filters
+
+        Returns:
+            (doc_id, score) pairs sorted by decreasing score
+        """
+        if not self._lengths:
+            return []
+        document_count = len(self._lengths)
+        average_length = self._total_length / document_count or 1.0
+        scores: Dict[Hashable, float] = {}
+        for token in set(tokenize(query)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (document_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                if candidates is not None and doc_id not in candidates:
+                    continue
+                norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
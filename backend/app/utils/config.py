@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     # MongoDB Connection
@@ -9,6 +9,13 @@ class Settings(BaseSettings):
     # Authentication
     SECRET_KEY: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 1440  # 24 hours
+    BCRYPT_ROUNDS: int = 12  # Cost factor for new password hashes, older hashes are upgraded on login
+    PASSWORD_HASH_WORKERS: int = 4  # Threads used for password hashing
+    PASSWORD_HASH_MAX_PENDING: int = 256  # Hashing jobs allowed to wait for a thread, 0 for no limit
+    USER_CACHE_TTL_SECONDS: float = 60.0  # How long an authenticated user is cached, 0 disables the cache
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_WATCH_CHANGES: bool = False  # Invalidate cached users through a change stream (needs a replica set)
+    AUTH_TRUST_TOKEN_CLAIMS: bool = False  # Read-only endpoints trust the profile claims in the token instead of loading the user
     
     # API Keys
     GOOGLE_API_KEY: str = ""
@@ -17,12 +24,129 @@ class Settings(BaseSettings):
     # Google settings
     GOOGLE_GENAI_USE_VERTEXAI: bool = False
     
+    # Agents
+    AGENT_MODEL: str = "gemini-2.0-flash-exp"
+    AGENT_MODEL_BACKEND: str = "gemini"  # "gemini", or "fake" for the offline stand-in used in benchmarks
+    FAKE_LLM_LATENCY_MS: int = 0
+    FAKE_LLM_JITTER_MS: int = 0
+    FAKE_LLM_RESPONSES_PATH: str = ""  # Optional JSON file of canned finder answers keyed by query
+    FAKE_LLM_FAILURE_RATE: float = 0.0  # Fraction of fake model calls failing with a transient error
+    FAKE_LLM_SLOW_RATE: float = 0.0  # Fraction of fake model calls taking FAKE_LLM_SLOW_MS longer
+    FAKE_LLM_SLOW_MS: int = 0
+    AGENT_RUNNER_POOL_SIZE: int = 16  # Maximum number of concurrent agent pipelines per worker
+    AGENT_RUNNER_ACQUIRE_TIMEOUT: float = 60.0  # Seconds a query waits for a free runner
+    SOURCE_TITLE_SIMILARITY: float = 0.8  # Title word overlap above which two sources are duplicates
+    
+    # Research mode
+    RESEARCH_BACKEND: str = "agent"  # "agent", or "fake" for canned offline branch results
+    RESEARCH_SUBQUERIES: int = 4  # Sub-queries a research query is split into
+    RESEARCH_CONCURRENCY: int = 4  # Branches of one research query running at once
+    RESEARCH_RUNNER_POOL_SIZE: int = 8  # Branches running at once across all research queries
+    RESEARCH_BRANCH_TIMEOUT: float = 60.0  # Seconds after which a branch is abandoned
+    
+    # Local formatter, replacing the organizer agent for short or well structured content
+    LOCAL_FORMATTER_ENABLED: bool = True
+    LOCAL_FORMATTER_MAX_CHARS: int = 1500  # Content up to this length is always formatted locally
+    LOCAL_FORMATTER_MAX_PARAGRAPH_CHARS: int = 1200  # Longer content needs headings and paragraphs below this
+    
+    # Single-flight coalescing of identical in-flight queries
+    SINGLE_FLIGHT_ENABLED: bool = True
+    SINGLE_FLIGHT_TIMEOUT_SECONDS: float = 180.0  # Seconds a query waits for the identical run it joined
+    
+    # Admission control of agent pipeline runs
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 16  # Pipeline runs in progress per worker, at most AGENT_RUNNER_POOL_SIZE
+    ADMISSION_MAX_PER_USER: int = 2  # Pipeline runs in progress per user
+    ADMISSION_MAX_QUEUE: int = 256  # Queries waiting for a run slot
+    ADMISSION_MAX_QUEUE_PER_USER: int = 8  # Queries one user may have waiting, beyond which they get a 429
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 30.0  # Seconds a query may wait before it gets a 503
+    
+    # Resilience of the finder and organizer model calls
+    MODEL_RESILIENCE_ENABLED: bool = True
+    MODEL_DEADLINE_SECONDS: float = 60.0  # Seconds a model call attempt may take, 0 disables the deadline
+    MODEL_MAX_RETRIES: int = 2  # Retries of a transient model error
+    MODEL_RETRY_BASE_DELAY_SECONDS: float = 0.5  # Backoff before the first retry, doubled on each retry
+    MODEL_RETRY_MAX_DELAY_SECONDS: float = 8.0
+    MODEL_HEDGE_ENABLED: bool = False  # Send a duplicate request when a call is slower than usual
+    MODEL_HEDGE_QUANTILE: float = 0.95  # Latency quantile after which the duplicate is sent
+    MODEL_HEDGE_MIN_SAMPLES: int = 20  # Calls observed before hedging starts
+    MODEL_BREAKER_FAILURE_THRESHOLD: int = 5  # Consecutive failures opening a model circuit
+    MODEL_BREAKER_RESET_SECONDS: float = 30.0  # Seconds a circuit stays open before a trial call
+    
+    # Tracing and metrics
+    TRACING_ENABLED: bool = True  # Time spans into the /api/v1/metrics histograms
+    TRACING_EXPORTER: str = ""  # Also export spans: "log", "file" (JSON lines) or "console"
+    TRACING_FILE_PATH: str = "traces.jsonl"
+    METRICS_ENABLED: bool = True  # Serve /api/v1/metrics in the Prometheus text format
+    
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_MODULE_LEVELS: Dict[str, str] = {}  # Per-module levels, e.g. {"app.agents": "DEBUG"}
+    LOG_DEBUG_SAMPLE_RATE: float = 0.1  # Fraction of requests whose debug records are kept
+    LOG_MAX_MESSAGE_CHARS: int = 500  # Longer messages are truncated, 0 disables truncation
+    LOG_PAYLOADS: bool = False  # Log full search results, state values and answers
+    LOG_ENQUEUE: bool = True  # Write log records from a background thread
+    LOG_JSON: bool = False  # One JSON object per record
+    
     # API prefix
     API_V1_STR: str = "/api/v1"
     
+    # API responses
+    FAST_JSON_ENABLED: bool = True  # Encode list and agent responses with orjson, false for the stdlib encoder
+    
+    # Query history retention
+    HISTORY_FULL_RETENTION_DAYS: int = 30  # Days entries keep their full response, 0 never compacts them
+    HISTORY_MAX_RETENTION_DAYS: int = 0  # Days after which entries are deleted, 0 keeps them forever
+    HISTORY_COMPACTION_INTERVAL_SECONDS: int = 3600
+    HISTORY_SUMMARY_CHARS: int = 280  # Length of the response summary kept by compacted entries
+    HISTORY_WRITE_BATCH_SIZE: int = 100  # History entries written per insert_many
+    HISTORY_WRITE_FLUSH_INTERVAL_SECONDS: float = 0.5  # Maximum delay before a history entry is written
+    HISTORY_WRITE_QUEUE_SIZE: int = 10000  # History entries waiting to be written before new ones are dropped
+    HISTORY_WRITE_ENQUEUE_TIMEOUT_SECONDS: float = 0.05  # How long a request waits for room in a full queue
+    HISTORY_WRITE_RETRY_BACKOFF_SECONDS: float = 0.5  # Wait before retrying a batch that failed with a transient error
+    
+    # Diagnostics
+    DIAGNOSTICS_ENABLED: bool = False  # Serve /api/diagnostics (migrations, indexes, query plans)
+    DIAGNOSTICS_SLOW_QUERY_MS: int = 100  # Queries at least this slow are reported as slow
+    DIAGNOSTICS_ADMIN_USER_IDS: List[str] = []  # Ids of the users allowed to read diagnostics, as a JSON list
+    
+    # Retrieval over past answers
+    RAG_ENABLED: bool = False  # Give finder_agent passages of past answers as context
+    RAG_INDEX_PATH: str = ""  # Directory of the memory-mapped index, one per worker; empty keeps it in memory
+    RAG_EMBEDDING_DIM: int = 256
+    RAG_TOP_K: int = 4  # Passages retrieved per query
+    RAG_MIN_SCORE: float = 0.3  # Similarity below which passages are ignored
+    RAG_SKIP_SEARCH_SCORE: float = 1.1  # Similarity of the best passage needed to skip the search, above 1 never skips
+    RAG_SKIP_MIN_PASSAGES: int = 1  # Passages needed to skip the search
+    RAG_CONTEXT_CHARS: int = 2000  # Maximum context added to the finder request
+    RAG_NPROBE: int = 8  # Index partitions searched per query
+    RAG_BOOTSTRAP_LIMIT: int = 2000  # Recent history entries indexed at startup when the index is empty
+    RAG_FLUSH_INTERVAL_SECONDS: float = 30.0  # Seconds between two writes of the memory-mapped index to disk
+    
+    # Search over saved results and query history
+    SEARCH_BACKEND: str = "auto"  # "text" (MongoDB text index), "bm25" (in-process index) or "auto"
+    SEARCH_FACET_SIZE: int = 10  # Values returned per facet
+    SEARCH_LOCAL_MAX_DOCUMENTS: int = 5000  # Most recent documents of a user in a BM25 index
+    SEARCH_LOCAL_INDEX_TTL_SECONDS: int = 60  # How long a BM25 index is reused
+    SEARCH_LOCAL_MAX_INDEXES: int = 128  # BM25 indexes kept in memory
+    
+    # Bulk export and import of saved results and query history
+    TRANSFER_EXPORT_BATCH_SIZE: int = 500  # Documents read from the cursor and sent per chunk
+    TRANSFER_IMPORT_BATCH_SIZE: int = 500  # Documents inserted per insert_many
+    TRANSFER_IMPORT_MAX_DOCUMENTS: int = 100000  # Documents accepted by one import
+    TRANSFER_IMPORT_MAX_LINE_BYTES: int = 4194304  # Longest accepted NDJSON line (4 MB)
+    
     # CORS Settings
     CORS_ORIGINS: List[str]
     
+    # Answer cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_TTL_SECONDS: int = 3600  # 1 hour
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.0  # 0 disables similarity hits
+    ANSWER_CACHE_PERSIST: bool = True  # Share cached answers across workers through MongoDB
+    ANSWER_CACHE_MAX_STALE_SECONDS: int = 86400  # How long expired answers are kept, in process and in MongoDB, to be served while the models are down
+    
     class Config:
         env_file = ".env"
         env_file_encoding = 'utf-8'
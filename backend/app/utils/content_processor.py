@@ -5,21 +5,53 @@ from typing import Dict, List, Any, Optional
 import re
 from datetime import datetime
 
+from loguru import logger
+
+from app.utils.log import truncate
+from app.utils.source_dedup import SourceIndex
+from app.utils.sources import Source
+from app.utils.tracing import traced
+
+# Patterns used while parsing search results, compiled once at import time
+REFERENCES_MARKER = "References:"
+URL_PATTERN = re.compile(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*/?')
+VALID_URL_PATTERN = re.compile(r'^https?://[a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)*.*$')
+PARENTHESIZED_YEAR_PATTERN = re.compile(r'\((\d{4})[^)]*\)')
+STANDALONE_YEAR_PATTERN = re.compile(r'\b(20[0-2][0-9])\b')
+CITATION_TITLE_PATTERN = re.compile(r'\(\d{4}\)\.\s+(.*?)(?=\.|https?://|$)')
+CITATION_AUTHOR_PATTERN = re.compile(r'^([^(]+?)(?:\s*\(|\s*\.)')
+
+# Position of each four-part reference field in the (title, source, link, year) tuple
+FOUR_PART_FIELDS = {"Title": 0, "Source": 1, "Link": 2, "Year": 3}
+
+# Markdown characters removed from the extracted content
+MARKUP_TRANSLATION = str.maketrans("", "", "*#")
+
+# Domains and prefixes that indicate a placeholder rather than a real URL
+SUSPICIOUS_URL_PATTERN = re.compile("|".join(
+    re.escape(pattern) for pattern in ('example.com', 'placeholder.', 'dummy.', 'fake.', 'test.example', 'test.test')
+))
+
 class ContentProcessor:
     """
     A utility class for processing and formatting content from search results.
     """
     
     @staticmethod
+    @traced("content_processor.extract")
     def extract_content_and_references(search_results: str) -> Dict[str, Any]:
         """
-        Extract content and references from formatted search results with three-part reference format.
+        Extract content and references from formatted search results with four-part reference format.
+        
+        The text before the first "References:" heading becomes the content, with
+        markdown emphasis and heading characters removed. Every line after it is
+        parsed as a reference in a single pass, skipping invalid URLs and duplicates.
         
         Args:
             search_results: Text containing content and references
             
         Returns:
-            Dictionary with 'content' and 'references' keys
+            Dictionary with 'content' and 'references' (a list of Source) keys
         """
         if not search_results:
             return {"content": "", "references": []}
@@ -27,74 +59,46 @@ class ContentProcessor:
         # If input is not a string, handle it appropriately
         if not isinstance(search_results, str):
             return {"content": "", "references": []}
-            
-        # Split by "References:" heading
-        print(f"search results before splitting are: {search_results}")
-        parts = search_results.split("References:", 1)
-        print(f"parts after splitting: {parts}")
         
-        extracted_content = parts[0].strip() if parts else search_results.strip()
-        content = extracted_content.replace("*", "").replace("#", "")
-        print(f"content after stripping: {content}")
+        marker = search_results.find(REFERENCES_MARKER)
+        if marker == -1:
+            content_text, refs_text = search_results, ""
+        else:
+            content_text = search_results[:marker]
+            refs_text = search_results[marker + len(REFERENCES_MARKER):].strip()
+        content = content_text.strip().translate(MARKUP_TRANSLATION)
+        
         references = []
-        seen_urls = set()  # Track URLs to prevent duplicates
-        seen_titles = set()  # Track titles to prevent duplicates
+        seen = SourceIndex(title_similarity=None, min_title_length=6)  # Track URLs and titles to prevent duplicates
+        current_year = str(datetime.now().year)
         
-        # Extract references if available
-        if len(parts) > 1:
-            refs_text = parts[1].strip()
-            print(f"references part after stripping: {refs_text}")
-            # Split by new lines to get individual references
-            ref_lines = refs_text.split('\n')
+        for line in refs_text.split('\n'):
+            line = line.strip()
+            # Skip empty lines and separators
+            if not line or line[0] == '—' or line[0] == '-':
+                continue
+            
+            # Try to extract four-part format first: Title: ... | Source: ... | Link: ... | Year: ...
+            title, source, link, year = ContentProcessor._extract_four_part_reference(line)
+            
+            # If four-part format didn't work, fall back to traditional parsing
+            if not title and not link:
+                title, source, link, year = ContentProcessor._extract_traditional_reference(line)
             
-            for line in ref_lines:
-                line = line.strip()
-                if line and not line.startswith('—') and not line.startswith('-'):  # Skip empty lines and separators
-                    
-                    # Try to extract four-part format first: Title: ... | Source: ... | Link: ... | Year: ...
-                    title, source, link, year = ContentProcessor._extract_four_part_reference(line)
-                    
-                    # If four-part format didn't work, fall back to traditional parsing
-                    if not title and not link:
-                        title, source, link, year = ContentProcessor._extract_traditional_reference(line)
-                    
-                    # Validate and clean extracted data
-                    if link and not ContentProcessor._is_valid_url(link):
-                        print(f"Invalid URL detected, skipping: {link}")
-                        continue
-                    
-                    # Create normalized versions for duplicate checking
-                    normalized_title = title.lower().strip() if title else ""
-                    normalized_url = link.lower().strip() if link else ""
-                    
-                    # Skip duplicates based on URL or title
-                    if (normalized_url and normalized_url in seen_urls) or \
-                       (normalized_title and normalized_title in seen_titles and len(normalized_title) > 5):
-                        print(f"Duplicate reference detected, skipping: {title or link}")
-                        continue
-                    
-                    # Add to seen sets
-                    if normalized_url:
-                        seen_urls.add(normalized_url)
-                    if normalized_title and len(normalized_title) > 5:
-                        seen_titles.add(normalized_title)
-                    
-                    # Only add if we have meaningful content
-                    if title or link:
-                        # Use extracted year or fallback to current year
-                        if not year:
-                            year = str(datetime.now().year)
-                        
-                        # Only include the four essential fields
-                        references.append({
-                            "title": title or "Referenced Source",
-                            "source": source or "Source",
-                            "link": link,
-                            "year": year
-                        })
-                        print(f"Added reference - Title: {title}, Source: {source}, Link: {link}, Year: {year}")
+            # Validate and clean extracted data
+            if link and not ContentProcessor._is_valid_url(link):
+                continue
             
-            print(f"final references list after formation and deduplication: {references}")
+            # Skip duplicates based on URL or title
+            if not seen.add_if_new(link, title):
+                continue
+            
+            # Only add if we have meaningful content
+            if title or link:
+                # Only include the four essential fields, using the current year as fallback
+                references.append(Source(title or "Referenced Source", source or "Source", link, year or current_year))
+        
+        logger.debug(f"Extracted {len(content)} characters of content and {len(references)} references")
         
         return {
             "content": content,
@@ -110,28 +114,18 @@ class ContentProcessor:
         Returns:
             Tuple of (title, source, link, year)
         """
-        title = ""
-        source = ""
-        link = ""
-        year = ""
+        values = ["", "", "", ""]
         
         # Check if line contains the pipe separator format
         if " | " in line:
-            parts = line.split(" | ")
-            
-            for part in parts:
-                part = part.strip()
-                if part.startswith("Title:"):
-                    title = part[6:].strip()  # Remove "Title:" prefix
-                elif part.startswith("Source:"):
-                    source = part[7:].strip()  # Remove "Source:" prefix
-                elif part.startswith("Link:"):
-                    link = part[5:].strip()  # Remove "Link:" prefix
-                elif part.startswith("Year:"):
-                    year = part[5:].strip()  # Remove "Year:" prefix
-                    
-        print(f"Four-part extraction - Title: '{title}', Source: '{source}', Link: '{link}', Year: '{year}'")
-        return title, source, link, year
+            for part in line.split(" | "):
+                # "Title: ..." splits into the field name and its value
+                field, separator, value = part.strip().partition(":")
+                index = FOUR_PART_FIELDS.get(field) if separator else None
+                if index is not None:
+                    values[index] = value.strip()
+        
+        return tuple(values)
     
     @staticmethod
     def _extract_traditional_reference(line: str) -> tuple:
@@ -141,29 +135,28 @@ class ContentProcessor:
         Returns:
             Tuple of (title, source, link, year)
         """
-        # Extract URL using regex
-        urls = re.findall(r'https?://(?:[-\w.]|(?:%[\da-fA-F]{2}))+[/\w\.-]*/?', line)
-        link = urls[0] if urls else ""
+        # Extract URL
+        url_match = URL_PATTERN.search(line)
+        link = url_match.group(0) if url_match else ""
         
         # Extract year from text
         year = ContentProcessor._extract_year_from_text(line)
         
         # Extract title - look for patterns like "Title of article."
-        title_match = re.search(r'\(\d{4}\)\.\s+(.*?)(?=\.|https?://|$)', line)
+        title_match = CITATION_TITLE_PATTERN.search(line)
         title = ""
         if title_match:
             title = title_match.group(1).strip()
         else:
             # Fallback - use the first part before a period
-            title_parts = line.split('.')
-            if title_parts and len(title_parts[0].strip()) > 5:
-                title = title_parts[0].strip()
+            first_part = line.split('.', 1)[0].strip()
+            if len(first_part) > 5:
+                title = first_part
         
         # Extract author/source
-        author_match = re.search(r'^([^(]+?)(?:\s*\(|\s*\.)', line)
+        author_match = CITATION_AUTHOR_PATTERN.search(line)
         source = author_match.group(1).strip() if author_match else ""
         
-        print(f"Traditional extraction - Title: '{title}', Source: '{source}', Link: '{link}', Year: '{year}'")
         return title, source, link, year
     
     @staticmethod
@@ -173,24 +166,22 @@ class ContentProcessor:
             return False
         
         # Check for valid URL pattern
-        url_pattern = r'^https?://[a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?(\.[a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)*.*$'
-        if not re.match(url_pattern, url):
+        if not VALID_URL_PATTERN.match(url):
             return False
         
         # Check for suspicious patterns that might indicate invalid URLs
         # Be more specific to avoid false positives like "test.com" which could be valid
-        suspicious_patterns = ['example.com', 'placeholder.', 'dummy.', 'fake.', 'test.example', 'test.test']
-        return not any(pattern in url.lower() for pattern in suspicious_patterns)
+        return not SUSPICIOUS_URL_PATTERN.search(url.lower())
     
     @staticmethod
     def _extract_year_from_text(text: str) -> str:
         """Extract year from text."""
-        date_match = re.search(r'\((\d{4})[^)]*\)', text)
+        date_match = PARENTHESIZED_YEAR_PATTERN.search(text)
         if date_match:
             return date_match.group(1)
         
         # Look for standalone year
-        year_match = re.search(r'\b(20[0-2][0-9])\b', text)
+        year_match = STANDALONE_YEAR_PATTERN.search(text)
         if year_match:
             return year_match.group(1)
         
@@ -263,11 +254,13 @@ def process_content(context: dict) -> str:
     search_results = context.get("search_results", "")
     sources = context.get("sources", [])
     
-    print(f"Processing content - Topic: {topic}")
-    print(f"Content available: {bool(content)} ({len(content) if content else 0} chars)")
-    print(f"Extracted info available: {bool(extracted_info)} ({len(extracted_info) if extracted_info else 0} chars)")
-    print(f"Search results available: {bool(search_results)} ({len(search_results) if search_results else 0} chars)")
-    print(f"Sources available: {len(sources) if isinstance(sources, list) else 'not a list'}")
+    logger.debug(
+        f"Processing content for {truncate(topic, 200)!r}: "
+        f"{len(content) if content else 0} chars of content, "
+        f"{len(extracted_info) if extracted_info else 0} chars of extracted info, "
+        f"{len(search_results) if search_results else 0} chars of search results, "
+        f"{len(sources) if isinstance(sources, list) else 'no'} sources"
+    )
     
     # Process search results if we have them but no content
     if not content and search_results:
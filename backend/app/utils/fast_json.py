@@ -0,0 +1,65 @@
+"""
+Fast JSON encoding for API responses.
+
+FastJSONResponse encodes its content with orjson. datetimes are written
+natively, and ObjectIds and sources through a default hook, so endpoints can
+return MongoDB documents and Source objects without converting them first.
+Returning the response from an endpoint also skips FastAPI's response model
+validation and jsonable_encoder pass, which copy the whole payload before it is
+encoded. Endpoints opt in by returning a FastJSONResponse; their
+response_model then only documents the shape.
+
+orjson is optional: without it, or with FAST_JSON_ENABLED off, the same
+content is encoded with the standard library.
+"""
+from typing import Any
+from datetime import date, datetime, timedelta
+import json
+
+from bson import ObjectId
+from starlette.responses import JSONResponse
+
+from app.utils.config import settings
+from app.utils.sources import Source
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+# UTC datetimes end in Z, as pydantic writes them
+ORJSON_OPTIONS = orjson.OPT_UTC_Z if orjson is not None else 0
+
+
+def _default(value: Any) -> Any:
+    """Encode the values neither encoder handles natively"""
+    if isinstance(value, Source):
+        return value.to_dict()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        # Only reached with the standard library encoder, which writes UTC like orjson does
+        if isinstance(value, datetime) and value.utcoffset() == timedelta(0):
+            return value.replace(tzinfo=None).isoformat() + "Z"
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Encode a value as compact UTF-8 JSON
+    """
+    if orjson is not None and settings.FAST_JSON_ENABLED:
+        return orjson.dumps(value, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse encoded with dumps
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
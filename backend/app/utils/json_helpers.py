@@ -5,6 +5,8 @@ import json
 import re
 from typing import List, Dict, Any, Optional, Union
 
+from app.utils.sources import Source
+
 def extract_json_from_text(text: str) -> Optional[Union[Dict, List]]:
     """
     Extract JSON from text, handling various formats including markdown code blocks
@@ -46,29 +48,32 @@ def extract_json_from_text(text: str) -> Optional[Union[Dict, List]]:
     except json.JSONDecodeError:
         return None
 
-def format_sources_list(sources_data: Any) -> List[Dict[str, str]]:
+def format_sources_list(sources_data: Any) -> List[Source]:
     """
     Format sources data into a standardized list of sources with four essential fields.
     
+    Sources are passed through as they are; source dicts are converted once.
+    
     Args:
         sources_data: Source data in various possible formats
         
     Returns:
-        List of source dictionaries with four essential fields: title, source, link, year
+        List of Source with four essential fields: title, source, link, year
     """
     formatted_sources = []
     
     # Handle direct list of sources
     if isinstance(sources_data, list):
         for item in sources_data:
-            if isinstance(item, dict):
-                source = {
-                    "title": item.get("title", "No title"),
-                    "source": item.get("source", item.get("author", "Unknown Source")),
-                    "link": item.get("link", ""),
-                    "year": item.get("year", "2025")
-                }
-                formatted_sources.append(source)
+            if isinstance(item, Source):
+                formatted_sources.append(item)
+            elif isinstance(item, dict):
+                formatted_sources.append(Source(
+                    item.get("title", "No title"),
+                    item.get("source", item.get("author", "Unknown Source")),
+                    item.get("link", ""),
+                    item.get("year", "2025")
+                ))
     
     # Handle dict with 'result' field
     elif isinstance(sources_data, dict) and "result" in sources_data:
@@ -81,20 +86,19 @@ def format_sources_list(sources_data: Any) -> List[Dict[str, str]]:
             return format_sources_list(json_data)
         else:
             # If no JSON found, create a generic source from the text
-            formatted_sources.append({
-                "title": "Information Source",
-                "source": "Knowledge Base",
-                "link": "",
-                "year": "2025"
-            })
+            formatted_sources.append(Source("Information Source", "Knowledge Base", "", "2025"))
     
     # If we couldn't extract proper sources, return a default source
     if not formatted_sources:
-        formatted_sources.append({
-            "title": "Information Source",
-            "source": "Knowledge Base",
-            "link": "",
-            "year": "2025"
-        })
+        formatted_sources.append(Source("Information Source", "Knowledge Base", "", "2025"))
     
     return formatted_sources
+
+
+def json_default(value: Any) -> Any:
+    """
+    default for json.dumps: sources become objects, anything else its string
+    """
+    if isinstance(value, Source):
+        return value.to_dict()
+    return str(value)
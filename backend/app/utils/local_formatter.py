@@ -0,0 +1,187 @@
+"""
+Deterministic formatting of finder content, used instead of the organizer LLM.
+
+The organizer agent reformats content so headings end with a colon, lists use
+bullets (•) and no markdown characters remain. For content that is short, or
+that already has headings and reasonably sized paragraphs, the same rules are
+applied locally, which saves a full model round trip. Anything else (long
+unstructured text, tables, code) is still routed to the organizer.
+"""
+from typing import Dict, List, Optional, Tuple
+import re
+
+from app.utils.config import settings
+from app.utils.metrics import metrics
+
+# Routes a content formatting request can take
+LOCAL_ROUTE = "local"
+ORGANIZER_ROUTE = "organizer"
+
+formatter_routes = metrics.counter(
+    "formatter_routes_total", "Content formatted locally or by organizer_agent", ("route", "reason")
+)
+
+_ATX_HEADING_PATTERN = re.compile(r"^\s{0,3}#{1,6}\s+(.+?)\s*#*\s*$")
+_EMPHASIS_HEADING_PATTERN = re.compile(r"^\s*(\*\*|__)(.+?)\1\s*:?\s*$")
+_COLON_HEADING_PATTERN = re.compile(r"^\s*([^\s•\-*+].{0,78}):\s*$")
+_SETEXT_UNDERLINE_PATTERN = re.compile(r"^\s*(=+|-+)\s*$")
+_HORIZONTAL_RULE_PATTERN = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_BULLET_PATTERN = re.compile(r"^\s*(?:[-*+•]|\d{1,3}[.)])\s+(.+)$")
+_LINK_PATTERN = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_TABLE_ROW_PATTERN = re.compile(r"^\s*\|.*\|\s*$")
+_CODE_FENCE = "```"
+
+# Characters the organizer is told never to emit, and _collect_result strips anyway
+_MARKUP_TRANSLATION = str.maketrans("", "", "*#_`")
+
+
+def _clean_inline(text: str) -> str:
+    """Replace links with their text and remove markdown characters"""
+    text = _LINK_PATTERN.sub(r"\1", text).translate(_MARKUP_TRANSLATION).replace("\\", "")
+    return " ".join(text.split())
+
+
+def _heading(text: str) -> str:
+    """A heading line ending with a single colon"""
+    return f"{_clean_inline(text).rstrip(':').rstrip()}:"
+
+
+def format_content(text: str) -> str:
+    """
+    Apply the organizer's formatting rules to markdown or plain text
+
+    Args:
+        text: Content to format
+
+    Returns:
+        Text whose headings end with a colon, whose list items start with a
+        bullet, with one blank line between paragraphs and no markdown characters
+    """
+    blocks: List[List[str]] = []
+    current: List[str] = []
+
+    def end_block():
+        nonlocal current
+        if current:
+            blocks.append(current)
+            current = []
+
+    lines = text.strip().splitlines()
+    for index, line in enumerate(lines):
+        next_line = lines[index + 1] if index + 1 < len(lines) else ""
+
+        if not line.strip():
+            end_block()
+            continue
+        if _SETEXT_UNDERLINE_PATTERN.match(line) and not current:
+            # Underline of a setext heading that has already been emitted
+            continue
+        if _HORIZONTAL_RULE_PATTERN.match(line):
+            end_block()
+            continue
+
+        heading = _ATX_HEADING_PATTERN.match(line) or _EMPHASIS_HEADING_PATTERN.match(line)
+        if heading or (_SETEXT_UNDERLINE_PATTERN.match(next_line) and not current) or _COLON_HEADING_PATTERN.match(line):
+            end_block()
+            heading_text = heading.group(heading.lastindex) if heading else line
+            blocks.append([_heading(heading_text)])
+            continue
+
+        bullet = _BULLET_PATTERN.match(line)
+        if bullet:
+            item = _clean_inline(bullet.group(1))
+            if item:
+                current.append(f"• {item}")
+            continue
+
+        cleaned = _clean_inline(line)
+        if current and not current[-1].startswith("• "):
+            # Lines of the same paragraph are joined, as markdown renders them
+            current[-1] = f"{current[-1]} {cleaned}"
+        elif cleaned:
+            current.append(cleaned)
+    end_block()
+
+    # Blank lines separate blocks, except between a heading and its body
+    output = ""
+    previous_was_heading = False
+    for block in blocks:
+        if output:
+            output += "\n" if previous_was_heading else "\n\n"
+        output += "\n".join(block)
+        previous_was_heading = len(block) == 1 and block[0].endswith(":") and not block[0].startswith("• ")
+    return output
+
+
+class LocalFormatter:
+    """
+    Decides whether content is formatted locally or by the organizer agent,
+    and counts how often each route is taken
+    """
+
+    def __init__(self, enabled: bool = True, max_chars: int = 1500, max_paragraph_chars: int = 1200):
+        """
+        Args:
+            enabled: Whether content may be formatted locally at all
+            max_chars: Content up to this length is always formatted locally
+            max_paragraph_chars: Longer content is formatted locally when it has
+                headings and no paragraph longer than this
+        """
+        self.enabled = enabled
+        self.max_chars = max_chars
+        self.max_paragraph_chars = max_paragraph_chars
+        self._routes: Dict[str, int] = {LOCAL_ROUTE: 0, ORGANIZER_ROUTE: 0}
+        self._reasons: Dict[str, int] = {}
+
+    def choose_route(self, text: Optional[str]) -> Tuple[str, str]:
+        """
+        Pick the route for a piece of content
+
+        Returns:
+            The route and the reason it was chosen
+        """
+        if not self.enabled:
+            return ORGANIZER_ROUTE, "disabled"
+        if not text or not text.strip():
+            return ORGANIZER_ROUTE, "empty"
+
+        lines = text.splitlines()
+        if any(line.strip().startswith(_CODE_FENCE) or _TABLE_ROW_PATTERN.match(line) for line in lines):
+            return ORGANIZER_ROUTE, "tables_or_code"
+        if len(text) <= self.max_chars:
+            return LOCAL_ROUTE, "short"
+
+        has_headings = any(
+            _ATX_HEADING_PATTERN.match(line) or _EMPHASIS_HEADING_PATTERN.match(line) or _COLON_HEADING_PATTERN.match(line)
+            for line in lines
+        )
+        if not has_headings:
+            return ORGANIZER_ROUTE, "unstructured"
+        longest_paragraph = max(len(paragraph) for paragraph in re.split(r"\n\s*\n", text))
+        if longest_paragraph > self.max_paragraph_chars:
+            return ORGANIZER_ROUTE, "long_paragraphs"
+        return LOCAL_ROUTE, "structured"
+
+    def record(self, route: str, reason: str) -> None:
+        """Count a routing decision"""
+        self._routes[route] = self._routes.get(route, 0) + 1
+        key = f"{route}:{reason}"
+        self._reasons[key] = self._reasons.get(key, 0) + 1
+        formatter_routes.inc(route=route, reason=reason)
+
+    def stats(self) -> Dict[str, object]:
+        """How often each route and reason was taken"""
+        total = sum(self._routes.values())
+        return {
+            "enabled": self.enabled,
+            "routes": dict(self._routes),
+            "reasons": dict(self._reasons),
+            "local_ratio": round(self._routes[LOCAL_ROUTE] / total, 4) if total else 0.0
+        }
+
+
+local_formatter = LocalFormatter(
+    enabled=settings.LOCAL_FORMATTER_ENABLED,
+    max_chars=settings.LOCAL_FORMATTER_MAX_CHARS,
+    max_paragraph_chars=settings.LOCAL_FORMATTER_MAX_PARAGRAPH_CHARS
+)
@@ -0,0 +1,220 @@
+"""
+Logging for the ArtiCube backend, built on loguru.
+
+setup_logging installs a single sink that:
+- writes from a background thread (enqueue), so a slow stdout or log
+  collector never blocks the event loop
+- applies per-module levels, e.g. LOG_MODULE_LEVELS='{"app.agents": "DEBUG"}'
+- tags every record with the id of the HTTP request it belongs to, which
+  RequestIdMiddleware assigns
+- truncates long messages to LOG_MAX_MESSAGE_CHARS
+- keeps only a sample of the debug records, chosen per request so that a
+  sampled request keeps all of its debug output
+
+The standard logging module, which uvicorn and a few libraries use, is routed
+into the same sink. Full search results, session state and answers are only
+logged through log_payload, which does nothing unless LOG_PAYLOADS is set.
+"""
+from typing import Any, Dict, Optional
+from contextvars import ContextVar
+import inspect
+import logging
+import random
+import sys
+import uuid
+import zlib
+
+from loguru import logger
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.config import settings
+
+# Header carrying the request id, read from the client when present and echoed back
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Id of the HTTP request being served, "-" outside of requests
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+LOG_FORMAT = (
+    "<green>{time:YYYY-MM-DD HH:mm:ss.SSS}</green> | <level>{level: <8}</level> | "
+    "{extra[request_id]} | <cyan>{name}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>"
+)
+
+
+def truncate(value: Any, limit: Optional[int] = None) -> str:
+    """
+    A string form of a value, cut to a length suitable for a log line
+
+    Args:
+        value: Anything, converted with str()
+        limit: Maximum characters, defaults to LOG_MAX_MESSAGE_CHARS
+    """
+    text = str(value)
+    limit = settings.LOG_MAX_MESSAGE_CHARS if limit is None else limit
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+
+def log_payload(label: str, value: Any) -> None:
+    """
+    Log a full payload (search results, state values, answers) when LOG_PAYLOADS is set
+
+    Payload records are never truncated or sampled.
+    """
+    if settings.LOG_PAYLOADS:
+        logger.opt(depth=1).bind(payload=True).debug(f"{label}: {value}")
+
+
+class _LevelFilter:
+    """
+    Per-module minimum levels and sampling of debug records
+    """
+
+    def __init__(self, default_level: str, module_levels: Dict[str, str], debug_sample_rate: float):
+        self.default_level = logger.level(default_level.upper()).no
+        # Longest prefix first, so "app.agents.research" beats "app.agents"
+        self.module_levels = sorted(
+            ((module, logger.level(level.upper()).no) for module, level in module_levels.items()),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+        self.debug_sample_rate = debug_sample_rate
+
+    def level_for(self, name: str) -> int:
+        for module, level in self.module_levels:
+            if name == module or name.startswith(module + "."):
+                return level
+        return self.default_level
+
+    @property
+    def min_level(self) -> int:
+        """The lowest level any module logs at"""
+        return min([self.default_level] + [level for _, level in self.module_levels])
+
+    def sampled(self, record_request_id: str) -> bool:
+        if self.debug_sample_rate >= 1.0:
+            return True
+        if record_request_id == "-":
+            return random.random() < self.debug_sample_rate
+        return zlib.crc32(record_request_id.encode()) % 10000 < self.debug_sample_rate * 10000
+
+    def __call__(self, record: Dict[str, Any]) -> bool:
+        extra = record["extra"]
+        if extra.get("payload") or extra.get("span"):
+            return True
+        level = record["level"].no
+        if level < self.level_for(record["name"] or ""):
+            return False
+        if level <= logger.level("DEBUG").no:
+            return self.sampled(extra["request_id"])
+        return True
+
+
+def _patch_record(record: Dict[str, Any]) -> None:
+    """Add the request id and cut long messages"""
+    extra = record["extra"]
+    if extra.get("request_id", "-") == "-":
+        extra["request_id"] = request_id.get()
+    if not (extra.get("payload") or extra.get("span")):
+        record["message"] = truncate(record["message"])
+
+
+class RequestIdMiddleware:
+    """
+    Tags each HTTP request, and every log record written while serving it, with
+    an id, taken from the X-Request-ID header when the client sends one and
+    echoed back in the response
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current_id = Headers(scope=scope).get(REQUEST_ID_HEADER, "")[:64] or uuid.uuid4().hex
+
+        async def send_with_request_id(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message)[REQUEST_ID_HEADER] = current_id
+            await send(message)
+
+        token = request_id.set(current_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id.reset(token)
+
+
+class InterceptHandler(logging.Handler):
+    """
+    Forwards standard logging records to loguru
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+        # Attribute the record to the code that called logging, not to this handler
+        frame, depth = inspect.currentframe(), 0
+        while frame and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+
+def _sink_level(level_filter: _LevelFilter) -> int:
+    """
+    The sink's minimum level, so loguru skips records no filter setting keeps
+    before formatting them
+
+    Payload and span records bypass the filter, so their levels count too when
+    they are enabled.
+    """
+    levels = [level_filter.min_level]
+    if settings.LOG_PAYLOADS:
+        levels.append(logger.level("DEBUG").no)
+    if settings.TRACING_ENABLED and settings.TRACING_EXPORTER == "log":
+        levels.append(logger.level("INFO").no)
+    return min(levels)
+
+
+_configured = False
+
+
+def setup_logging() -> None:
+    """Install the log sink and route the standard logging module into it, once per process"""
+    global _configured
+    if _configured:
+        return
+    _configured = True
+
+    logger.remove()
+    logger.configure(extra={"request_id": "-"}, patcher=_patch_record)
+    level_filter = _LevelFilter(settings.LOG_LEVEL, settings.LOG_MODULE_LEVELS, settings.LOG_DEBUG_SAMPLE_RATE)
+    logger.add(
+        sys.stdout,
+        level=_sink_level(level_filter),  # The filter applies the per-module levels above it
+        format=LOG_FORMAT,
+        filter=level_filter,
+        enqueue=settings.LOG_ENQUEUE,
+        serialize=settings.LOG_JSON,
+        colorize=False if settings.LOG_JSON else None,
+        backtrace=False,
+        diagnose=False
+    )
+
+    logging.basicConfig(handlers=[InterceptHandler()], level=logging.INFO, force=True)
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        logging.getLogger(name).handlers = [InterceptHandler()]
+        logging.getLogger(name).propagate = False
+
+
+async def flush_logging() -> None:
+    """Wait for the queued records to be written"""
+    await logger.complete()
@@ -0,0 +1,78 @@
+"""
+Keyset (cursor) pagination helpers for MongoDB list endpoints.
+
+A page is sorted newest first on (sort field, _id). The cursor is an opaque,
+URL-safe token holding the sort values of the last document on the previous
+page, so fetching any page is a single index range scan whatever its depth.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import base64
+
+from bson import json_util
+
+# Response header carrying the cursor of the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_value: Any, document_id: Any) -> str:
+    """
+    Encode the sort position of a document as an opaque cursor
+
+    Args:
+        sort_value: Value of the sort field, e.g. a datetime
+        document_id: The document's _id (ObjectId or string)
+    """
+    raw = json_util.dumps([sort_value, document_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """
+    Decode a cursor made by encode_cursor
+
+    Raises:
+        ValueError: The cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, document_id = json_util.loads(raw)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    return sort_value, document_id
+
+
+def after_cursor_filter(sort_field: str, cursor: Optional[str]) -> Dict[str, Any]:
+    """
+    Build the filter matching documents after a cursor in descending (sort_field, _id) order
+
+    Returns:
+        An empty filter when there is no cursor
+    """
+    if not cursor:
+        return {}
+    sort_value, document_id = decode_cursor(cursor)
+    return {
+        "$or": [
+            {sort_field: {"$lt": sort_value}},
+            {sort_field: sort_value, "_id": {"$lt": document_id}}
+        ]
+    }
+
+
+def descending_sort(sort_field: str) -> List[Tuple[str, int]]:
+    """Sort specification matching after_cursor_filter"""
+    return [(sort_field, -1), ("_id", -1)]
+
+
+def next_cursor(documents: List[Dict[str, Any]], sort_field: str, limit: int) -> Optional[str]:
+    """
+    Cursor for the page after documents, or None if this was the last page
+
+    Expects documents to hold up to limit + 1 results, the extra one only
+    signalling that another page exists. It is removed from the list.
+    """
+    if len(documents) <= limit:
+        return None
+    del documents[limit:]
+    last = documents[-1]
+    return encode_cursor(last[sort_field], last["_id"])
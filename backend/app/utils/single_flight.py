@@ -0,0 +1,120 @@
+"""
+Single-flight coalescing of identical in-flight work.
+
+The first caller for a key starts the work and later callers with the same key
+wait for that execution instead of starting their own. Every waiter receives
+the same result, or the same exception. The key is released as soon as the
+work finishes, so results are never reused after the fact; that is the answer
+cache's job.
+
+The work runs in its own task. A waiter that gives up (timeout, cancelled
+request) therefore never cancels the execution the other waiters depend on.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+import asyncio
+import copy
+
+
+class SingleFlightTimeout(Exception):
+    """Raised when a waiter gives up on an in-flight execution"""
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent executions keyed by a string
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout: Default seconds a caller waits for a result, None waits indefinitely
+        """
+        self.timeout = timeout
+        self._calls: Dict[str, asyncio.Task] = {}
+
+        # Metrics
+        self._executions = 0
+        self._coalesced = 0
+        self._failures = 0
+        self._timeouts = 0
+
+    def in_flight(self, key: str) -> bool:
+        """Whether an execution for the key is running"""
+        return key in self._calls
+
+    async def do(
+        self,
+        key: str,
+        work: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Run work for a key, or wait for the execution already running for it
+
+        Args:
+            key: Identifies identical work
+            work: Starts the work, only called when nothing is in flight for the key
+            timeout: Seconds to wait for the result, defaults to the instance timeout
+
+        Returns:
+            The result, and whether it was shared from another caller's execution.
+            Shared results are deep copies, so callers may modify them.
+
+        Raises:
+            SingleFlightTimeout: The result didn't arrive in time. The execution
+                keeps running for the other waiters.
+            Exception: Whatever the work raised, re-raised in every waiter
+        """
+        task = self._calls.get(key)
+        shared = task is not None
+        if shared:
+            self._coalesced += 1
+        else:
+            self._executions += 1
+            task = asyncio.create_task(self._run(key, work))
+            # Mark the outcome as retrieved even if every waiter gives up early
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            self._calls[key] = task
+
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise SingleFlightTimeout(f"No result for in-flight work after {timeout}s") from None
+        return (copy.deepcopy(result) if shared else result), shared
+
+    async def wait(self, key: str, timeout: Optional[float] = None) -> Optional[Any]:
+        """
+        Wait for the execution in flight for a key, without starting one
+
+        Returns:
+            A copy of the result, or None if nothing is in flight for the key
+        """
+        if key not in self._calls:
+            return None
+        result, _ = await self.do(key, _never_called, timeout)
+        return result
+
+    async def _run(self, key: str, work: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await work()
+        except BaseException:
+            self._failures += 1
+            raise
+        finally:
+            self._calls.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Executions started, callers served by another caller's execution, and failures"""
+        return {
+            "in_flight": len(self._calls),
+            "executions": self._executions,
+            "coalesced": self._coalesced,
+            "failures": self._failures,
+            "timeouts": self._timeouts
+        }
+
+
+async def _never_called() -> None:
+    raise RuntimeError("wait() only joins executions that are already in flight")
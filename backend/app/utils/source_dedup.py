@@ -0,0 +1,142 @@
+"""
+Duplicate detection for sources and references.
+
+SourceIndex keeps a hash index of normalized URLs and an inverted index of
+title words, so checking a new source costs roughly the same no matter how
+many sources were already accepted.
+"""
+from typing import Dict, FrozenSet, List, Optional, Set
+import math
+
+
+def normalize_url(url: Optional[str]) -> str:
+    """Normalize a URL for duplicate checks"""
+    return url.lower().strip() if url else ""
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """Normalize a title for duplicate checks"""
+    return title.lower().strip() if title else ""
+
+
+class SourceIndex:
+    """
+    Index of accepted sources used to reject duplicates
+
+    A source is a duplicate when its normalized URL was already seen, or when
+    its title matches an accepted title. Titles match either exactly or, when a
+    similarity threshold is set, when the share of common words
+    (|common| / max(|new words|, |existing words|)) is above the threshold.
+    """
+
+    def __init__(self, title_similarity: Optional[float] = 0.8, min_title_length: int = 11):
+        """
+        Args:
+            title_similarity: Word overlap above which two titles are duplicates,
+                None to only treat identical titles as duplicates
+            min_title_length: Titles shorter than this are never checked against
+                accepted titles
+        """
+        self.title_similarity = title_similarity
+        self.min_title_length = min_title_length
+
+        self._urls: Set[str] = set()
+        self._titles: Set[str] = set()
+        self._title_words: List[FrozenSet[str]] = []
+        self._postings: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._title_words)
+
+    def _has_similar_title(self, words: FrozenSet[str]) -> bool:
+        """Check whether any accepted title shares enough words with the new one"""
+        threshold = self.title_similarity
+        if threshold >= 1 or not words:
+            return False
+
+        # A match shares more than threshold * len(words) words with the new title,
+        # so it must contain at least one of the len(words) - required + 1 rarest
+        # words. Only those are looked up; candidates are then verified exactly.
+        required = max(1, math.ceil(threshold * len(words)))
+        probes = sorted(words, key=lambda word: len(self._postings.get(word, ())))
+        candidates = set()
+        for word in probes[:len(words) - required + 1]:
+            candidates.update(self._postings.get(word, ()))
+
+        for candidate in candidates:
+            existing = self._title_words[candidate]
+            if len(words & existing) / max(len(words), len(existing)) > threshold:
+                return True
+        return False
+
+    def is_duplicate(self, link: Optional[str] = None, title: Optional[str] = None) -> bool:
+        """
+        Check whether a source duplicates an accepted one
+
+        Args:
+            link: The source URL
+            title: The source title
+        """
+        return self._is_duplicate(normalize_url(link), normalize_title(title))
+
+    def _is_duplicate(self, url: str, normalized_title: str) -> bool:
+        if url and url in self._urls:
+            return True
+
+        if not normalized_title or len(normalized_title) < self.min_title_length:
+            return False
+        if self.title_similarity is None:
+            return normalized_title in self._titles
+        return self._has_similar_title(frozenset(normalized_title.split()))
+
+    def add(self, link: Optional[str] = None, title: Optional[str] = None) -> None:
+        """
+        Record an accepted source
+
+        Args:
+            link: The source URL
+            title: The source title
+        """
+        self._add(normalize_url(link), normalize_title(title))
+
+    def _add(self, url: str, normalized_title: str) -> None:
+        if url:
+            self._urls.add(url)
+
+        if not normalized_title:
+            return
+        if self.title_similarity is None:
+            self._titles.add(normalized_title)
+            return
+
+        words = frozenset(normalized_title.split())
+        position = len(self._title_words)
+        self._title_words.append(words)
+        for word in words:
+            self._postings.setdefault(word, []).append(position)
+
+    def add_if_new(self, link: Optional[str] = None, title: Optional[str] = None) -> bool:
+        """
+        Record a source unless it duplicates an accepted one
+
+        Returns:
+            True if the source was added, False if it is a duplicate
+        """
+        url, normalized_title = normalize_url(link), normalize_title(title)
+        if self._is_duplicate(url, normalized_title):
+            return False
+        self._add(url, normalized_title)
+        return True
+
+    def add_source_if_new(self, source) -> bool:
+        """
+        add_if_new for an app.utils.sources.Source, reusing its normalized URL
+
+        Returns:
+            True if the source was added, False if it is a duplicate
+        """
+        normalized_title = normalize_title(source.title)
+        if self._is_duplicate(source.url_key, normalized_title):
+            return False
+        self._add(source.url_key, normalized_title)
+        return True
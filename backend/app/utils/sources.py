@@ -0,0 +1,152 @@
+"""
+The sources cited by agent answers.
+
+A Source is created once, when a reference is parsed from the finder's output,
+and is passed as is through deduplication, the answer cache, the API response
+and the history and saved-result documents. It behaves like a read-only dict of
+its four fields, followed by any other keys a client sent with it (kept in
+Source.extra): pymongo encodes it as a BSON subdocument as it is, pydantic
+and json.dumps (with app.utils.json_helpers.json_default) write it as a JSON
+object, and code reading source dicts (for example documents loaded back from
+MongoDB) works on both.
+
+Source names, domains and years repeat across many answers, so they are
+interned. Each Source stores its domain and normalized URL when it is
+created, so later steps do not have to compute them again.
+"""
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from collections.abc import Mapping
+from types import MappingProxyType
+import copy
+import sys
+
+from pydantic_core import SchemaSerializer, core_schema
+
+from app.utils.source_dedup import normalize_url
+
+# The fields of a source, in their serialized order
+SOURCE_FIELDS = ("title", "source", "link", "year")
+_FIELD_SET = frozenset(SOURCE_FIELDS)
+
+# Shared by the sources without extra keys, which is nearly all of them
+_NO_EXTRA: Mapping = MappingProxyType({})
+
+
+def source_domain(link: Optional[str]) -> str:
+    """Domain of a source link, without a leading www."""
+    if not link:
+        return ""
+    start = link.rfind("//")
+    domain = (link[start + 2:] if start != -1 else link).partition("/")[0].lower()
+    return domain[4:] if domain.startswith("www.") else domain
+
+
+# Sources become plain objects when pydantic serializes to JSON, and stay as they are otherwise
+_JSON_SERIALIZATION = core_schema.plain_serializer_function_ser_schema(lambda source: source.to_dict(), when_used="json")
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+class Source(Mapping):
+    """
+    A reference: title, source name, link and year, plus any other keys a client
+    sent with it in extra
+
+    Sources are never modified once created, which lets the answer cache and
+    the responses built from it share them.
+    """
+    __slots__ = ("title", "source", "link", "year", "domain", "url_key", "extra")
+
+    def __init__(self, title: str = "", source: str = "", link: str = "", year: str = "",
+                 extra: Optional[Mapping[str, Any]] = None):
+        if type(link) is not str:
+            link = _text(link)
+        self.title = title if type(title) is str else _text(title)
+        self.source = sys.intern(source if type(source) is str else _text(source))
+        self.link = link
+        self.year = sys.intern(year if type(year) is str else _text(year))
+        self.domain = sys.intern(source_domain(link))
+        url_key = normalize_url(link)
+        # Most links are already normalized, and then share the link's string
+        self.url_key = link if url_key == link else url_key
+        self.extra = _NO_EXTRA if not extra else MappingProxyType(
+            {key: value for key, value in extra.items() if key not in _FIELD_SET}
+        )
+
+    @classmethod
+    def from_mapping(cls, data: Mapping) -> "Source":
+        """A Source from a source dict, the same Source when it already is one"""
+        if isinstance(data, Source):
+            return data
+        extra = None if _FIELD_SET.issuperset(data) else data
+        return cls(data.get("title", ""), data.get("source", ""), data.get("link", ""), data.get("year", ""), extra)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        return self.extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        if not self.extra:
+            return iter(SOURCE_FIELDS)
+        return iter(SOURCE_FIELDS + tuple(self.extra))
+
+    def __len__(self) -> int:
+        return len(SOURCE_FIELDS) + len(self.extra)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, Source):
+            return (self.title, self.source, self.link, self.year, self.extra) == (
+                other.title, other.source, other.link, other.year, other.extra
+            )
+        return Mapping.__eq__(self, other)
+
+    def __repr__(self) -> str:
+        extra = f", extra={dict(self.extra)!r}" if self.extra else ""
+        return f"Source(title={self.title!r}, source={self.source!r}, link={self.link!r}, year={self.year!r}{extra})"
+
+    def __reduce__(self):
+        return Source, (self.title, self.source, self.link, self.year, dict(self.extra) or None)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "Source":
+        # Sources are immutable, only the values of extra keys may need copying
+        if not self.extra:
+            return self
+        return Source(self.title, self.source, self.link, self.year, copy.deepcopy(dict(self.extra), memo))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The source as a plain dict, for serializers that only take dicts"""
+        source = {"title": self.title, "source": self.source, "link": self.link, "year": self.year}
+        if self.extra:
+            source.update(self.extra)
+        return source
+
+    def reference_line(self) -> str:
+        """The source in the finder's four-part reference format"""
+        return f"Title: {self.title} | Source: {self.source} | Link: {self.link} | Year: {self.year}"
+
+    @classmethod
+    def _validate(cls, value: Any) -> "Source":
+        if isinstance(value, Mapping):
+            return cls.from_mapping(value)
+        raise ValueError("a source must be an object with title, source, link and year")
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source_type: Any, handler: Any) -> core_schema.CoreSchema:
+        # model_dump() keeps the sources, so its output is written to MongoDB as is
+        return core_schema.no_info_plain_validator_function(cls._validate, serialization=_JSON_SERIALIZATION)
+
+
+# Lets pydantic serialize sources in fields typed Any as well
+Source.__pydantic_serializer__ = SchemaSerializer(core_schema.any_schema(serialization=_JSON_SERIALIZATION))
+
+
+def sources_from(items: Optional[Iterable[Any]]) -> List[Source]:
+    """
+    Sources from a list of sources or source dicts
+
+    Sources are reused as they are. Items that are not mappings are skipped.
+    """
+    return [Source.from_mapping(item) for item in items or () if isinstance(item, Mapping)]
@@ -0,0 +1,282 @@
+"""
+Tracing for the knowledge pipeline, built on OpenTelemetry.
+
+google-adk already depends on the OpenTelemetry SDK and opens spans for each
+invocation, agent run, model call (call_llm) and tool call (tool_call [name]).
+The application adds spans for HTTP requests (RequestTracingMiddleware), get_information, the pipeline
+phases, ContentProcessor parsing, authentication, history writes and every
+MongoDB command.
+
+Every finished span is timed into the span_duration_seconds histogram served
+by /api/v1/metrics. With TRACING_EXPORTER set, spans are also exported in
+batches from a background thread: "log" writes one JSON line per span to the
+application log, "file" appends them to TRACING_FILE_PATH and "console" prints
+the SDK's own format.
+"""
+from typing import Any, Callable, Dict, Optional, Sequence
+from functools import wraps
+import inspect
+import json
+import threading
+import time
+
+from loguru import logger
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult
+)
+from pymongo import monitoring
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.utils.config import settings
+from app.utils.log import request_id
+from app.utils.metrics import Histogram, metrics
+
+tracer = trace.get_tracer("articube")
+
+span_duration = metrics.histogram(
+    "span_duration_seconds", "Duration of traced operations", ("span", "status")
+)
+mongo_command_duration = metrics.histogram(
+    "mongo_command_duration_seconds", "Duration of MongoDB commands", ("command", "collection", "status")
+)
+
+
+def span_to_dict(span: ReadableSpan) -> Dict[str, Any]:
+    """A compact, OpenTelemetry-shaped JSON record of a finished span"""
+    context = span.get_span_context()
+    return {
+        "name": span.name,
+        "trace_id": format(context.trace_id, "032x"),
+        "span_id": format(context.span_id, "016x"),
+        "parent_span_id": format(span.parent.span_id, "016x") if span.parent else None,
+        "start_time_unix_nano": span.start_time,
+        "end_time_unix_nano": span.end_time,
+        "duration_ms": round((span.end_time - span.start_time) / 1e6, 3) if span.end_time else None,
+        "status": span.status.status_code.name,
+        "attributes": dict(span.attributes or {})
+    }
+
+
+class JsonSpanExporter(SpanExporter):
+    """
+    Exports spans as JSON lines to the application log or to a file
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: File the spans are appended to, None logs them instead
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = [json.dumps(span_to_dict(span), default=str) for span in spans]
+        try:
+            if self.path:
+                with self._lock, open(self.path, "a", encoding="utf-8") as trace_file:
+                    trace_file.write("\n".join(lines) + "\n")
+            else:
+                for line in lines:
+                    logger.bind(span=True).info(line)
+        except OSError as e:
+            logger.warning(f"Failed to export {len(lines)} spans: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+class MetricsSpanProcessor(SpanProcessor):
+    """
+    Times every finished span into the span_duration_seconds histogram
+    """
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if span.end_time is None or span.start_time is None:
+            return
+        failed = span.status.status_code == trace.StatusCode.ERROR
+        span_duration.observe((span.end_time - span.start_time) / 1e9, span=span.name, status="error" if failed else "ok")
+
+
+def setup_tracing() -> Optional[TracerProvider]:
+    """
+    Install the tracer provider, once per process
+
+    Returns:
+        The installed provider, or None when tracing is disabled or another
+        provider was installed first
+    """
+    if not settings.TRACING_ENABLED:
+        return None
+    current = trace.get_tracer_provider()
+    if isinstance(current, TracerProvider):
+        return None
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "articube-api"}))
+    provider.add_span_processor(MetricsSpanProcessor())
+    exporter: Optional[SpanExporter] = None
+    if settings.TRACING_EXPORTER == "log":
+        exporter = JsonSpanExporter()
+    elif settings.TRACING_EXPORTER == "file":
+        exporter = JsonSpanExporter(settings.TRACING_FILE_PATH)
+    elif settings.TRACING_EXPORTER == "console":
+        exporter = ConsoleSpanExporter()
+    if exporter is not None:
+        provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info(f"Tracing enabled, exporter: {settings.TRACING_EXPORTER or 'metrics only'}")
+    return provider
+
+
+def shutdown_tracing() -> None:
+    """Flush the spans still waiting to be exported"""
+    provider = trace.get_tracer_provider()
+    if isinstance(provider, TracerProvider):
+        provider.shutdown()
+
+
+def traced(name: str) -> Callable:
+    """
+    Decorator running a function, sync or async, inside a span
+
+    Args:
+        name: Span name
+    """
+    def decorate(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.start_as_current_span(name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with tracer.start_as_current_span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class RequestTracingMiddleware:
+    """
+    Runs each HTTP request inside a server span and times it by route
+
+    The span and the request timing end when the last body message is sent, so
+    a streamed response is timed to its end rather than to its headers.
+    """
+
+    def __init__(self, app: ASGIApp, duration: Optional[Histogram] = None):
+        """
+        Args:
+            app: The wrapped ASGI application
+            duration: Histogram the request durations are observed into, by
+                method, route and status
+        """
+        self.app = app
+        self.duration = duration
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        current_request_id = request_id.get()
+        span = tracer.start_span(f"{method} {scope['path']}", kind=trace.SpanKind.SERVER)
+        started_at = time.perf_counter()
+        status_code = 500
+        finished = False
+
+        def finish() -> None:
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            # Name the span by route template so that ids don't make every request unique
+            route_path = getattr(scope.get("route"), "path", "unmatched")
+            span.update_name(f"{method} {route_path}")
+            span.set_attribute("http.method", method)
+            span.set_attribute("http.route", route_path)
+            span.set_attribute("http.status_code", status_code)
+            span.set_attribute("http.request_id", current_request_id)
+            if status_code >= 500:
+                span.set_status(trace.Status(trace.StatusCode.ERROR))
+            span.end()
+            if self.duration is not None:
+                self.duration.observe(
+                    time.perf_counter() - started_at,
+                    method=method, route=route_path, status=str(status_code)
+                )
+
+        async def send_and_time(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        with trace.use_span(span, end_on_exit=False):
+            try:
+                await self.app(scope, receive, send_and_time)
+            finally:
+                # The app failed or the client went away before the response ended
+                finish()
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    Times every MongoDB command and records it as a span
+
+    Motor runs commands on its own threads, so these spans are roots of their
+    own traces rather than children of the request that issued them.
+    """
+
+    def __init__(self):
+        self._started: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        collection = event.command.get(event.command_name)
+        collection = collection if isinstance(collection, str) else ""
+        with self._lock:
+            self._started[event.request_id] = (time.time_ns(), collection)
+
+    def _finish(self, event, status: str) -> None:
+        with self._lock:
+            started = self._started.pop(event.request_id, None)
+        if started is None:
+            return
+        start_ns, collection = started
+        seconds = event.duration_micros / 1e6
+        mongo_command_duration.observe(seconds, command=event.command_name, collection=collection, status=status)
+
+        span = tracer.start_span(
+            f"mongo {event.command_name}",
+            kind=trace.SpanKind.CLIENT,
+            start_time=start_ns,
+            attributes={
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection
+            }
+        )
+        if status == "error":
+            span.set_status(trace.Status(trace.StatusCode.ERROR, str(getattr(event, "failure", ""))[:200]))
+        span.end(end_time=start_ns + event.duration_micros * 1000)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finish(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finish(event, "error")
+
+
+mongo_command_listener = MongoCommandListener()
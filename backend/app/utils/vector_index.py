@@ -0,0 +1,273 @@
+"""
+CPU-only text embeddings and a memory-mapped IVF-flat vector index.
+
+HashingEmbedder maps words and word pairs onto a fixed number of dimensions
+with a stable hash. It needs no model download or GPU, and embeds thousands
+of passages per second. It captures topical overlap rather than meaning,
+which is what recognizing a recurring subject needs.
+
+IvfFlatIndex stores unit vectors in a float32 matrix, memory-mapped from a
+file when a directory is given. Vectors are partitioned around k-means
+centroids, and a search only scores the vectors of the nprobe partitions
+closest to the query. Below min_train_size vectors every vector is scored;
+partitions are retrained whenever the index has doubled since the last
+training. Training runs outside the index lock, so searches and additions
+carry on against the previous partitions while it runs.
+"""
+from typing import Dict, List, Optional, Tuple
+import json
+import math
+import os
+import threading
+import zlib
+
+import numpy as np
+
+from app.utils.bm25 import tokenize
+
+# Vectors sampled to train the partitions
+TRAIN_SAMPLE_SIZE = 20000
+
+# Vectors assigned to the new partitions per hold of the index lock
+ASSIGN_CHUNK_SIZE = 8192
+
+
+class HashingEmbedder:
+    """
+    Embeds text by hashing its words and adjacent word pairs
+    """
+
+    def __init__(self, dim: int = 256):
+        """
+        Args:
+            dim: Number of dimensions of the embeddings
+        """
+        self.dim = dim
+
+    def embed(self, text: str) -> np.ndarray:
+        """A unit float32 vector, all zeros for text without words"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = tokenize(text)
+        features = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+        counts: Dict[str, int] = {}
+        for feature in features:
+            counts[feature] = counts.get(feature, 0) + 1
+        for feature, count in counts.items():
+            hashed = zlib.crc32(feature.encode("utf-8"))
+            # The top bit picks the sign so that colliding features tend to cancel out
+            sign = 1.0 if hashed & 0x80000000 else -1.0
+            vector[hashed % self.dim] += sign * (1.0 + math.log(count))
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else vector
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def train_centroids(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means over unit vectors
+
+    Returns:
+        nlist unit centroids
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Reseed empty partitions with random vectors
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = _normalize_rows(sums)
+    return centroids.astype(np.float32)
+
+
+class IvfFlatIndex:
+    """
+    Inverted-file index of unit vectors, optionally backed by memory-mapped files
+    """
+
+    def __init__(
+        self,
+        dim: int,
+        path: Optional[str] = None,
+        nprobe: int = 8,
+        min_train_size: int = 1024,
+        initial_capacity: int = 1024
+    ):
+        """
+        Args:
+            dim: Vector dimensions
+            path: Directory holding the index files, None keeps the index in memory.
+                A directory must not be shared by several processes.
+            nprobe: Partitions searched per query
+            min_train_size: Vectors needed before the index is partitioned
+            initial_capacity: Rows allocated up front, doubled when full
+        """
+        self.dim = dim
+        self.path = path
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.count = 0
+        self._trained_at = 0  # Vector count at the last training
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._lock = threading.RLock()
+        self._training = False
+
+        if path:
+            os.makedirs(path, exist_ok=True)
+        if path and os.path.exists(self._file("meta.json")):
+            self._load()
+        else:
+            self._vectors = self._allocate(initial_capacity)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _allocate(self, capacity: int) -> np.ndarray:
+        if not self.path:
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+        return np.lib.format.open_memmap(self._file("vectors.npy"), mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+
+    def _load(self) -> None:
+        with open(self._file("meta.json"), encoding="utf-8") as meta_file:
+            meta = json.load(meta_file)
+        if meta["dim"] != self.dim:
+            raise ValueError(f"Index at {self.path} has {meta['dim']} dimensions, expected {self.dim}")
+        self.count = meta["count"]
+        self._trained_at = meta["trained_at"]
+        self._vectors = np.load(self._file("vectors.npy"), mmap_mode="r+")
+        if os.path.exists(self._file("centroids.npy")):
+            self._centroids = np.load(self._file("centroids.npy"))
+            self._assign_lists(0)
+
+    def _grow(self) -> None:
+        old = self._vectors
+        capacity = len(old) * 2
+        if self.path:
+            # Copy the vectors out and unmap the file before rewriting it at double the size
+            data = np.array(old[:self.count])
+            self._vectors = old = None
+            self._vectors = self._allocate(capacity)
+            self._vectors[:len(data)] = data
+        else:
+            self._vectors = self._allocate(capacity)
+            self._vectors[:self.count] = old[:self.count]
+
+    def _assign_lists(self, start: int) -> None:
+        """Put the vectors from start onwards in the partition of their nearest centroid"""
+        if start == 0:
+            self._lists = [[] for _ in range(len(self._centroids))]
+        if start >= self.count:
+            return
+        assignments = np.argmax(self._vectors[start:self.count] @ self._centroids.T, axis=1)
+        for offset, partition in enumerate(assignments):
+            self._lists[int(partition)].append(start + offset)
+
+    def _train(self) -> None:
+        """
+        Partition the vectors around new centroids
+
+        Only copying the training sample and assigning each chunk of vectors
+        hold the lock. Vectors added meanwhile go to the previous partitions,
+        and are assigned to the new ones before they replace them.
+        """
+        try:
+            with self._lock:
+                trained_at = self.count
+                if trained_at > TRAIN_SAMPLE_SIZE:
+                    rows = np.sort(np.random.default_rng(0).choice(trained_at, size=TRAIN_SAMPLE_SIZE, replace=False))
+                    sample = self._vectors[rows]
+                else:
+                    sample = np.array(self._vectors[:trained_at])
+            nlist = int(min(1024, len(sample), max(16, math.sqrt(trained_at))))
+            centroids = train_centroids(sample, nlist)
+
+            lists: List[List[int]] = [[] for _ in range(nlist)]
+            assigned = 0
+            while True:
+                with self._lock:
+                    if assigned >= self.count:
+                        self._centroids = centroids
+                        self._lists = lists
+                        self._trained_at = trained_at
+                        if self.path:
+                            np.save(self._file("centroids.npy"), centroids)
+                        return
+                    end = min(self.count, assigned + ASSIGN_CHUNK_SIZE)
+                    assignments = np.argmax(self._vectors[assigned:end] @ centroids.T, axis=1)
+                for offset, partition in enumerate(assignments):
+                    lists[int(partition)].append(assigned + offset)
+                assigned = end
+        finally:
+            self._training = False
+
+    def add(self, vectors: np.ndarray) -> List[int]:
+        """
+        Add unit vectors
+
+        Returns:
+            Row numbers of the added vectors, in order
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            while self.count + len(vectors) > len(self._vectors):
+                self._grow()
+            start = self.count
+            self._vectors[start:start + len(vectors)] = vectors
+            self.count += len(vectors)
+            rows = list(range(start, self.count))
+
+            train = not self._training and self.count >= self.min_train_size and self.count >= 2 * self._trained_at
+            if train:
+                self._training = True
+            if self._centroids is not None:
+                self._assign_lists(start)
+        if train:
+            self._train()
+        return rows
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """
+        The k vectors most similar to a unit query vector
+
+        Returns:
+            (row, cosine similarity) pairs, most similar first
+        """
+        with self._lock:
+            if self.count == 0:
+                return []
+            if self._centroids is None:
+                rows = np.arange(self.count)
+                scores = self._vectors[:self.count] @ query
+            else:
+                probe = np.argsort(self._centroids @ query)[::-1][:self.nprobe]
+                rows = np.fromiter((row for partition in probe for row in self._lists[partition]), dtype=np.int64)
+                if len(rows) == 0:
+                    return []
+                scores = self._vectors[rows] @ query
+        best = np.argsort(scores)[::-1][:k]
+        return [(int(rows[index]), float(scores[index])) for index in best]
+
+    def flush(self) -> None:
+        """Write the vectors and the index metadata to disk"""
+        if not self.path:
+            return
+        with self._lock:
+            self._vectors.flush()
+            with open(self._file("meta.json"), "w", encoding="utf-8") as meta_file:
+                json.dump({"dim": self.dim, "count": self.count, "trained_at": self._trained_at}, meta_file)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "vectors": self.count,
+            "capacity": len(self._vectors),
+            "partitions": len(self._lists),
+            "memory_mapped": bool(self.path)
+        }
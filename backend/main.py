@@ -1,30 +1,49 @@
 """
 Main FastAPI application file for ArtiCube backend.
 """
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 # Import the new router implementation
 from app.api.routers.agent_router import router as agent_router
 from app.api.routers.content_router import router as content_router
 from app.api.routers.user_router import router as user_router
-from app.db.mongodb import connect_to_mongo, close_mongo_connection
+from app.api.routers.diagnostics_router import router as diagnostics_router
+from app.api.routers.search_router import router as search_router
+from app.api.routers.transfer_router import router as transfer_router
+from app.agents.knowledge_agent import research_backend, runner_pool
+from app.agents.retrieval import past_answers
+from app.auth.hashing import password_hasher
+from app.auth.user_cache import user_cache
+from app.db.mongodb import connect_to_mongo, close_mongo_connection, get_database
+from app.db.migrations import run_migrations
+from app.db.history import history_retention
+from app.db.write_behind import history_writer
+from app.utils.pagination import NEXT_CURSOR_HEADER
 from app.utils.config import settings
+from app.utils.metrics import metrics
+from app.utils.tracing import RequestTracingMiddleware, setup_tracing, shutdown_tracing
+from app.utils.log import REQUEST_ID_HEADER, RequestIdMiddleware, flush_logging, setup_logging
 from contextlib import asynccontextmanager
-import logging
+from loguru import logger
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+setup_logging()
+
+# Time requests, pipeline phases, model calls and MongoDB commands
+setup_tracing()
+
+http_request_duration = metrics.histogram(
+    "http_request_duration_seconds", "Duration of HTTP requests", ("method", "route", "status")
 )
-logger = logging.getLogger("articube")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
     Lifecycle events for the FastAPI app
     - Connect to MongoDB on startup
+    - Build and warm up the agent runner pool on startup
     - Close MongoDB connection on shutdown
     """
     logger.info("Starting ArtiCube API")
@@ -32,12 +51,51 @@ async def lifespan(app: FastAPI):
     await connect_to_mongo()
     logger.info("Connected to MongoDB")
     
+    # Create the indexes the routers rely on
+    try:
+        await run_migrations(get_database())
+    except Exception as e:
+        logger.warning(f"Could not run database migrations: {e}")
+    
+    # Compact and expire old query history in the background
+    await history_retention.start(get_database())
+    
+    # Write query history in batches instead of on every response
+    history_writer.start()
+    
+    # Index past answers for retrieval when the index is empty
+    if settings.RAG_ENABLED:
+        await past_answers.start(get_database(), settings.RAG_BOOTSTRAP_LIMIT)
+    
+    # Build the agent runners once instead of on every query
+    await runner_pool.start()
+    
+    # Let other workers' user updates invalidate this worker's user cache
+    if settings.USER_CACHE_WATCH_CHANGES:
+        user_cache.start_watching(get_database().users)
+    
     yield
     
+    await history_retention.stop()
+    await user_cache.stop_watching()
+    await runner_pool.close()
+    await research_backend.close()
+    await past_answers.close()
+    password_hasher.close()
+    
+    # Write the queued history entries before the connection closes
+    await history_writer.close()
+    
     # Close MongoDB connection on shutdown
     await close_mongo_connection()
     logger.info("Closed MongoDB connection")
+    
+    # Export the spans still waiting in the batch processor
+    shutdown_tracing()
     logger.info("ArtiCube API shutdown complete")
+    
+    # Write the log records still queued for the sink
+    await flush_logging()
 
 # Create FastAPI app
 app = FastAPI(
@@ -54,12 +112,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, REQUEST_ID_HEADER],
 )
 
+# Time requests by route, ending when the last body chunk is sent
+app.add_middleware(RequestTracingMiddleware, duration=http_request_duration)
+
+# Added last so it runs first, and the tracing span sees the request id
+app.add_middleware(RequestIdMiddleware)
+
 # Mount routers
 app.include_router(agent_router, prefix="/api/agent", tags=["Agent"])
 app.include_router(user_router, prefix="/api/users", tags=["Users"])
 app.include_router(content_router, prefix="/api/content", tags=["Content"])
+app.include_router(search_router, prefix="/api/search", tags=["Search"])
+app.include_router(transfer_router, prefix="/api/transfer", tags=["Transfer"])
+app.include_router(diagnostics_router, prefix="/api/diagnostics", tags=["Diagnostics"])
 
 @app.get("/", tags=["Health"])
 async def root():
@@ -85,3 +153,12 @@ async def api_health_check():
     API v1 health check endpoint for deployment health checks.
     """
     return {"status": "ok", "message": "ArtiCube API v1 is running"}
+
+@app.get("/api/v1/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Request, pipeline phase, model call and MongoDB timings in the Prometheus text format
+    """
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,205 @@
+"""
+In-memory stand-in for the few motor collection methods the tests exercise
+"""
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+DUPLICATE_KEY = 11000
+
+
+def matches(document: Dict[str, Any], query: Dict[str, Any]) -> bool:
+    """Equality, $lt, $gt, $in, $exists and $or filters"""
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(document, branch) for branch in condition):
+                return False
+            continue
+        value = document.get(field)
+        if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+            for operator, operand in condition.items():
+                if operator == "$lt" and not (value is not None and value < operand):
+                    return False
+                if operator == "$gt" and not (value is not None and value > operand):
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$exists" and (field in document) != operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(document: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    if not projection:
+        return dict(document)
+    if all(not include for include in projection.values()):
+        return {key: value for key, value in document.items() if key not in projection}
+    return {key: value for key, value in document.items() if key == "_id" or projection.get(key)}
+
+
+class FakeCursor:
+    def __init__(self, documents: List[Dict[str, Any]]):
+        self._documents = documents
+
+    def sort(self, keys, direction: Optional[int] = None) -> "FakeCursor":
+        if isinstance(keys, str):
+            keys = [(keys, direction or 1)]
+        # Sort on the last key first, each sort keeping the order of equal documents
+        for field, order in reversed(keys):
+            self._documents.sort(key=lambda document: document.get(field), reverse=order < 0)
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        self._documents = self._documents[:count]
+        return self
+
+    def batch_size(self, size: int) -> "FakeCursor":
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._documents[:length] if length else list(self._documents)
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._documents:
+            yield document
+
+
+def index_name(keys) -> str:
+    return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+
+class FakeCollection:
+    def __init__(self, name: str = "collection"):
+        self.name = name
+        self.documents: List[Dict[str, Any]] = []
+        self.indexes: Dict[str, Dict[str, Any]] = {"_id_": {"key": [("_id", 1)]}}
+
+    def find(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, int]] = None) -> FakeCursor:
+        return FakeCursor([project(document, projection) for document in self.documents if matches(document, query or {})])
+
+    async def find_one(self, query: Optional[Dict[str, Any]] = None, projection: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        for document in self.documents:
+            if matches(document, query or {}):
+                return project(document, projection)
+        return None
+
+    async def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True) -> SimpleNamespace:
+        ids = {document["_id"] for document in self.documents}
+        inserted, errors = [], []
+        for index, document in enumerate(documents):
+            document.setdefault("_id", ObjectId())
+            if document["_id"] in ids:
+                errors.append({"index": index, "code": DUPLICATE_KEY, "errmsg": "E11000 duplicate key error"})
+                if ordered:
+                    break
+                continue
+            ids.add(document["_id"])
+            self.documents.append(document)
+            inserted.append(document["_id"])
+        if errors:
+            raise BulkWriteError({"nInserted": len(inserted), "writeErrors": errors})
+        return SimpleNamespace(inserted_ids=inserted)
+
+
+    async def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> SimpleNamespace:
+        """$set, and $setOnInsert when upserting"""
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update.get("$set", {}))
+                return SimpleNamespace(matched_count=1, upserted_id=None)
+        if not upsert:
+            return SimpleNamespace(matched_count=0, upserted_id=None)
+        document = {**query, **update.get("$set", {}), **update.get("$setOnInsert", {})}
+        document.setdefault("_id", ObjectId())
+        self.documents.append(document)
+        return SimpleNamespace(matched_count=0, upserted_id=document["_id"])
+
+    def aggregate(self, pipeline: List[Dict[str, Any]]) -> FakeCursor:
+        """$match, $limit, and $group by a field with $sum accumulators"""
+        documents = [dict(document) for document in self.documents]
+        for stage in pipeline:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                documents = [document for document in documents if matches(document, spec)]
+            elif operator == "$limit":
+                documents = documents[:spec]
+            elif operator == "$group":
+                groups: Dict[Any, Dict[str, Any]] = {}
+                for document in documents:
+                    key = document.get(spec["_id"].lstrip("$"))
+                    group = groups.setdefault(key, {"_id": key})
+                    for field, accumulator in spec.items():
+                        if field != "_id":
+                            group[field] = group.get(field, 0) + accumulator["$sum"]
+                documents = list(groups.values())
+            else:
+                raise NotImplementedError(operator)
+        return FakeCursor(documents)
+
+    async def bulk_write(self, requests: List[UpdateOne], ordered: bool = True) -> SimpleNamespace:
+        """UpdateOne requests with $set and $unset"""
+        modified = 0
+        for request in requests:
+            for document in self.documents:
+                if matches(document, request._filter):
+                    document.update(request._doc.get("$set", {}))
+                    for field in request._doc.get("$unset", {}):
+                        document.pop(field, None)
+                    modified += 1
+                    break
+        return SimpleNamespace(modified_count=modified)
+
+    async def index_information(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(info) for name, info in self.indexes.items()}
+
+    async def create_index(self, keys, name: Optional[str] = None, **options) -> str:
+        keys = [(keys, 1)] if isinstance(keys, str) else list(keys)
+        name = name or index_name(keys)
+        existing = self.indexes.get(name)
+        if existing is not None:
+            if existing != {"key": keys, **options}:
+                raise OperationFailure(f"An index named {name} exists with different options", code=85)
+            return name
+        if options.get("unique"):
+            seen = set()
+            for document in self.documents:
+                value = tuple(document.get(field) for field, _ in keys)
+                if value in seen:
+                    raise DuplicateKeyError(f"E11000 duplicate key error index: {name} dup key: {value}", code=11000)
+                seen.add(value)
+        self.indexes[name] = {"key": keys, **options}
+        return name
+
+    async def drop_index(self, name: str) -> None:
+        if self.indexes.pop(name, None) is None:
+            raise OperationFailure(f"index not found with name [{name}]", code=27)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self._collections: Dict[str, FakeCollection] = {}
+        self.commands: List[tuple] = []
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        return self._collections.setdefault(name, FakeCollection(name))
+
+    async def command(self, name: str, collection: str, **options) -> Dict[str, Any]:
+        """collMod changing an index's expireAfterSeconds"""
+        self.commands.append((name, collection, options))
+        if name == "collMod" and "index" in options:
+            index = options["index"]
+            self[collection].indexes[index["name"]]["expireAfterSeconds"] = index["expireAfterSeconds"]
+        return {"ok": 1}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
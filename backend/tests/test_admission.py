@@ -0,0 +1,102 @@
+"""
+Tests for admission control of agent pipeline runs
+"""
+import asyncio
+
+import pytest
+
+from app.utils.admission import AdmissionController, AdmissionRejected
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_runs_up_to_the_caps_then_queues():
+    controller = AdmissionController(max_concurrent=2, max_per_user=1)
+    await controller.acquire("alice")
+    await controller.acquire("bob")
+
+    waiting = asyncio.create_task(controller.acquire("carol"))
+    await asyncio.sleep(0)
+    assert controller.stats()["queued"] == 1
+
+    controller.release("alice")
+    await waiting
+    assert controller.stats()["running"] == 2
+
+
+async def test_per_user_cap_leaves_room_for_other_users():
+    controller = AdmissionController(max_concurrent=4, max_per_user=1)
+    await controller.acquire("alice")
+
+    second = asyncio.create_task(controller.acquire("alice"))
+    await controller.acquire("bob")
+    await asyncio.sleep(0)
+    assert not second.done()
+
+    controller.release("alice")
+    await second
+
+
+async def test_waiting_users_are_served_round_robin():
+    controller = AdmissionController(max_concurrent=1, max_per_user=1, max_queue_per_user=4)
+    await controller.acquire("holder")
+    order = []
+
+    async def run(user_id):
+        await controller.acquire(user_id)
+        order.append(user_id)
+        controller.release(user_id)
+
+    tasks = [asyncio.create_task(run(user_id)) for user_id in ("alice", "alice", "alice", "bob")]
+    await asyncio.sleep(0)
+    controller.release("holder")
+    await asyncio.gather(*tasks)
+
+    assert order == ["alice", "bob", "alice", "alice"]
+
+
+async def test_full_user_queue_is_rejected_with_429():
+    controller = AdmissionController(max_concurrent=4, max_per_user=1, max_queue_per_user=0)
+    await controller.acquire("alice")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire("alice")
+
+    assert (rejected.value.reason, rejected.value.status_code) == ("user_queue_full", 429)
+    assert rejected.value.retry_after >= 1
+
+
+async def test_queue_timeout_is_rejected_with_503():
+    controller = AdmissionController(max_concurrent=1, queue_timeout=0.01)
+    await controller.acquire("alice")
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await controller.acquire("bob")
+
+    assert (rejected.value.reason, rejected.value.status_code) == ("queue_timeout", 503)
+    assert controller.stats()["queued"] == 0
+
+
+async def test_slot_releases_on_error():
+    controller = AdmissionController(max_concurrent=1)
+
+    with pytest.raises(RuntimeError):
+        async with controller.slot("alice"):
+            raise RuntimeError("pipeline failed")
+
+    assert controller.stats()["running"] == 0
+
+
+async def test_cancelled_waiter_leaves_the_queue():
+    controller = AdmissionController(max_concurrent=1)
+    await controller.acquire("alice")
+    waiting = asyncio.create_task(controller.acquire("bob"))
+    await asyncio.sleep(0)
+
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+    controller.release("alice")
+
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["running"] == 0
@@ -0,0 +1,119 @@
+"""
+Tests for the server-sent events stream of /api/agent/query/stream
+"""
+import importlib
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.agents.resilient_llm import CircuitOpenError
+from app.api.models.user import UserInDB
+from app.auth.jwt import get_current_active_user
+from app.utils.admission import AdmissionRejected
+
+# app.api.routers re-exports the routers under the module names
+agent_router = importlib.import_module("app.api.routers.agent_router")
+USER = UserInDB(email="alice@example.com", username="alice", hashed_password="hash")
+
+
+def parse_sse(body: str):
+    """Split an event stream into (event, data) pairs"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Replace the pipeline with scripted events, and record what is saved to history"""
+    state = {"events": [], "error": None, "closed": False, "saved": []}
+
+    async def stream_information(query, user_id=None, use_cache=True, research=False):
+        try:
+            for event in state["events"]:
+                yield event
+            if state["error"] is not None:
+                raise state["error"]
+        finally:
+            state["closed"] = True
+
+    async def save_query_to_history(user_id, query, response):
+        state["saved"].append((user_id, query, response["response"]))
+
+    monkeypatch.setattr(agent_router, "stream_information", stream_information)
+    monkeypatch.setattr(agent_router, "save_query_to_history", save_query_to_history)
+    return state
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(agent_router.router, prefix="/api/agent")
+    app.dependency_overrides[get_current_active_user] = lambda: USER
+    return TestClient(app)
+
+
+def final_event(response="Tides are caused by the moon."):
+    return {"event": "final", "data": {"response": response, "sources": [], "metadata": {"cache": {"hit": False}}}}
+
+
+def test_streams_progress_then_the_final_answer(pipeline, client):
+    pipeline["events"] = [
+        {"event": "phase", "data": {"phase": "searching"}},
+        {"event": "sources", "data": {"sources": [{"title": "Tides", "link": "https://www.nasa.gov/tides"}]}},
+        final_event()
+    ]
+
+    response = client.post("/api/agent/query/stream", json={"query": "tides"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    events = parse_sse(response.text)
+    assert [name for name, _ in events] == ["phase", "sources", "final"]
+    assert events[-1][1] == {"response": "Tides are caused by the moon.", "sources": [], "metadata": {"cache": {"hit": False}}}
+    assert pipeline["saved"] == [(USER.id, "tides", "Tides are caused by the moon.")]
+
+
+def test_history_is_skipped_when_not_requested(pipeline, client):
+    pipeline["events"] = [final_event()]
+
+    client.post("/api/agent/query/stream?save_to_history=false", json={"query": "tides"})
+
+    assert pipeline["saved"] == []
+
+
+@pytest.mark.parametrize("error, expected", [
+    (AdmissionRejected("user_queue_full", 429, 2), {"status": 429, "retry_after": 2}),
+    (CircuitOpenError("finder_agent", 12.4), {"status": 503, "retry_after": 12}),
+    (RuntimeError("boom"), {"detail": "Agent error: boom"})
+])
+def test_failures_end_the_stream_with_an_error_event(pipeline, client, error, expected):
+    pipeline["events"] = [{"event": "phase", "data": {"phase": "searching"}}]
+    pipeline["error"] = error
+
+    events = parse_sse(client.post("/api/agent/query/stream", json={"query": "tides"}).text)
+
+    assert [name for name, _ in events] == ["phase", "error"]
+    assert expected.items() <= events[-1][1].items()
+    assert pipeline["saved"] == []
+
+
+@pytest.mark.anyio
+async def test_client_disconnect_closes_the_pipeline(pipeline):
+    pipeline["events"] = [{"event": "phase", "data": {"phase": "searching"}}, final_event()]
+
+    class DisconnectedRequest:
+        async def is_disconnected(self):
+            return True
+
+    response = await agent_router.stream_query_agent(DisconnectedRequest(), agent_router.QueryInput(query="tides"), True, True, USER)
+    chunks = [chunk async for chunk in response.body_iterator]
+
+    assert chunks == []
+    assert pipeline["closed"] is True
+    assert pipeline["saved"] == []
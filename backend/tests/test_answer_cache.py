@@ -0,0 +1,171 @@
+"""
+Tests for the answer cache's in-process and shared MongoDB tiers
+"""
+import time
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from app.utils.answer_cache import CACHE_TTL_INDEX_NAME, AnswerCache, CacheEntry, cache_key
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.commands = []
+
+    async def command(self, name, collection, **options):
+        self.commands.append((name, collection, options))
+
+
+class FakeCollection:
+    """The few collection methods the shared tier uses"""
+
+    name = "answer_cache"
+
+    def __init__(self, indexes=None, fail_index_setup=False, documents=None):
+        self.database = FakeDatabase()
+        self.indexes = indexes or {}
+        self.fail_index_setup = fail_index_setup
+        self.documents = documents or {}
+
+    async def index_information(self):
+        if self.fail_index_setup:
+            raise OperationFailure("index setup failed")
+        return self.indexes
+
+    async def create_index(self, key, name, expireAfterSeconds):
+        self.indexes[name] = {"key": [(key, 1)], "expireAfterSeconds": expireAfterSeconds}
+
+    async def replace_one(self, query, document, upsert=False):
+        self.documents[query["_id"]] = document
+
+    async def find_one(self, query):
+        document = self.documents.get(query["_id"])
+        return dict(document, _id=query["_id"]) if document else None
+
+
+def entry(key="tides"):
+    return CacheEntry(key=key, query=key, response="answer", sources=[], created_at=0.0)
+
+
+async def test_creates_the_ttl_index():
+    collection = FakeCollection()
+    await AnswerCache(ttl_seconds=600)._write_shared(collection, entry())
+
+    assert collection.indexes[CACHE_TTL_INDEX_NAME]["expireAfterSeconds"] == 600
+    assert "tides" in collection.documents
+
+
+async def test_changed_ttl_is_applied_with_coll_mod():
+    collection = FakeCollection({CACHE_TTL_INDEX_NAME: {"key": [("created_at", 1)], "expireAfterSeconds": 3600}})
+    cache = AnswerCache(ttl_seconds=600)
+    await cache._write_shared(collection, entry("first"))
+    await cache._write_shared(collection, entry("second"))
+
+    assert collection.database.commands == [
+        ("collMod", "answer_cache", {"index": {"name": CACHE_TTL_INDEX_NAME, "expireAfterSeconds": 600}})
+    ]
+    assert set(collection.documents) == {"first", "second"}
+
+
+async def test_ttl_index_keeps_entries_for_stale_serving():
+    collection = FakeCollection({CACHE_TTL_INDEX_NAME: {"key": [("created_at", 1)], "expireAfterSeconds": 600}})
+    await AnswerCache(ttl_seconds=600, max_stale_seconds=3000)._write_shared(collection, entry())
+
+    assert collection.database.commands == [
+        ("collMod", "answer_cache", {"index": {"name": CACHE_TTL_INDEX_NAME, "expireAfterSeconds": 3600}})
+    ]
+
+
+async def test_expired_shared_entry_is_only_served_stale(monkeypatch):
+    writer = AnswerCache(ttl_seconds=600, max_stale_seconds=3000, persist=False)
+    collection = FakeCollection()
+    written = CacheEntry(key=cache_key("tides"), query="tides", response="answer", sources=[], created_at=time.time() - 1200)
+    await writer._write_shared(collection, written)
+
+    # Another worker, which never had the entry in process
+    reader = AnswerCache(ttl_seconds=600, max_stale_seconds=3000)
+    monkeypatch.setattr(reader, "_get_collection", lambda: collection)
+
+    assert await reader.get("tides") is None
+    stale = await reader.get("tides", allow_stale=True)
+    assert stale["response"] == "answer"
+    assert stale["metadata"]["cache"]["tier"] == "mongo"
+    assert stale["metadata"]["cache"]["stale"] is True
+
+
+async def test_entries_are_written_when_index_setup_fails():
+    collection = FakeCollection(fail_index_setup=True)
+    await AnswerCache()._write_shared(collection, entry())
+
+    assert "tides" in collection.documents
+
+
+def memory_cache(**options):
+    return AnswerCache(persist=False, **options)
+
+
+def result(response="answer"):
+    return {"response": response, "sources": [{"title": "Tides", "source": "NASA", "link": "https://www.nasa.gov/tides", "year": "2021"}]}
+
+
+async def test_rephrased_query_hits_the_memory_tier():
+    cache = memory_cache()
+    await cache.set("How do tides work?", result())
+
+    hit = await cache.get("  how do TIDES work ")
+
+    assert hit["response"] == "answer"
+    assert hit["sources"][0]["link"] == "https://www.nasa.gov/tides"
+    assert hit["metadata"]["cache"]["tier"] == "memory"
+    assert await cache.get("how do tides work", namespace="research") is None
+
+
+async def test_least_recently_used_entry_is_evicted():
+    cache = memory_cache(max_entries=2)
+    await cache.set("first", result())
+    await cache.set("second", result())
+    await cache.get("first")
+    await cache.set("third", result())
+
+    assert await cache.get("second") is None
+    assert await cache.get("first") is not None
+    assert cache.stats()["entries"] == 2
+
+
+async def test_expired_entry_is_only_served_stale(monkeypatch):
+    cache = memory_cache(ttl_seconds=10, max_stale_seconds=100)
+    await cache.set("tides", result())
+    now = time.time()
+
+    monkeypatch.setattr(time, "time", lambda: now + 50)
+    assert await cache.get("tides") is None
+    stale = await cache.get("tides", allow_stale=True)
+    assert stale["metadata"]["cache"]["stale"] is True
+
+    monkeypatch.setattr(time, "time", lambda: now + 200)
+    assert await cache.get("tides", allow_stale=True) is None
+    assert cache.stats()["entries"] == 0
+
+
+async def test_similar_query_hits_above_the_threshold_only():
+    cache = memory_cache(similarity_threshold=0.8)
+    await cache.set("how do ocean tides work", result())
+
+    hit = await cache.get("how do the ocean tides work")
+    assert hit["metadata"]["cache"]["tier"] == "semantic"
+    assert hit["metadata"]["cache"]["matched_query"] == "how do ocean tides work"
+    assert hit["metadata"]["cache"]["similarity"] >= 0.8
+
+    assert await cache.get("how do volcanoes work") is None
+
+
+async def test_invalidate_removes_the_answer():
+    cache = memory_cache()
+    await cache.set("tides", result())
+
+    await cache.invalidate("tides")
+
+    assert await cache.get("tides") is None
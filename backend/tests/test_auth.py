@@ -0,0 +1,171 @@
+"""
+Tests for the user cache and the authentication dependencies
+"""
+import asyncio
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import app.db.mongodb as mongodb
+from app.api.models.user import UserInDB
+from app.api.routers.agent_router import router as agent_router
+from app.auth import jwt
+from app.auth.user_cache import UserCache
+from tests.fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+
+def make_user(**fields):
+    return UserInDB(email="alice@example.com", username="alice", hashed_password="hash", **fields)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(mongodb, "mongodb_database", database)
+    monkeypatch.setattr(jwt, "user_cache", UserCache(ttl_seconds=60))
+    return database
+
+
+def store(database, user):
+    document = user.model_dump(by_alias=True)
+    document["_id"] = ObjectId(user.id)
+    database.users.documents.append(document)
+
+
+class ChangeStream:
+    def __init__(self, changes):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for change in self.changes:
+            yield change
+
+
+class WatchedCollection:
+    def __init__(self, changes):
+        self.changes = changes
+
+    def watch(self, pipeline):
+        return ChangeStream(self.changes)
+
+
+async def test_user_cache_returns_copies():
+    cache = UserCache()
+    user = make_user()
+    cache.set(user)
+
+    cached = cache.get(user.id)
+    cached.is_active = False
+
+    assert cache.get(user.id).is_active
+
+
+async def test_user_cache_invalidate_and_expiry(monkeypatch):
+    cache = UserCache(ttl_seconds=60)
+    user = make_user()
+    cache.set(user)
+
+    cache.invalidate(user.id)
+    assert cache.get(user.id) is None
+    assert cache.stats()["invalidations"] == 1
+
+    cache.set(user)
+    monkeypatch.setattr("app.auth.user_cache.time.monotonic", lambda: 10 ** 9)
+    assert cache.get(user.id) is None
+
+
+async def test_user_cache_evicts_the_least_recently_used_user():
+    cache = UserCache(max_entries=2)
+    first, second, third = make_user(), make_user(), make_user()
+    cache.set(first)
+    cache.set(second)
+    cache.get(first.id)
+    cache.set(third)
+
+    assert cache.get(second.id) is None
+    assert cache.get(first.id) is not None
+
+
+async def test_user_cache_is_disabled_without_a_ttl():
+    cache = UserCache(ttl_seconds=0)
+    user = make_user()
+    cache.set(user)
+
+    assert cache.get(user.id) is None
+
+
+async def test_change_stream_invalidates_changed_users():
+    cache = UserCache()
+    user = make_user()
+    cache.set(user)
+
+    cache.start_watching(WatchedCollection([{"operationType": "update", "documentKey": {"_id": ObjectId(user.id)}}]))
+    await asyncio.sleep(0.01)
+    await cache.stop_watching()
+
+    assert cache.get(user.id) is None
+
+
+async def test_reader_trusts_token_claims_when_enabled(database, monkeypatch):
+    monkeypatch.setattr(jwt.settings, "AUTH_TRUST_TOKEN_CLAIMS", True)
+    user = make_user()
+    token = jwt.create_access_token({"sub": user.id, **jwt.user_token_claims(user)})
+
+    reader = await jwt.get_current_reader(token)
+
+    # Built from the claims: the user is not in the database
+    assert (reader.id, reader.username, reader.hashed_password) == (user.id, "alice", "")
+
+
+async def test_reader_loads_the_user_when_claims_are_not_trusted(database, monkeypatch):
+    monkeypatch.setattr(jwt.settings, "AUTH_TRUST_TOKEN_CLAIMS", False)
+    user = make_user(is_active=False)
+    store(database, user)
+    token = jwt.create_access_token({"sub": user.id, **jwt.user_token_claims(make_user())})
+
+    reader = await jwt.get_current_reader(token)
+
+    assert reader.hashed_password == "hash"
+    with pytest.raises(HTTPException) as error:
+        await jwt.get_current_active_reader(reader)
+    assert error.value.status_code == 400
+
+
+async def test_deleted_user_is_rejected_without_claims_trust(database, monkeypatch):
+    monkeypatch.setattr(jwt.settings, "AUTH_TRUST_TOKEN_CLAIMS", False)
+    token = jwt.create_access_token({"sub": str(ObjectId()), **jwt.user_token_claims(make_user())})
+
+    with pytest.raises(HTTPException) as error:
+        await jwt.get_current_reader(token)
+    assert error.value.status_code == 401
+
+
+def route_dependencies(path, method):
+    for route in agent_router.routes:
+        if route.path == path and method in route.methods:
+            return {dependency.call for dependency in route.dependant.dependencies}
+    raise AssertionError(f"No route {method} {path}")
+
+
+@pytest.mark.parametrize("path", ["/query", "/query/stream"])
+def test_query_routes_always_load_the_user(path):
+    dependencies = route_dependencies(path, "POST")
+
+    assert jwt.get_current_active_user in dependencies
+    assert jwt.get_current_active_reader not in dependencies
+
+
+def test_history_accepts_token_claims():
+    assert jwt.get_current_active_reader in route_dependencies("/history", "GET")
@@ -0,0 +1,76 @@
+"""
+Tests for parsing finder output into content and references
+"""
+from datetime import datetime
+
+import pytest
+
+from app.utils.content_processor import ContentProcessor
+
+extract = ContentProcessor.extract_content_and_references
+
+
+def references(text: str):
+    return [(source.title, source.source, source.link, source.year) for source in extract(text)["references"]]
+
+
+def test_content_is_the_text_before_the_references_without_markup():
+    result = extract("Tides\n- **Tides** rise and fall.\n## Why\n\nReferences:\nTitle: Tides | Source: NASA | Link: https://www.nasa.gov/tides | Year: 2021\n")
+
+    assert result["content"] == "Tides\n- Tides rise and fall.\n Why"
+    assert references("x\nReferences:\nTitle: Tides | Source: NASA | Link: https://www.nasa.gov/tides | Year: 2021") == [
+        ("Tides", "NASA", "https://www.nasa.gov/tides", "2021")
+    ]
+
+
+def test_text_without_references_is_all_content():
+    assert extract("Just an *answer*.") == {"content": "Just an answer.", "references": []}
+
+
+@pytest.mark.parametrize("search_results", ["", None, 42])
+def test_empty_or_non_text_input(search_results):
+    assert extract(search_results) == {"content": "", "references": []}
+
+
+def test_four_part_fields_may_come_in_any_order_and_be_missing():
+    text = (
+        "References:\n"
+        "Year: 2020 | Link: https://oceanservice.noaa.gov/tides | Title: Tides and water levels\n"
+        "Title: Moon and tides | Link: https://www.nasa.gov/moon\n"
+    )
+
+    assert references(text) == [
+        ("Tides and water levels", "Source", "https://oceanservice.noaa.gov/tides", "2020"),
+        ("Moon and tides", "Source", "https://www.nasa.gov/moon", str(datetime.now().year))
+    ]
+
+
+def test_traditional_citations_are_parsed_as_a_fallback():
+    text = "References:\nSmith, J. (2019). Ocean tides explained. Marine Journal. https://www.marine.org/tides\n"
+
+    assert references(text) == [("Ocean tides explained", "Smith, J", "https://www.marine.org/tides", "2019")]
+
+
+def test_separators_invalid_links_and_placeholders_are_skipped():
+    text = (
+        "References:\n"
+        "—\n"
+        "- \n"
+        "Title: Placeholder | Source: Nowhere | Link: https://example.com/tides | Year: 2024\n"
+        "Title: Broken | Source: Nowhere | Link: not-a-url | Year: 2024\n"
+        "Title: Tides | Source: NASA | Link: https://www.nasa.gov/tides | Year: 2021\n"
+    )
+
+    assert references(text) == [("Tides", "NASA", "https://www.nasa.gov/tides", "2021")]
+
+
+def test_duplicate_links_and_titles_are_dropped():
+    text = (
+        "References:\n"
+        "Title: Tides | Source: NASA | Link: https://www.nasa.gov/tides | Year: 2021\n"
+        "Title: Tides again | Source: NASA | Link: https://www.nasa.gov/tides | Year: 2021\n"
+        "Title: Tides and water levels | Source: NOAA | Link: https://oceanservice.noaa.gov/tides | Year: 2020\n"
+        "Title: Tides and water levels | Source: Mirror | Link: https://mirror.org/tides | Year: 2020\n"
+    )
+
+    assert [link for _, _, link, _ in references(text)] == ["https://www.nasa.gov/tides", "https://oceanservice.noaa.gov/tides"]
@@ -0,0 +1,103 @@
+"""
+Tests for the deterministic offline model
+"""
+import json
+
+import pytest
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from app.agents.fake_llm import (
+    CONTENT_AGENT_STEPS, FakeLlm, FakeModelError, build_fake_models, default_organizer_response, load_canned_responses
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def request(text="how do tides work", function_responses=()):
+    contents = [types.Content(role="user", parts=[types.Part(text=text)])]
+    for name, result in function_responses:
+        contents.append(types.Content(role="user", parts=[
+            types.Part(function_response=types.FunctionResponse(name=name, response={"result": result}))
+        ]))
+    return LlmRequest(contents=contents)
+
+
+async def answer(model, llm_request):
+    responses = [response async for response in model.generate_content_async(llm_request)]
+    assert len(responses) == 1
+    return responses[0].content.parts[0]
+
+
+async def test_finder_prefers_canned_answers():
+    model = FakeLlm(role="finder_agent", responses={"how do tides work": "Canned."})
+
+    assert (await answer(model, request("  How do tides work "))).text == "Canned."
+    default = (await answer(model, request("why is the sky blue"))).text
+    assert "References:" in default
+    assert "https://www.nature.com/articles/why-is-the-sky-blue" in default
+
+
+async def test_content_agent_calls_each_tool_in_order_then_finishes():
+    model = FakeLlm(role="sources_agent")
+    done = []
+
+    for step in CONTENT_AGENT_STEPS:
+        part = await answer(model, request(function_responses=done))
+        assert part.function_call.name == step
+        done.append((step, f"{step} result"))
+
+    assert (await answer(model, request(function_responses=done))).text == "Done."
+
+
+async def test_organizer_is_asked_to_organize_the_previous_result():
+    model = FakeLlm(role="sources_agent")
+
+    part = await answer(model, request(function_responses=[("finder_agent", "found"), ("get_fact_sources", "sources")]))
+
+    assert part.function_call.args == {"request": "sources"}
+
+
+def test_organizer_formats_headings_and_bullets():
+    assert default_organizer_response("## Key Points\n- **First** point\nText") == "Key Points:\n• First point\nText"
+
+
+def test_delays_and_faults_are_reproducible():
+    def sequence(model):
+        delays, faults = [], []
+        for _ in range(20):
+            delays.append(model._delay())
+            faults.append(model._fails())
+            model.calls += 1
+        return delays, faults
+
+    options = dict(latency=0.1, jitter=0.05, seed=3, failure_rate=0.3, slow_rate=0.2, slow_latency=1.0)
+    delays, faults = sequence(FakeLlm(**options))
+
+    assert (delays, faults) == sequence(FakeLlm(**options))
+    assert all(0.1 <= delay <= 1.15 for delay in delays)
+    assert any(faults) and not all(faults)
+    # Injecting faults leaves the latencies unchanged
+    assert sequence(FakeLlm(**dict(options, failure_rate=0.0)))[0] == delays
+
+
+async def test_injected_failures_raise_a_transient_error():
+    model = FakeLlm(role="finder_agent", failure_rate=1.0)
+
+    with pytest.raises(FakeModelError):
+        await answer(model, request())
+    assert model.calls == 1
+
+
+def test_fake_models_cover_every_agent_with_their_own_seed(tmp_path):
+    path = tmp_path / "responses.json"
+    path.write_text(json.dumps({" How do tides work ": "Canned."}), encoding="utf-8")
+
+    models = build_fake_models(seed=5, responses=load_canned_responses(str(path)))
+
+    assert {role: model.role for role, model in models.items()} == {
+        "finder_agent": "finder_agent", "organizer_agent": "organizer_agent", "sources_agent": "sources_agent"
+    }
+    assert sorted(model.seed for model in models.values()) == [5, 6, 7]
+    assert models["finder_agent"].responses == {"how do tides work": "Canned."}
+    assert load_canned_responses("") == {}
@@ -0,0 +1,72 @@
+"""
+Tests for the orjson response encoder and its standard library fallback
+"""
+import json
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from app.utils import fast_json
+from app.utils.fast_json import FastJSONResponse, dumps
+from app.utils.sources import Source
+
+DOCUMENT = {
+    "_id": ObjectId("65a000000000000000000000"),
+    "query": "Why do tides happen? é",
+    "timestamp": datetime(2024, 1, 1, 12, 0, 0, 123456),
+    "saved_at": datetime(2024, 1, 1, tzinfo=timezone.utc),
+    "local": datetime(2024, 1, 1, 9, 30, tzinfo=timezone(timedelta(hours=2))),
+    "day": date(2024, 1, 1),
+    "sources": [Source("Tides", "NASA", "https://www.nasa.gov/tides", "2021", extra={"snippet": "moon"})],
+    "score": 1.5,
+    "tags": None
+}
+
+
+@pytest.fixture(params=[True, False], ids=["orjson", "stdlib"])
+def encoder(request, monkeypatch):
+    if request.param and fast_json.orjson is None:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setattr(fast_json.settings, "FAST_JSON_ENABLED", request.param)
+
+
+def test_documents_are_encoded_without_conversion(encoder):
+    encoded = dumps(DOCUMENT)
+
+    assert json.loads(encoded) == {
+        "_id": "65a000000000000000000000",
+        "query": "Why do tides happen? é",
+        "timestamp": "2024-01-01T12:00:00.123456",
+        "saved_at": "2024-01-01T00:00:00Z",
+        "local": "2024-01-01T09:30:00+02:00",
+        "day": "2024-01-01",
+        "sources": [{"title": "Tides", "source": "NASA", "link": "https://www.nasa.gov/tides", "year": "2021", "snippet": "moon"}],
+        "score": 1.5,
+        "tags": None
+    }
+    assert "é".encode("utf-8") in encoded
+    assert b", " not in encoded and b": " not in encoded
+
+
+def test_both_encoders_write_the_same_bytes(monkeypatch):
+    if fast_json.orjson is None:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setattr(fast_json.settings, "FAST_JSON_ENABLED", True)
+    fast = dumps(DOCUMENT)
+    monkeypatch.setattr(fast_json.settings, "FAST_JSON_ENABLED", False)
+
+    assert dumps(DOCUMENT) == fast
+
+
+def test_unknown_types_are_rejected(encoder):
+    with pytest.raises(TypeError):
+        dumps({"value": object()})
+
+
+def test_response_renders_with_dumps(encoder):
+    response = FastJSONResponse([DOCUMENT], headers={"X-Next-Cursor": "abc"})
+
+    assert response.body == dumps([DOCUMENT])
+    assert response.media_type == "application/json"
+    assert response.headers["X-Next-Cursor"] == "abc"
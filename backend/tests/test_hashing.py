@@ -0,0 +1,99 @@
+"""
+Tests for the password hashing pool
+"""
+import asyncio
+import importlib
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import app.db.mongodb as mongodb
+from app.auth import jwt
+from app.auth.hashing import PasswordHasher, PasswordHasherBusy
+from app.auth.user_cache import UserCache
+from tests.fake_mongo import FakeDatabase
+
+# app.api.routers re-exports the routers under their module names
+user_router_module = importlib.import_module("app.api.routers.user_router")
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_full_queue_rejects_new_jobs():
+    hasher = PasswordHasher(rounds=4, max_workers=1, max_pending=1)
+    release = threading.Event()
+    try:
+        running = asyncio.create_task(hasher._run(release.wait))
+        waiting = asyncio.create_task(hasher._run(release.wait))
+        await asyncio.sleep(0.05)
+
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.verify("password", "hash")
+
+        release.set()
+        await asyncio.gather(running, waiting)
+        assert hasher.stats()["rejected"] == 1
+        assert hasher.stats()["completed"] == 2
+    finally:
+        release.set()
+        hasher.close()
+
+
+async def test_outdated_hash_is_replaced_on_verify():
+    old = PasswordHasher(rounds=4)
+    current = PasswordHasher(rounds=5)
+    try:
+        stored = await old.hash("correct horse")
+
+        assert await current.verify_and_update("wrong", stored) == (False, None)
+        valid, new_hash = await current.verify_and_update("correct horse", stored)
+        assert valid and new_hash.startswith("$2b$05$")
+        assert await current.verify_and_update("correct horse", new_hash) == (True, None)
+        assert current.stats()["rehashed"] == 1
+    finally:
+        old.close()
+        current.close()
+
+
+async def test_login_stores_the_rehashed_password(monkeypatch):
+    old = PasswordHasher(rounds=4)
+    current = PasswordHasher(rounds=5)
+    db = FakeDatabase()
+    cache = UserCache()
+    monkeypatch.setattr(mongodb, "mongodb_database", db)
+    monkeypatch.setattr(jwt, "password_hasher", current)
+    monkeypatch.setattr(jwt, "user_cache", cache)
+    try:
+        user_id = (await db.users.update_one(
+            {"email": "alice@example.com"},
+            {"$setOnInsert": {"username": "alice", "hashed_password": await old.hash("correct horse")}},
+            upsert=True
+        )).upserted_id
+
+        user = await jwt.authenticate_user("alice@example.com", "correct horse")
+
+        stored = db.users.documents[0]
+        assert user.id == str(user_id)
+        assert stored["hashed_password"].startswith("$2b$05$")
+        assert stored["hashed_password"] == user.hashed_password
+        assert "last_login" in stored
+        assert await jwt.authenticate_user("alice@example.com", "wrong") is None
+    finally:
+        old.close()
+        current.close()
+
+
+def test_busy_hasher_answers_login_with_503(monkeypatch):
+    async def busy(email, password):
+        raise PasswordHasherBusy("4 password hashing jobs are already waiting")
+
+    monkeypatch.setattr(user_router_module, "authenticate_user", busy)
+    app = FastAPI()
+    app.include_router(user_router_module.router, prefix="/api/users")
+
+    response = TestClient(app).post("/api/users/login", data={"username": "alice@example.com", "password": "x"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
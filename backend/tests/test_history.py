@@ -0,0 +1,96 @@
+"""
+Tests for query history compaction and expiry
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.db.history import HISTORY_COLLECTION, TTL_INDEX_NAME, compact_history, ensure_history_ttl, summarize_response
+from tests.fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+DAY = 24 * 3600
+
+
+def entry(age_days, response="Tides are caused by the moon.", sources=None):
+    return {
+        "_id": ObjectId(),
+        "query": "why do tides happen",
+        "response": response,
+        "sources": sources if sources is not None else [
+            {"title": "Tides", "link": "https://www.nasa.gov/tides"},
+            {"title": "More tides", "link": "https://nasa.gov/more"},
+            {"title": "Ocean", "link": "https://noaa.gov/ocean"},
+        ],
+        "timestamp": datetime.utcnow() - timedelta(days=age_days),
+    }
+
+
+class CountingDatabase(FakeDatabase):
+    """Counts the find calls on the history collection"""
+
+    def __init__(self):
+        super().__init__()
+        self.finds = 0
+        history = self[HISTORY_COLLECTION]
+        find = history.find
+
+        def counting_find(*args, **kwargs):
+            self.finds += 1
+            return find(*args, **kwargs)
+
+        history.find = counting_find
+
+
+def test_summarize_response():
+    assert summarize_response("Tides\n\nare   caused by the moon.", 100) == "Tides are caused by the moon."
+    assert summarize_response("one two three four", 10) == "one two t…"
+    assert summarize_response(None, 10) == ""
+
+
+async def test_compacted_entries_keep_only_archive_fields():
+    db = FakeDatabase()
+    recent, old = entry(1), entry(40, response="Tides   are caused\nby the moon. " * 30)
+    db[HISTORY_COLLECTION].documents = [recent, old]
+
+    assert await compact_history(db, older_than_days=30, summary_chars=40) == 1
+
+    assert "response" in recent and "sources" in recent
+    assert set(old) == {"_id", "query", "timestamp", "summary", "source_domains", "source_count", "compacted_at"}
+    assert old["summary"] == "Tides are caused by the moon. Tides are…"
+    assert len(old["summary"]) == 40
+    assert old["source_domains"] == ["nasa.gov", "noaa.gov"]
+    assert old["source_count"] == 3
+
+
+@pytest.mark.parametrize("count, finds", [(0, 1), (3, 2), (4, 2), (6, 3)])
+async def test_compaction_batches(count, finds):
+    db = CountingDatabase()
+    db[HISTORY_COLLECTION].documents = [entry(40) for _ in range(count)]
+
+    assert await compact_history(db, older_than_days=30, batch_size=3) == count
+
+    # A full batch is followed by one more read, which finds nothing left
+    assert db.finds == finds
+    assert all("response" not in document for document in db[HISTORY_COLLECTION].documents)
+
+
+async def test_ttl_index_is_created_changed_and_dropped():
+    db = FakeDatabase()
+    history = db[HISTORY_COLLECTION]
+
+    await ensure_history_ttl(db, 30)
+    assert history.indexes[TTL_INDEX_NAME]["expireAfterSeconds"] == 30 * DAY
+
+    await ensure_history_ttl(db, 30)
+    assert db.commands == []
+
+    await ensure_history_ttl(db, 90)
+    assert db.commands[0][:2] == ("collMod", HISTORY_COLLECTION)
+    assert history.indexes[TTL_INDEX_NAME]["expireAfterSeconds"] == 90 * DAY
+
+    await ensure_history_ttl(db, 0)
+    assert TTL_INDEX_NAME not in history.indexes
+    await ensure_history_ttl(db, 0)
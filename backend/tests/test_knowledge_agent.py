@@ -0,0 +1,61 @@
+"""
+Tests for get_information: single-flight coalescing under admission control
+"""
+import asyncio
+
+import pytest
+
+from app.agents import knowledge_agent
+from app.utils.admission import AdmissionController, AdmissionRejected
+from app.utils.single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    """Replace the pipeline run with a stub, and the admission and single-flight singletons with fresh ones"""
+    runs = []
+
+    async def run_knowledge_pipeline(query, user_id=None, research=False):
+        runs.append(user_id)
+        await asyncio.sleep(0.01)
+        return {"response": f"answer for {user_id}", "sources": [], "metadata": {}}
+
+    monkeypatch.setattr(knowledge_agent, "run_knowledge_pipeline", run_knowledge_pipeline)
+    monkeypatch.setattr(knowledge_agent, "query_flight", SingleFlight(timeout=5))
+    monkeypatch.setattr(knowledge_agent.settings, "SINGLE_FLIGHT_ENABLED", True)
+    monkeypatch.setattr(knowledge_agent.settings, "RAG_ENABLED", False)
+    return runs
+
+
+async def test_waiter_runs_the_query_when_the_leader_is_not_admitted(pipeline, monkeypatch):
+    admission = AdmissionController(max_concurrent=4, max_per_user=1, max_queue_per_user=0)
+    monkeypatch.setattr(knowledge_agent, "admission_controller", admission)
+    # alice already has her one run in progress
+    await admission.acquire("alice")
+
+    results = await asyncio.gather(
+        knowledge_agent.get_information("how do tides work", user_id="alice", use_cache=False),
+        knowledge_agent.get_information("how do tides work", user_id="bob", use_cache=False),
+        return_exceptions=True
+    )
+
+    alice, bob = results
+    assert isinstance(alice, AdmissionRejected)
+    assert alice.reason == "user_queue_full"
+    assert bob["response"] == "answer for bob"
+    assert pipeline == ["bob"]
+
+
+async def test_callers_share_an_admitted_run(pipeline, monkeypatch):
+    monkeypatch.setattr(knowledge_agent, "admission_controller", AdmissionController(max_per_user=1))
+
+    alice, bob = await asyncio.gather(
+        knowledge_agent.get_information("how do tides work", user_id="alice", use_cache=False),
+        knowledge_agent.get_information("how do tides work", user_id="bob", use_cache=False)
+    )
+
+    assert alice["response"] == bob["response"] == "answer for alice"
+    assert bob["metadata"]["coalesced"] is True
+    assert pipeline == ["alice"]
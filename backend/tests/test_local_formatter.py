@@ -0,0 +1,89 @@
+"""
+Tests for local formatting of finder content
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.agents import knowledge_agent
+from app.utils import local_formatter as local_formatter_module
+from app.utils.local_formatter import LOCAL_ROUTE, ORGANIZER_ROUTE, LocalFormatter, format_content
+from app.utils.metrics import metrics
+
+STRUCTURED = "\n\n".join(
+    f"## Section {index}\n\n" + "Tides rise and fall twice a day because of the moon. " * 8
+    for index in range(6)
+)
+
+
+@pytest.mark.parametrize("text, route, reason", [
+    ("", ORGANIZER_ROUTE, "empty"),
+    ("   \n", ORGANIZER_ROUTE, "empty"),
+    ("Tides are caused by the moon.", LOCAL_ROUTE, "short"),
+    ("| a | b |\n| 1 | 2 |", ORGANIZER_ROUTE, "tables_or_code"),
+    ("```python\nprint(1)\n```", ORGANIZER_ROUTE, "tables_or_code"),
+    (STRUCTURED, LOCAL_ROUTE, "structured"),
+    ("The moon pulls the oceans. " * 100, ORGANIZER_ROUTE, "unstructured"),
+    ("## Tides\n\n" + "The moon pulls the oceans. " * 100, ORGANIZER_ROUTE, "long_paragraphs"),
+])
+def test_route_decisions(text, route, reason):
+    assert LocalFormatter(max_chars=1500, max_paragraph_chars=1200).choose_route(text) == (route, reason)
+
+
+def test_disabled_formatter_always_uses_the_organizer():
+    assert LocalFormatter(enabled=False).choose_route("Short text.") == (ORGANIZER_ROUTE, "disabled")
+
+
+def test_format_content_applies_the_organizer_rules():
+    text = (
+        "# Why tides happen\n"
+        "The **moon** pulls on the [oceans](https://example.com).\n"
+        "It also pulls on land.\n\n"
+        "Key Points:\n"
+        "- Two high tides a day\n"
+        "* Spring and neap tides\n"
+        "1. Tidal ranges vary\n\n"
+        "---\n\n"
+        "Summary\n"
+        "=======\n"
+        "Tides follow the moon."
+    )
+
+    assert format_content(text) == (
+        "Why tides happen:\n"
+        "The moon pulls on the oceans. It also pulls on land.\n\n"
+        "Key Points:\n"
+        "• Two high tides a day\n"
+        "• Spring and neap tides\n"
+        "• Tidal ranges vary\n\n"
+        "Summary:\n"
+        "Tides follow the moon."
+    )
+
+
+def test_routes_are_counted_in_the_metrics():
+    formatter = LocalFormatter()
+    formatter.record(LOCAL_ROUTE, "short")
+    formatter.record(ORGANIZER_ROUTE, "unstructured")
+
+    assert formatter.stats()["routes"] == {LOCAL_ROUTE: 1, ORGANIZER_ROUTE: 1}
+    rendered = metrics.render()
+    assert 'articube_formatter_routes_total{route="local",reason="short"}' in rendered
+    assert 'articube_formatter_routes_total{route="organizer",reason="unstructured"}' in rendered
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("content, formatted_locally", [
+    ("## Tides\nThe moon pulls the oceans.", True),
+    ("The moon pulls the oceans. " * 100, False),
+])
+async def test_organizer_call_falls_back_to_the_model(content, formatted_locally, monkeypatch):
+    monkeypatch.setattr(local_formatter_module, "local_formatter", LocalFormatter())
+    tool = SimpleNamespace(name="organizer_agent")
+    tool_context = SimpleNamespace(state={"content": content})
+
+    result = await knowledge_agent._local_formatter_before_tool(tool, {"request": content}, tool_context)
+
+    assert (result is not None) == formatted_locally
+    assert ("organized_content" in tool_context.state) == formatted_locally
+    assert tool_context.state["formatter"]["route"] == (LOCAL_ROUTE if formatted_locally else ORGANIZER_ROUTE)
@@ -0,0 +1,87 @@
+"""
+Tests for the log sink's levels, sampling and truncation
+"""
+from loguru import logger
+
+from app.utils import log
+from app.utils.log import _LevelFilter, _patch_record, _sink_level, log_payload, truncate
+
+
+def level(name):
+    return logger.level(name).no
+
+
+def test_sink_level_is_the_lowest_configured_level(monkeypatch):
+    monkeypatch.setattr(log.settings, "LOG_PAYLOADS", False)
+    monkeypatch.setattr(log.settings, "TRACING_EXPORTER", "")
+
+    assert _sink_level(_LevelFilter("WARNING", {}, 0.1)) == level("WARNING")
+    assert _sink_level(_LevelFilter("WARNING", {"app.agents": "DEBUG", "app.db": "ERROR"}, 0.1)) == level("DEBUG")
+
+
+def test_sink_level_keeps_payload_and_span_records(monkeypatch):
+    monkeypatch.setattr(log.settings, "TRACING_ENABLED", True)
+    monkeypatch.setattr(log.settings, "TRACING_EXPORTER", "log")
+    monkeypatch.setattr(log.settings, "LOG_PAYLOADS", False)
+    assert _sink_level(_LevelFilter("ERROR", {}, 0.1)) == level("INFO")
+
+    monkeypatch.setattr(log.settings, "LOG_PAYLOADS", True)
+    assert _sink_level(_LevelFilter("ERROR", {}, 0.1)) == level("DEBUG")
+
+
+def test_module_levels_use_the_longest_prefix():
+    level_filter = _LevelFilter("INFO", {"app.agents": "DEBUG", "app.agents.research": "ERROR"}, 1.0)
+
+    assert level_filter.level_for("app.agents.knowledge_agent") == level("DEBUG")
+    assert level_filter.level_for("app.agents.research") == level("ERROR")
+    assert level_filter.level_for("app.agentsx") == level("INFO")
+
+
+def record(level_name, name="app.agents.knowledge_agent", request="-", message="message", **extra):
+    return {"level": logger.level(level_name), "name": name, "message": message, "extra": {"request_id": request, **extra}}
+
+
+def test_debug_records_are_sampled_per_request():
+    level_filter = _LevelFilter("DEBUG", {}, 0.5)
+    requests = [f"request-{index}" for index in range(200)]
+
+    kept = {request for request in requests if level_filter(record("DEBUG", request=request))}
+
+    # A request keeps all of its debug records or none of them
+    assert kept == {request for request in requests if level_filter(record("DEBUG", request=request, message="other"))}
+    assert 50 < len(kept) < 150
+    assert all(level_filter(record("INFO", request=request)) for request in requests)
+
+
+def test_payload_and_span_records_bypass_levels_and_sampling():
+    level_filter = _LevelFilter("ERROR", {}, 0.0)
+
+    assert not level_filter(record("DEBUG"))
+    assert level_filter(record("DEBUG", payload=True))
+    assert level_filter(record("INFO", span=True))
+
+
+def test_long_messages_are_truncated_except_payloads(monkeypatch):
+    monkeypatch.setattr(log.settings, "LOG_MAX_MESSAGE_CHARS", 10)
+    assert truncate("x" * 25) == "xxxxxxxxxx... [15 more chars]"
+    assert truncate("x" * 25, limit=0) == "x" * 25
+
+    short, payload = record("INFO", message="y" * 25), record("DEBUG", message="y" * 25, payload=True)
+    _patch_record(short)
+    _patch_record(payload)
+    assert short["message"] == "yyyyyyyyyy... [15 more chars]"
+    assert payload["message"] == "y" * 25
+
+
+def test_payloads_are_only_logged_when_enabled(monkeypatch):
+    messages = []
+    sink = logger.add(lambda message: messages.append(message.record["message"]), level="DEBUG", filter=lambda record: record["extra"].get("payload"))
+    try:
+        monkeypatch.setattr(log.settings, "LOG_PAYLOADS", False)
+        log_payload("answer", "hidden")
+        monkeypatch.setattr(log.settings, "LOG_PAYLOADS", True)
+        log_payload("answer", "shown")
+    finally:
+        logger.remove(sink)
+
+    assert messages == ["answer: shown"]
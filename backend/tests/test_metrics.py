@@ -0,0 +1,71 @@
+"""
+Tests for the Prometheus metrics and the pipeline phase timings
+"""
+import time
+
+from app.agents.knowledge_agent import PhaseTimer
+from app.utils.metrics import MetricsRegistry
+
+
+def test_counters_render_one_sample_per_label_set():
+    registry = MetricsRegistry(prefix="test")
+    counter = registry.counter("queries_total", "Queries", ("route",))
+    counter.inc(route="query")
+    counter.inc(2, route="query")
+    counter.inc(route='say "hi"\n')
+
+    assert registry.render().splitlines() == [
+        "# HELP test_queries_total Queries",
+        "# TYPE test_queries_total counter",
+        'test_queries_total{route="query"} 3',
+        'test_queries_total{route="say \\"hi\\"\\n"} 1'
+    ]
+
+
+def test_histograms_count_into_cumulative_buckets():
+    registry = MetricsRegistry(prefix="test")
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'test_latency_seconds_bucket{le="0.1"} 1',
+        'test_latency_seconds_bucket{le="1"} 3',
+        'test_latency_seconds_bucket{le="+Inf"} 4',
+        "test_latency_seconds_sum 6.05",
+        "test_latency_seconds_count 4"
+    ]
+
+
+def test_gauges_are_read_at_scrape_time_and_skipped_when_failing():
+    registry = MetricsRegistry(prefix="test")
+    state = {"in_flight": 2}
+    registry.gauge("in_flight", "In flight", lambda: state["in_flight"])
+    registry.gauge("broken", "Broken", lambda: 1 / 0)
+
+    state["in_flight"] = 5
+    lines = registry.render().splitlines()
+
+    assert "test_in_flight 5" in lines
+    assert not any(line.startswith("test_broken ") for line in lines)
+
+
+def test_metrics_are_registered_once_by_name():
+    registry = MetricsRegistry(prefix="test")
+
+    assert registry.counter("events_total", "Events") is registry.counter("events_total", "Events")
+
+
+def test_phase_timer_adds_up_repeated_phases():
+    timer = PhaseTimer()
+    timer.start("searching")
+    time.sleep(0.01)
+    timer.start("organizing")
+    timer.start("searching")
+    time.sleep(0.01)
+
+    timings = timer.as_metadata()
+
+    assert set(timings) == {"searching", "organizing", "total"}
+    assert timings["searching"] >= 20
+    assert timings["total"] >= timings["searching"] + timings["organizing"]
@@ -0,0 +1,72 @@
+"""
+Tests for the versioned index migrations
+"""
+import pytest
+from bson import ObjectId
+
+from app.db import migrations
+from app.db.migrations import MIGRATIONS, MIGRATIONS_COLLECTION, migration_status, run_migrations
+from tests.fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+ALL_VERSIONS = [known.version for known in MIGRATIONS]
+
+
+@pytest.fixture(autouse=True)
+def failures(monkeypatch):
+    monkeypatch.setattr(migrations, "_failures", {})
+
+
+def user(email, username):
+    return {"_id": ObjectId(), "email": email, "username": username}
+
+
+async def test_fresh_database_applies_and_records_every_migration():
+    db = FakeDatabase()
+
+    assert await run_migrations(db) == ALL_VERSIONS
+
+    recorded = {document["_id"]: document for document in db[MIGRATIONS_COLLECTION].documents}
+    assert sorted(recorded) == ALL_VERSIONS
+    assert recorded[3]["name"] == "unique user email and username"
+    assert db.users.indexes["username_1"]["unique"]
+    assert await run_migrations(db) == []
+
+
+async def test_recorded_versions_are_skipped():
+    db = FakeDatabase()
+    db[MIGRATIONS_COLLECTION].documents = [{"_id": 1, "name": "done"}, {"_id": 2, "name": "done"}]
+
+    assert await run_migrations(db) == ALL_VERSIONS[2:]
+    assert "user_id_timestamp" not in db.query_history.indexes
+
+
+async def test_duplicate_usernames_are_reported_and_hold_back_later_migrations():
+    db = FakeDatabase()
+    db.users.documents = [
+        user("a@example.com", "alice"), user("b@example.com", "alice"), user("c@example.com", "carol")
+    ]
+
+    assert await run_migrations(db) == [1, 2]
+
+    status = {entry["version"]: entry for entry in await migration_status(db)}
+    assert not status[3]["applied"]
+    assert "username" in status[3]["error"] and "alice" in status[3]["error"]
+    assert "carol" not in status[3]["error"]
+    assert not status[5]["applied"] and status[5]["error"] is None
+    assert "username_1" not in db.users.indexes
+
+    db.users.documents[1]["username"] = "alice2"
+    assert await run_migrations(db) == ALL_VERSIONS[2:]
+    assert all(entry["applied"] and entry["error"] is None for entry in await migration_status(db))
+
+
+async def test_duplicate_emails_are_reported():
+    db = FakeDatabase()
+    db.users.documents = [user("a@example.com", "alice"), user("a@example.com", "bob")]
+
+    await run_migrations(db)
+
+    error = {entry["version"]: entry for entry in await migration_status(db)}[3]["error"]
+    assert "email" in error and "a@example.com" in error
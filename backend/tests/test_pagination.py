@@ -0,0 +1,54 @@
+"""
+Tests for keyset pagination cursors
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from app.utils.pagination import (
+    after_cursor_filter, decode_cursor, descending_sort, encode_cursor, next_cursor
+)
+from tests.fake_mongo import FakeCollection
+
+
+def test_cursor_round_trip():
+    timestamp = datetime(2024, 5, 1, 12, 30, 15, 123000)
+    document_id = ObjectId()
+
+    cursor = encode_cursor(timestamp, document_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (timestamp, document_id)
+
+
+def test_malformed_cursor_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_no_cursor_means_no_filter():
+    assert after_cursor_filter("timestamp", None) == {}
+
+
+@pytest.mark.anyio
+async def test_pages_cover_every_document_once():
+    collection = FakeCollection()
+    start = datetime(2024, 1, 1)
+    # Several documents share a timestamp, so the _id breaks the ties
+    collection.documents = [{"_id": ObjectId(), "timestamp": start + timedelta(minutes=index // 3)} for index in range(10)]
+
+    seen = []
+    cursor = None
+    while True:
+        documents = await collection.find(after_cursor_filter("timestamp", cursor)).sort(
+            descending_sort("timestamp")
+        ).limit(4).to_list(length=4)
+        cursor = next_cursor(documents, "timestamp", 3)
+        assert len(documents) <= 3
+        seen.extend(document["_id"] for document in documents)
+        if cursor is None:
+            break
+
+    expected = sorted(collection.documents, key=lambda document: (document["timestamp"], document["_id"]), reverse=True)
+    assert seen == [document["_id"] for document in expected]
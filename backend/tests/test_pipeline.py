@@ -0,0 +1,125 @@
+"""
+End-to-end tests of the knowledge pipeline, with every model replaced by FakeLlm
+"""
+import asyncio
+
+import pytest
+
+from app.agents import knowledge_agent, resilient_llm
+from app.agents.fake_llm import FakeLlm, build_fake_models
+from app.agents.resilient_llm import CircuitOpenError
+from app.agents.runner_pool import RunnerPool
+from app.utils.single_flight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+CANNED_FINDER_ANSWER = (
+    "## Tides\n"
+    "- Tides rise and fall twice a day.\n"
+    "- The moon's gravity pulls the oceans.\n\n"
+    "References:\n"
+    "Title: How the moon drives ocean tides | Source: NASA | Link: https://www.nasa.gov/tides | Year: 2021\n"
+    "Title: How the moon drives the ocean tides | Source: NASA | Link: https://www.nasa.gov/tides-again | Year: 2021\n"
+    "Title: Tides and water levels | Source: NOAA | Link: https://oceanservice.noaa.gov/tides | Year: 2020\n"
+)
+
+
+@pytest.fixture
+def use_models(monkeypatch):
+    """Run the pipeline on a fresh runner pool whose agents use the given models"""
+    monkeypatch.setattr(knowledge_agent.settings, "RAG_ENABLED", False)
+    monkeypatch.setattr(knowledge_agent.settings, "MODEL_RETRY_BASE_DELAY_SECONDS", 0.0)
+    monkeypatch.setattr(knowledge_agent, "query_flight", SingleFlight(timeout=30))
+    monkeypatch.setattr(resilient_llm, "model_breakers", {})
+    monkeypatch.setattr(resilient_llm, "model_latencies", {})
+
+    def use(build_models):
+        pool = RunnerPool(
+            size=2,
+            agent_factory=lambda: knowledge_agent.build_knowledge_agent(models=build_models()),
+            app_name=knowledge_agent.APP_NAME,
+            session_service=knowledge_agent.session_service
+        )
+        monkeypatch.setattr(knowledge_agent, "runner_pool", pool)
+
+    return use
+
+
+async def test_answers_with_organized_content_and_sources(use_models):
+    use_models(build_fake_models)
+
+    result = await knowledge_agent.get_information("how do tides work", use_cache=False)
+
+    assert "Key Points:" in result["response"]
+    assert "• The first key point about how do tides work." in result["response"]
+    assert [source.domain for source in result["sources"]] == ["nature.com", "technologyreview.com", "bbc.com"]
+    assert {"searching", "extracting_sources", "organizing", "total"} <= set(result["metadata"]["timings_ms"])
+    assert result["metadata"]["cache"] == {"hit": False}
+
+
+async def test_duplicate_references_are_dropped(use_models):
+    use_models(lambda: build_fake_models(responses={"tides": CANNED_FINDER_ANSWER}))
+
+    result = await knowledge_agent.get_information("tides", use_cache=False)
+
+    assert [source.link for source in result["sources"]] == ["https://www.nasa.gov/tides", "https://oceanservice.noaa.gov/tides"]
+    assert "Tides rise and fall twice a day." in result["response"]
+
+
+async def test_stream_ends_with_the_final_answer(use_models):
+    use_models(build_fake_models)
+
+    events = [event async for event in knowledge_agent.stream_information("why is the sky blue", use_cache=False)]
+
+    names = [event["event"] for event in events]
+    assert names[0] == "phase" and names[-1] == "final"
+    assert "sources" in names
+    assert events[-1]["data"]["response"]
+
+
+def open_sessions():
+    return sum(len(sessions) for sessions in knowledge_agent.session_service.sessions.get(knowledge_agent.APP_NAME, {}).values())
+
+
+async def test_session_is_not_bound_in_the_consumer_context(use_models):
+    use_models(build_fake_models)
+
+    async for event in knowledge_agent.stream_knowledge_pipeline("why is the sky blue", user_id="alice"):
+        assert knowledge_agent._current_session.get() is None
+
+    assert event["event"] == "final"
+    assert open_sessions() == 0
+
+
+async def test_pipeline_closed_from_another_task_releases_its_session(use_models):
+    use_models(lambda: build_fake_models(latency=0.05))
+    pipeline = knowledge_agent.stream_knowledge_pipeline("why is the sky blue", user_id="alice")
+
+    async def first_event():
+        return await pipeline.__anext__()
+
+    assert (await asyncio.create_task(first_event()))["event"] == "phase"
+    assert open_sessions() == 1
+
+    await pipeline.aclose()
+
+    assert open_sessions() == 0
+
+
+async def test_failing_model_opens_the_circuit_and_then_fails_fast(use_models, monkeypatch):
+    monkeypatch.setattr(knowledge_agent.settings, "MODEL_BREAKER_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(knowledge_agent.settings, "MODEL_BREAKER_RESET_SECONDS", 60.0)
+
+    def failing_finder():
+        models = build_fake_models()
+        models["finder_agent"] = FakeLlm(role="finder_agent", failure_rate=1.0)
+        return models
+
+    use_models(failing_finder)
+
+    first = await knowledge_agent.get_information("how do volcanoes form", use_cache=False)
+    assert "error" in first["metadata"]
+    assert resilient_llm.get_breaker("finder_agent").state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        await knowledge_agent.get_information("how do volcanoes form", use_cache=False)
@@ -0,0 +1,80 @@
+"""
+Tests for the request id and request tracing middleware
+"""
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.utils.log import REQUEST_ID_HEADER, RequestIdMiddleware, request_id
+from app.utils.metrics import Histogram
+from app.utils.tracing import RequestTracingMiddleware
+
+
+def make_client():
+    duration = Histogram("test_http_request_duration_seconds", "", ("method", "route", "status"))
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        return {"item": item_id, "request_id": request_id.get()}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for index in range(3):
+                await asyncio.sleep(0.05)
+                yield f"chunk {index}\n"
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    app.add_middleware(RequestTracingMiddleware, duration=duration)
+    app.add_middleware(RequestIdMiddleware)
+    return TestClient(app), duration
+
+
+def observed(duration, route):
+    """Sum and count of the observations for a route"""
+    series = duration._series[("GET", route, "200")]
+    return series[-2], series[-1]
+
+
+def test_request_id_is_echoed_and_visible_to_handlers():
+    client, _ = make_client()
+
+    response = client.get("/items/1", headers={REQUEST_ID_HEADER: "abc"})
+
+    assert response.headers[REQUEST_ID_HEADER] == "abc"
+    assert response.json()["request_id"] == "abc"
+    assert request_id.get() == "-"
+
+
+def test_request_id_is_generated_when_missing():
+    client, _ = make_client()
+
+    response = client.get("/items/1")
+
+    assert len(response.headers[REQUEST_ID_HEADER]) == 32
+    assert response.json()["request_id"] == response.headers[REQUEST_ID_HEADER]
+
+
+def test_requests_are_timed_by_route_template():
+    client, duration = make_client()
+
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+
+    assert observed(duration, "/items/{item_id}")[1] == 2
+    assert ("GET", "unmatched", "404") in duration._series
+
+
+def test_streamed_responses_are_timed_to_the_last_chunk():
+    client, duration = make_client()
+
+    response = client.get("/stream")
+
+    assert response.text == "chunk 0\nchunk 1\nchunk 2\n"
+    seconds, count = observed(duration, "/stream")
+    assert count == 1
+    assert seconds >= 0.15
@@ -0,0 +1,118 @@
+"""
+Tests for research mode: query decomposition, merging and the branch fan-out
+"""
+import asyncio
+
+import pytest
+
+from app.agents.research import (
+    RESEARCH_FACETS, BranchResult, ResearchBackend, decompose_query, merge_branch_results, run_research
+)
+
+
+def answer(text, *references):
+    lines = [f"Title: {title} | Source: {source} | Link: {link} | Year: 2024" for title, source, link in references]
+    return text + ("\n\nReferences:\n" + "\n".join(lines) if lines else "")
+
+
+class ScriptedBackend(ResearchBackend):
+    """Answers, fails or hangs per sub-query, and records the concurrency reached"""
+
+    def __init__(self, failing=(), hanging=(), delay=0.0):
+        self.failing = set(failing)
+        self.hanging = set(hanging)
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+
+    async def search(self, query):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if query in self.failing:
+                raise RuntimeError("search failed")
+            if query in self.hanging:
+                await asyncio.sleep(60)
+            return answer(f"About {query}.", (f"{query} explained", "Nature", f"https://nature.com/{len(query)}"))
+        finally:
+            self.running -= 1
+
+
+def test_single_clause_is_widened_with_facets():
+    assert decompose_query("  ocean tides  ", 3) == [f"ocean tides: {facet}" for facet in RESEARCH_FACETS[:3]]
+
+
+def test_count_of_one_keeps_the_query():
+    assert decompose_query("solar vs wind power", 1) == ["solar vs wind power"]
+
+
+def test_comparison_gets_one_sub_query_per_topic_then_facets():
+    sub_queries = decompose_query("solar vs wind power", 3)
+
+    assert sub_queries[:2] == ["solar", "wind power"]
+    assert sub_queries[2] == f"solar vs wind power: {RESEARCH_FACETS[0]}"
+
+
+def test_too_many_clauses_are_cut_to_the_count():
+    assert decompose_query("tea; coffee; cocoa; mate; chai", 3) == ["tea", "coffee", "cocoa"]
+
+
+def test_repeated_clauses_are_kept_once():
+    assert decompose_query("Tea; tea; coffee", 2) == ["Tea", "coffee"]
+
+
+def test_merge_keeps_branch_order_and_drops_duplicate_references():
+    branches = [
+        BranchResult("tides", answer("Tides follow the moon.", ("How the moon drives ocean tides", "NASA", "https://nasa.gov/tides")), 0.1),
+        BranchResult("waves", "", 0.1, "search failed"),
+        BranchResult("currents", answer(
+            "Currents move heat.",
+            ("How the moon drives ocean tides", "NASA", "https://NASA.gov/tides"),
+            ("Ocean currents and climate", "NOAA", "https://noaa.gov/currents")
+        ), 0.2),
+    ]
+
+    merged = merge_branch_results(branches)
+
+    content, references = merged.split("References:\n")
+    assert content.index("## tides") < content.index("## currents")
+    assert "## waves" not in content
+    assert references.splitlines() == [
+        "Title: How the moon drives ocean tides | Source: NASA | Link: https://nasa.gov/tides | Year: 2024",
+        "Title: Ocean currents and climate | Source: NOAA | Link: https://noaa.gov/currents | Year: 2024",
+    ]
+
+
+@pytest.mark.anyio
+async def test_branches_run_concurrently_within_the_bound():
+    backend = ScriptedBackend(delay=0.05)
+
+    merged, metadata = await run_research("ocean tides", backend, sub_query_count=4, concurrency=2)
+
+    assert backend.max_running == 2
+    assert [branch["ok"] for branch in metadata["branches"]] == [True] * 4
+    assert merged.count("## ") == 4
+
+
+@pytest.mark.anyio
+async def test_failed_and_timed_out_branches_degrade_the_answer():
+    sub_queries = decompose_query("ocean tides", 3)
+    backend = ScriptedBackend(failing=[sub_queries[0]], hanging=[sub_queries[1]])
+
+    merged, metadata = await run_research("ocean tides", backend, sub_query_count=3, branch_timeout=0.1)
+
+    failed, timed_out, ok = metadata["branches"]
+    assert (failed["ok"], failed["error"]) == (False, "search failed")
+    assert (timed_out["ok"], timed_out["error"]) == (False, "timed out after 0.1s")
+    assert ok["ok"] and "error" not in ok
+    assert f"## {sub_queries[2]}" in merged
+    assert f"## {sub_queries[0]}" not in merged
+
+
+@pytest.mark.anyio
+async def test_query_fails_only_when_every_branch_fails():
+    sub_queries = decompose_query("ocean tides", 2)
+
+    with pytest.raises(RuntimeError, match="Every research branch failed"):
+        await run_research("ocean tides", ScriptedBackend(failing=sub_queries), sub_query_count=2)
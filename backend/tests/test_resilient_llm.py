@@ -0,0 +1,150 @@
+"""
+Tests for the resilience layer around the agent models, run against FakeLlm
+"""
+import asyncio
+
+import pytest
+from google.adk.models import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from app.agents import resilient_llm
+from app.agents.fake_llm import FakeLlm, FakeModelError
+from app.agents.resilient_llm import CircuitBreaker, CircuitOpenError, ResilientLlm, open_circuit_retry_after
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilient_llm, "model_breakers", {})
+    monkeypatch.setattr(resilient_llm, "model_latencies", {})
+
+
+def request(text: str = "how do tides work") -> LlmRequest:
+    return LlmRequest(contents=[types.Content(role="user", parts=[types.Part(text=text)])])
+
+
+def wrap(inner: BaseLlm, **options) -> ResilientLlm:
+    options.setdefault("retry_base_delay", 0.0)
+    return ResilientLlm(model=inner.model, inner=inner, name="finder_agent", **options)
+
+
+async def collect(model: BaseLlm, stream: bool = False):
+    return [response async for response in model.generate_content_async(request(), stream=stream)]
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+        breaker.record_failure()
+        assert breaker.state == "closed"
+        breaker.record_failure()
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    def test_success_resets_the_failure_count(self):
+        breaker = CircuitBreaker("test", failure_threshold=2)
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        assert breaker.state == "closed"
+
+    def test_half_open_lets_one_trial_call_through(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.state == "half_open"
+
+        breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_success()
+        assert breaker.state == "closed"
+
+    def test_failed_trial_reopens_the_circuit(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.before_call()
+        breaker.reset_timeout = 30
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+
+def test_open_circuit_retry_after_counts_a_running_trial():
+    breaker = resilient_llm.get_breaker("finder_agent")
+    breaker.failure_threshold = 1
+    breaker.reset_timeout = 0
+    breaker.record_failure()
+    assert open_circuit_retry_after() == 0.0
+
+    breaker.before_call()
+    assert open_circuit_retry_after() >= 1.0
+    breaker.record_success()
+    assert open_circuit_retry_after() == 0.0
+
+
+@pytest.mark.anyio
+class TestResilientLlm:
+    async def test_retries_transient_failures(self):
+        inner = FakeLlm(role="finder_agent", failure_rate=0.5, seed=1)
+        model = wrap(inner, max_retries=5)
+
+        responses = await collect(model)
+
+        assert len(responses) == 1
+        assert inner.calls > 1
+        assert model.breaker.state == "closed"
+
+    async def test_opens_the_circuit_and_fails_fast(self):
+        inner = FakeLlm(role="finder_agent", failure_rate=1.0)
+        model = wrap(inner, max_retries=0)
+        model.breaker.failure_threshold = 2
+
+        for _ in range(2):
+            with pytest.raises(FakeModelError):
+                await collect(model)
+        with pytest.raises(CircuitOpenError):
+            await collect(model)
+        assert inner.calls == 2
+
+    async def test_deadline_is_retried(self):
+        inner = FakeLlm(role="finder_agent", slow_rate=1.0, slow_latency=1.0)
+        model = wrap(inner, deadline=0.05, max_retries=1)
+
+        with pytest.raises(resilient_llm.ModelDeadlineExceeded):
+            await collect(model)
+        assert inner.calls == 2
+
+    async def test_streams_responses_as_they_arrive(self):
+        release = asyncio.Event()
+        inner = StreamingLlm(release=release)
+        received = []
+
+        async def consume():
+            async for response in wrap(inner).generate_content_async(request(), stream=True):
+                received.append(response.content.parts[0].text)
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        assert received == ["first"]
+
+        release.set()
+        await consumer
+        assert received == ["first", "second"]
+
+
+class StreamingLlm(BaseLlm):
+    """Yields one response, then a second once released"""
+    model: str = "gemini-2.0-stream"
+    release: asyncio.Event
+
+    model_config = {"arbitrary_types_allowed": True}
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False):
+        yield text_response("first")
+        await self.release.wait()
+        yield text_response("second")
+
+
+def text_response(text: str) -> LlmResponse:
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]), partial=True)
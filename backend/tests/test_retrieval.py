@@ -0,0 +1,82 @@
+"""
+Tests for retrieval over past answers
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app.agents import knowledge_agent
+from app.agents.retrieval import PastAnswerIndex, chunk_text
+
+SOURCES = [{"title": "Tides explained", "source": "NASA", "link": "https://nasa.gov/tides", "year": "2021"}]
+
+
+def test_chunk_text_keeps_short_paragraphs_together():
+    assert chunk_text("one two\n\nthree four", max_words=10) == ["one two three four"]
+    passages = chunk_text(" ".join(str(word) for word in range(50)), max_words=20, overlap=5)
+    assert passages[0].split()[-5:] == passages[1].split()[:5]
+
+
+def test_finder_output_does_not_reveal_past_questions():
+    index = PastAnswerIndex()
+    index.add_answer("Why do tides happen twice a day near my house in Brighton?", "Tides are caused by the gravity of the moon.", SOURCES)
+
+    passages = index.retrieve("why do tides happen twice a day")
+    output = index.finder_output(passages)
+
+    assert passages
+    assert "Brighton" not in output
+    assert "Tides are caused by the gravity of the moon." in output
+    assert "Title: Tides explained | Source: NASA" in output
+
+
+@pytest.mark.anyio
+async def test_answers_are_indexed_in_the_background_and_flushed_on_close(tmp_path):
+    index = PastAnswerIndex(path=str(tmp_path), flush_interval=3600)
+    await index.start(db=None, bootstrap_limit=0)
+    index.add_answer_in_background("how do tides work", "Tides are caused by the gravity of the moon.", SOURCES)
+    await index.close()
+
+    reloaded = PastAnswerIndex(path=str(tmp_path))
+    assert reloaded.index.count == 1
+    assert reloaded.retrieve("how do tides work")[0]["sources"][0].title == "Tides explained"
+
+
+NEAR_MISSES = ["capital of France population", "What was the capital of France in 1500?"]
+
+
+@pytest.mark.parametrize("query", NEAR_MISSES)
+def test_near_miss_questions_do_not_skip_the_search(query):
+    index = PastAnswerIndex()
+    index.add_answer("What is the capital of France?", "Paris is the capital of France.", SOURCES)
+
+    passages = index.retrieve(query)
+
+    assert passages
+    assert not index.covers(passages)
+
+
+def test_skipping_the_search_is_opt_in():
+    index = PastAnswerIndex(skip_search_score=0.7)
+    index.add_answer("What is the capital of France?", "Paris is the capital of France.", SOURCES)
+
+    assert index.covers(index.retrieve("What is the capital of France?"))
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("query", NEAR_MISSES)
+async def test_finder_runs_with_past_answers_as_context(query, monkeypatch):
+    index = PastAnswerIndex()
+    index.add_answer("What is the capital of France?", "Paris is the capital of France.", SOURCES)
+    monkeypatch.setattr(knowledge_agent, "past_answers", index)
+    monkeypatch.setattr(knowledge_agent.settings, "RAG_ENABLED", True)
+    tool = SimpleNamespace(name="finder_agent")
+    tool_context = SimpleNamespace(state={"topic": query})
+    args = {"request": query}
+
+    result = await knowledge_agent._retrieval_before_tool(tool, args, tool_context)
+
+    assert result is None
+    assert "search_results" not in tool_context.state
+    assert tool_context.state["retrieval"]["skipped_search"] is False
+    assert "Paris is the capital of France." in args["request"]
@@ -0,0 +1,118 @@
+"""
+Tests of the runner pool: shared model clients, leases and the acquire timeout
+"""
+import asyncio
+
+import pytest
+
+from app.agents import knowledge_agent
+from app.agents.fake_llm import FakeLlm, build_fake_models
+from app.agents.resilient_llm import ResilientLlm
+from app.agents.runner_pool import RunnerPool, RunnerPoolTimeout, iter_llm_agents
+
+pytestmark = pytest.mark.anyio
+
+
+def make_pool(agent_factory=knowledge_agent.build_knowledge_agent, size=2, acquire_timeout=None):
+    return RunnerPool(
+        size=size,
+        agent_factory=agent_factory,
+        app_name=knowledge_agent.APP_NAME,
+        session_service=knowledge_agent.session_service,
+        acquire_timeout=acquire_timeout
+    )
+
+
+def models_by_agent(runner):
+    return {agent.name: agent.model for agent in iter_llm_agents(runner.agent)}
+
+
+def test_iter_llm_agents_includes_agent_tool_agents():
+    names = {agent.name for agent in iter_llm_agents(knowledge_agent.build_knowledge_agent())}
+
+    assert names == {"sources_agent", "finder_agent", "organizer_agent"}
+
+
+def test_runners_share_one_client_per_model_name():
+    pool = make_pool()
+
+    first = models_by_agent(pool.build_runner())
+    second = models_by_agent(pool.build_runner())
+
+    assert not isinstance(first["sources_agent"], str)
+    assert first["sources_agent"] is second["sources_agent"]
+
+
+def test_models_wrapped_in_resilient_llm_are_shared(monkeypatch):
+    monkeypatch.setattr(knowledge_agent.settings, "MODEL_RESILIENCE_ENABLED", True)
+    pool = make_pool()
+
+    first = models_by_agent(pool.build_runner())
+    second = models_by_agent(pool.build_runner())
+
+    for name in ("finder_agent", "organizer_agent"):
+        assert isinstance(first[name], ResilientLlm)
+        # Each tree keeps its own wrapper, the client behind it is shared
+        assert first[name] is not second[name]
+        assert first[name].inner is second[name].inner
+    assert first["finder_agent"].inner is first["sources_agent"]
+
+
+def test_model_instances_passed_in_are_left_alone(monkeypatch):
+    monkeypatch.setattr(knowledge_agent.settings, "MODEL_RESILIENCE_ENABLED", True)
+    pool = make_pool(lambda: knowledge_agent.build_knowledge_agent(models=build_fake_models()))
+
+    first = models_by_agent(pool.build_runner())
+    second = models_by_agent(pool.build_runner())
+
+    assert isinstance(first["finder_agent"].inner, FakeLlm)
+    assert first["finder_agent"].inner is not second["finder_agent"].inner
+    assert pool._models == {}
+
+
+async def test_lease_returns_the_runner_to_the_pool():
+    pool = make_pool(size=1)
+
+    async with pool.lease() as runner:
+        assert pool.stats()["in_use"] == 1
+    async with pool.lease() as again:
+        assert again is runner
+
+    stats = pool.stats()
+    assert stats["in_use"] == 0
+    assert stats["leases"] == 2
+
+
+async def test_lease_times_out_when_every_runner_is_in_use():
+    pool = make_pool(size=1, acquire_timeout=0.01)
+
+    async with pool.lease():
+        with pytest.raises(RunnerPoolTimeout):
+            async with pool.lease():
+                pass
+
+    assert pool.stats()["timeouts"] == 1
+
+
+async def test_waiting_lease_gets_the_released_runner():
+    pool = make_pool(size=1)
+    release = asyncio.Event()
+
+    async def hold():
+        async with pool.lease() as runner:
+            await release.wait()
+            return runner
+
+    holder = asyncio.create_task(hold())
+    await asyncio.sleep(0)
+
+    async def wait():
+        async with pool.lease() as runner:
+            return runner
+
+    waiter = asyncio.create_task(wait())
+    await asyncio.sleep(0)
+    assert pool.stats()["waiting"] == 1
+
+    release.set()
+    assert await waiter is await holder
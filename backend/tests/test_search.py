@@ -0,0 +1,119 @@
+"""
+Tests for BM25 ranking and the full-text search backends
+"""
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+import app.db.mongodb as mongodb
+from app.db import search, write_behind
+from app.db.search import INDEX_NOT_FOUND, LocalSearchIndexes, search_documents
+from app.db.write_behind import WriteBehindQueue, _refresh_history_search
+from app.utils.bm25 import BM25Index, tokenize
+from tests.fake_mongo import FakeCollection, FakeDatabase
+
+USER_ID = ObjectId()
+
+
+class NoTextIndexCollection(FakeCollection):
+    """A collection whose $text queries fail as they do without a text index"""
+
+    def __init__(self):
+        super().__init__()
+        self.aggregations = 0
+
+    def aggregate(self, pipeline):
+        self.aggregations += 1
+        raise OperationFailure("text index required for $text query", code=INDEX_NOT_FOUND)
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert tokenize("What is the Moon's pull on a tide?") == ["moon", "pull", "tide"]
+
+
+def test_bm25_ranks_weighted_and_rarer_terms_higher():
+    index = BM25Index()
+    index.add("title", [("Ocean tides", 10), ("A text about the sea.", 1)])
+    index.add("body", [("The sea", 10), ("Ocean tides rise and fall.", 1)])
+    index.add("other", [("Volcanoes", 10), ("Lava and ash.", 1)])
+
+    ranked = index.search("ocean tides")
+
+    assert [doc_id for doc_id, _ in ranked] == ["title", "body"]
+    assert index.search("tides", candidates={"body"})[0][0] == "body"
+    assert index.search("unknown words") == []
+
+
+def test_bm25_remove_and_replace():
+    index = BM25Index()
+    index.add(1, [("ocean tides", 1)])
+    index.add(2, [("ocean currents", 1)])
+
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 1
+    assert index.search("tides") == []
+    assert "tides" not in index._postings
+
+    index.add(2, [("volcanoes", 1)])
+    assert index.search("currents") == []
+    assert index.search("volcanoes")[0][0] == 2
+    assert index._total_length == 1
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    database._collections["query_history"] = NoTextIndexCollection()
+    indexes = LocalSearchIndexes(ttl=3600)
+    monkeypatch.setattr(mongodb, "mongodb_database", database)
+    monkeypatch.setattr(search, "local_search", indexes)
+    monkeypatch.setattr(write_behind, "local_search", indexes)
+    monkeypatch.setattr(search, "_text_index_missing", {})
+    monkeypatch.setattr(search.settings, "SEARCH_BACKEND", "auto")
+    return database
+
+
+def history_entry(query, domain="nasa.gov", year="2021"):
+    return {
+        "_id": ObjectId(), "user_id": USER_ID, "query": query, "response": f"An answer about {query}.",
+        "timestamp": datetime.utcnow(), "source_domains": [domain], "source_years": [year]
+    }
+
+
+@pytest.mark.anyio
+async def test_missing_text_index_falls_back_to_bm25(database):
+    history = database.query_history
+    history.documents = [history_entry("ocean tides"), history_entry("ocean currents", "noaa.gov"), history_entry("volcanoes")]
+
+    outcome = await search_documents(database, "history", USER_ID, "ocean")
+    again = await search_documents(database, "history", USER_ID, "ocean", domain="noaa.gov")
+
+    assert outcome["backend"] == "bm25"
+    assert outcome["total"] == 2
+    assert {facet["value"] for facet in outcome["facets"]["domain"]} == {"nasa.gov", "noaa.gov"}
+    assert [result["query"] for result in again["results"]] == ["ocean currents"]
+    # The missing index is remembered, so the second search skips $text
+    assert history.aggregations == 1
+
+
+@pytest.mark.anyio
+async def test_text_backend_does_not_fall_back(database, monkeypatch):
+    monkeypatch.setattr(search.settings, "SEARCH_BACKEND", "text")
+
+    with pytest.raises(OperationFailure):
+        await search_documents(database, "history", USER_ID, "ocean")
+
+
+@pytest.mark.anyio
+async def test_flushed_history_entries_are_searchable_at_once(database):
+    database.query_history.documents = [history_entry("ocean tides")]
+    assert (await search_documents(database, "history", USER_ID, "volcanoes"))["total"] == 0
+
+    queue = WriteBehindQueue("query_history", flush_interval=0.01, retry_backoff=0, on_flush=_refresh_history_search)
+    await queue.enqueue(history_entry("volcanoes"))
+    await queue.close()
+
+    assert (await search_documents(database, "history", USER_ID, "volcanoes"))["total"] == 1
@@ -0,0 +1,89 @@
+"""
+Tests for single-flight coalescing
+"""
+import asyncio
+
+import pytest
+
+from app.utils.single_flight import SingleFlight, SingleFlightTimeout
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"answer": 42}
+
+    results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+
+    assert calls == 1
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert all(result == {"answer": 42} for result, _ in results)
+    assert flight.stats()["coalesced"] == 4
+
+
+async def test_shared_results_are_copies():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        return {"tags": []}
+
+    (first, _), (second, _) = await asyncio.gather(flight.do("key", work), flight.do("key", work))
+    second["tags"].append("changed")
+
+    assert first == {"tags": []}
+
+
+async def test_key_is_released_after_the_work_finishes():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    await flight.do("key", work)
+    result, shared = await flight.do("key", work)
+
+    assert (result, shared, calls) == (2, False, 2)
+    assert not flight.in_flight("key")
+
+
+async def test_errors_reach_every_waiter():
+    flight = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise ValueError("failed")
+
+    results = await asyncio.gather(flight.do("key", work), flight.do("key", work), return_exceptions=True)
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.stats()["failures"] == 1
+
+
+async def test_timed_out_waiter_does_not_cancel_the_work():
+    flight = SingleFlight()
+    finished = asyncio.Event()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        finished.set()
+        return "done"
+
+    with pytest.raises(SingleFlightTimeout):
+        await flight.do("key", work, timeout=0.01)
+    assert await flight.wait("key") == "done"
+    assert finished.is_set()
+
+
+async def test_wait_returns_none_when_nothing_is_in_flight():
+    assert await SingleFlight().wait("key") is None
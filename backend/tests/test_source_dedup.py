@@ -0,0 +1,89 @@
+"""
+Tests for source de-duplication and the Source type
+"""
+import copy
+import json
+
+from app.api.models.content import SaveSearchResultRequest
+from app.utils.source_dedup import SourceIndex
+from app.utils.sources import Source, source_domain, sources_from
+
+
+def test_same_url_is_a_duplicate_whatever_its_case():
+    index = SourceIndex()
+    assert index.add_if_new("https://www.nature.com/articles/1", "Ocean tides and the moon")
+    assert not index.add_if_new("HTTPS://WWW.NATURE.COM/articles/1 ", "Something else entirely")
+
+
+def test_similar_titles_are_duplicates():
+    index = SourceIndex(title_similarity=0.8)
+    assert index.add_if_new("https://a.example/1", "How the moon drives ocean tides")
+    assert not index.add_if_new("https://b.example/2", "How the moon drives the ocean tides")
+    assert index.add_if_new("https://c.example/3", "Volcanic eruptions in Iceland")
+
+
+def test_exact_titles_only_without_a_similarity_threshold():
+    index = SourceIndex(title_similarity=None)
+    assert index.add_if_new("https://a.example/1", "How the moon drives ocean tides")
+    assert index.add_if_new("https://b.example/2", "How the moon drives the ocean tides")
+    assert not index.add_if_new("https://c.example/3", "how the moon drives ocean tides ")
+
+
+def test_short_titles_are_not_compared():
+    index = SourceIndex()
+    assert index.add_if_new("https://a.example/1", "Tides")
+    assert index.add_if_new("https://b.example/2", "Tides")
+    assert len(index) == 2
+
+
+def test_add_source_if_new_matches_add_if_new():
+    index = SourceIndex()
+    assert index.add_source_if_new(Source("How the moon drives ocean tides", "NASA", "https://www.nasa.gov/tides", "2021"))
+    assert index.is_duplicate("https://WWW.NASA.GOV/tides")
+    assert not index.is_duplicate("https://www.nasa.gov/waves")
+    assert not index.add_source_if_new(Source("Other", "NASA", "https://www.nasa.gov/TIDES", "2021"))
+
+
+def test_source_behaves_like_a_dict():
+    source = Source("Tides", "NASA", "https://www.nasa.gov/tides", 2021)
+
+    assert source == {"title": "Tides", "source": "NASA", "link": "https://www.nasa.gov/tides", "year": "2021"}
+    assert dict(source) == source.to_dict()
+    assert source.domain == "nasa.gov"
+    assert source.reference_line() == "Title: Tides | Source: NASA | Link: https://www.nasa.gov/tides | Year: 2021"
+
+
+def test_sources_from_reuses_sources_and_skips_non_mappings():
+    source = Source("Tides", "NASA", "https://www.nasa.gov/tides", "2021")
+    sources = sources_from([source, {"title": "Waves", "link": "https://noaa.gov/waves"}, "not a source", None])
+
+    assert sources[0] is source
+    assert sources[1] == {"title": "Waves", "source": "", "link": "https://noaa.gov/waves", "year": ""}
+    assert len(sources) == 2
+
+
+def test_source_domain():
+    assert source_domain("https://www.BBC.com/news/1") == "bbc.com"
+    assert source_domain("nature.com/articles") == "nature.com"
+    assert source_domain(None) == ""
+
+
+def test_unknown_source_keys_are_kept():
+    data = {"title": "Tides", "link": "https://www.nasa.gov/tides", "doi": "10.1000/1", "authors": ["A. Author"]}
+    source = Source.from_mapping(data)
+
+    assert source.extra == {"doi": "10.1000/1", "authors": ["A. Author"]}
+    assert source["doi"] == "10.1000/1"
+    assert list(source) == ["title", "source", "link", "year", "doi", "authors"]
+    assert source.to_dict() == {**data, "source": "", "year": ""}
+    assert copy.deepcopy(source) == source
+
+
+def test_unknown_source_keys_survive_the_api_models():
+    request = SaveSearchResultRequest.model_validate({
+        "title": "Tides", "snippet": "", "content": "",
+        "sources": [{"title": "Tides", "source": "NASA", "link": "https://www.nasa.gov/tides", "year": "2021", "doi": "10.1000/1"}]
+    })
+
+    assert json.loads(request.model_dump_json())["sources"][0]["doi"] == "10.1000/1"
+    assert request.model_dump()["sources"][0]["doi"] == "10.1000/1"
@@ -0,0 +1,116 @@
+"""
+Tests for bulk export and import of saved results and query history
+"""
+import gzip
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.db.transfer import ImportRejected, export_documents, import_documents
+from tests.fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+ALICE = "alice-id"
+BOB = "bob-id"
+
+
+def saved_result(index: int, user_id: str = ALICE) -> dict:
+    return {
+        "_id": ObjectId(),
+        "user_id": user_id,
+        "title": f"Result {index}",
+        "snippet": "snippet",
+        "content": f"Content {index} with accents: é",
+        "sources": [{"title": "Tides", "source": "NASA", "link": "https://www.nasa.gov/tides", "year": "2021"}],
+        "saved_at": datetime(2024, 1, 1, 12, 0, index)
+    }
+
+
+async def export_body(db, compress: bool = False, user_id: str = ALICE) -> bytes:
+    return b"".join([chunk async for chunk in export_documents(db, "saved", user_id, batch_size=2, compress=compress)])
+
+
+async def chunks(body: bytes, size: int = 7):
+    for start in range(0, len(body), size):
+        yield body[start:start + size]
+
+
+@pytest.fixture
+def db():
+    database = FakeDatabase()
+    database.saved_search_results.documents.extend(saved_result(index) for index in range(5))
+    database.saved_search_results.documents.append(saved_result(9, user_id=BOB))
+    return database
+
+
+@pytest.mark.parametrize("compress", [False, True])
+async def test_round_trip_into_another_user(db, compress):
+    body = await export_body(db, compress=compress)
+
+    summary = await import_documents(db, "saved", BOB, chunks(body), compressed=compress, batch_size=2)
+
+    assert summary == {"inserted": 5, "duplicates": 0, "invalid": 0, "failed": 0, "stopped": False, "errors": []}
+    bob = sorted(
+        (document for document in db.saved_search_results.documents if document["user_id"] == BOB and document["title"] != "Result 9"),
+        key=lambda document: document["saved_at"]
+    )
+    alice = [document for document in db.saved_search_results.documents if document["user_id"] == ALICE]
+    assert [document["title"] for document in bob] == [document["title"] for document in alice]
+    assert bob[0]["content"] == alice[0]["content"]
+    assert bob[0]["saved_at"] == alice[0]["saved_at"]
+    assert bob[0]["sources"][0]["link"] == "https://www.nasa.gov/tides"
+    assert bob[0]["source_domains"] == ["nasa.gov"]
+    assert bob[0]["_id"] != alice[0]["_id"]
+
+
+async def test_export_is_oldest_first_and_only_for_the_user(db):
+    lines = (await export_body(db)).decode("utf-8").splitlines()
+
+    assert len(lines) == 5
+    assert '"Result 0"' in lines[0] and '"Result 4"' in lines[-1]
+    assert "user_id" not in lines[0]
+
+
+async def test_keep_ids_skips_documents_already_imported(db):
+    body = await export_body(db)
+
+    summary = await import_documents(db, "saved", ALICE, chunks(body), keep_ids=True)
+
+    assert summary["inserted"] == 0
+    assert summary["duplicates"] == 5
+
+
+async def test_concatenated_gzip_members_are_all_imported(db):
+    body = gzip.compress(await export_body(db)) + gzip.compress(await export_body(db, user_id=BOB))
+
+    summary = await import_documents(FakeDatabase(), "saved", ALICE, chunks(body), compressed=True)
+
+    assert summary["inserted"] == 6
+
+
+async def test_truncated_gzip_is_rejected(db):
+    body = gzip.compress(await export_body(db))
+
+    with pytest.raises(ImportRejected, match="truncated"):
+        await import_documents(FakeDatabase(), "saved", ALICE, chunks(body[:-10]), compressed=True)
+
+
+async def test_invalid_lines_are_skipped_unless_ordered():
+    body = b'{"title": "Kept", "content": "text"}\nnot json\n{"title": "", "content": "text"}\n{"title": "After", "content": "text"}\n'
+
+    unordered = await import_documents(FakeDatabase(), "saved", ALICE, chunks(body))
+    ordered = await import_documents(FakeDatabase(), "saved", ALICE, chunks(body), ordered=True)
+
+    assert (unordered["inserted"], unordered["invalid"], unordered["stopped"]) == (2, 2, False)
+    assert [error["line"] for error in unordered["errors"]] == [2, 3]
+    assert (ordered["inserted"], ordered["invalid"], ordered["stopped"]) == (1, 1, True)
+
+
+async def test_document_limit(db):
+    body = await export_body(db)
+
+    with pytest.raises(ImportRejected) as rejected:
+        await import_documents(FakeDatabase(), "saved", ALICE, chunks(body), max_documents=3)
+    assert rejected.value.status_code == 413
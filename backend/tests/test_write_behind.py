@@ -0,0 +1,84 @@
+"""
+Tests for the write-behind insert queue
+"""
+import pytest
+from pymongo.errors import AutoReconnect, OperationFailure
+
+import app.db.mongodb as mongodb
+from app.db.write_behind import WriteBehindQueue
+from tests.fake_mongo import FakeDatabase
+
+pytestmark = pytest.mark.anyio
+
+
+class FlakyCollection:
+    """Fails the first insert_many after writing the first `partial` documents"""
+
+    def __init__(self, collection, error, partial=0):
+        self.collection = collection
+        self.error = error
+        self.partial = partial
+        self.calls = 0
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        if self.calls == 1:
+            if self.partial:
+                await self.collection.insert_many(documents[:self.partial], ordered=ordered)
+            raise self.error
+        return await self.collection.insert_many(documents, ordered=ordered)
+
+
+@pytest.fixture
+def database(monkeypatch):
+    database = FakeDatabase()
+    monkeypatch.setattr(mongodb, "mongodb_database", database)
+    return database
+
+
+def make_queue():
+    return WriteBehindQueue("history", batch_size=10, flush_interval=0.01, retry_backoff=0)
+
+
+async def write(queue, documents):
+    for document in documents:
+        await queue.enqueue(document)
+    await queue.close()
+    return queue.stats()
+
+
+async def test_batches_are_written(database):
+    stats = await write(make_queue(), [{"n": index} for index in range(5)])
+
+    assert len(database.history.documents) == 5
+    assert (stats["flushed"], stats["dropped"]) == (5, 0)
+
+
+async def test_rejected_documents_are_dropped_alone(database):
+    database.history.documents.append({"_id": "taken"})
+
+    stats = await write(make_queue(), [{"n": 1}, {"_id": "taken"}, {"n": 2}])
+
+    assert (stats["flushed"], stats["dropped"], stats["failed_batches"]) == (2, 1, 1)
+    assert len(database.history.documents) == 3
+
+
+async def test_transient_error_is_retried_once(database, monkeypatch):
+    flaky = FlakyCollection(database.history, AutoReconnect("connection reset"), partial=2)
+    monkeypatch.setattr(database, "_collections", {"history": flaky})
+
+    stats = await write(make_queue(), [{"n": index} for index in range(4)])
+
+    assert flaky.calls == 2
+    assert len(flaky.collection.documents) == 4
+    assert (stats["flushed"], stats["dropped"], stats["retried_batches"]) == (4, 0, 1)
+
+
+async def test_other_errors_drop_the_batch_without_a_retry(database, monkeypatch):
+    flaky = FlakyCollection(database.history, OperationFailure("not authorized", code=13))
+    monkeypatch.setattr(database, "_collections", {"history": flaky})
+
+    stats = await write(make_queue(), [{"n": index} for index in range(3)])
+
+    assert flaky.calls == 1
+    assert (stats["flushed"], stats["dropped"], stats["retried_batches"]) == (0, 3, 0)